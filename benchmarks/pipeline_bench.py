@@ -0,0 +1,240 @@
+"""Benchmark of the video pipeline against synthetic or recorded sources.
+
+Stages, each run for 1..N simulated cameras at a time:
+  track    VideoStreamTrack.recv - reader thread, enhancement, VideoFrame conversion
+  manager  StreamManager.generate_frames - reader thread, detection (optional), drawing
+  mjpeg    StreamManager frames encoded to multipart JPEG by encode_frames
+
+Latency is measured per frame from the moment the capture returned it to the
+moment the stage handed it on. CPU% covers every thread of the process
+(100 = one core), so each stage is run on its own.
+
+Examples:
+  python benchmarks/pipeline_bench.py --cameras 1,2,4,8 --output bench.json
+  python benchmarks/pipeline_bench.py --source clip.mp4 --realtime --stages track
+  python benchmarks/pipeline_bench.py --source rtsp://127.0.0.1:8554/cam --stages track,mjpeg
+  python benchmarks/pipeline_bench.py --compare bench.json --output new.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import sys
+import time
+from collections import deque
+
+from sources import Camera, ResourceMonitor, SYNTHETIC, environment, latency_summary
+
+from vrae.webrtc_stream import VideoStreamTrack
+from vrae.stream import StreamManager, encode_frames
+
+STAGES = ('track', 'manager', 'mjpeg')
+
+
+class StageRun:
+    """Frames and latencies collected by every camera of one stage run."""
+
+    def __init__(self):
+        self.frames = 0
+        self.latencies = []
+        self.errors = []
+
+    def record(self, now, captured_at):
+        self.frames += 1
+        if captured_at is not None:
+            self.latencies.append(now - captured_at)
+
+
+async def run_track(camera, args, run, warmup_end, deadline):
+    track = VideoStreamTrack(device_id=f"bench-{camera.seed}", profile=args.profile)
+    track.capture_factory = camera.factory
+    device = {'rtsp_url': camera.source, 'settings': {'enhancement': args.enhancement or {}}}
+    try:
+        await track.connect_to_camera(device)
+        while time.perf_counter() < deadline:
+            await track.recv()
+            now = time.perf_counter()
+            if now >= warmup_end:
+                run.record(now, camera.capture.captured_at(seq=track._last_seq))
+    finally:
+        track.stop()
+
+
+async def run_manager(camera, args, run, warmup_end, deadline, encode=False):
+    manager = StreamManager(
+        settings={'detection': {'enabled': args.detection}},
+        source=camera.source
+    )
+    manager.capture_factory = camera.factory
+    frames = manager.generate_frames()
+    captured = deque()
+
+    async def tagged():
+        # Identity lookup must happen while the frame is alive, before encoding
+        async for frame in frames:
+            captured.append(camera.capture.captured_at(frame=frame))
+            yield frame
+
+    stream = encode_frames(tagged(), args.jpeg_width, args.jpeg_quality) if encode else tagged()
+    try:
+        async for _ in stream:
+            now = time.perf_counter()
+            captured_at = captured.popleft() if captured else None
+            if now >= deadline:
+                break
+            if now >= warmup_end:
+                run.record(now, captured_at)
+        else:
+            raise RuntimeError(f"Stream for camera {camera.seed} ended early")
+    finally:
+        manager.stop_stream()
+        await stream.aclose()
+        await frames.aclose()
+
+
+WORKERS = {
+    'track': run_track,
+    'manager': run_manager,
+    'mjpeg': lambda *a: run_manager(*a, encode=True)
+}
+
+
+async def run_stage(stage, count, args):
+    cameras = [
+        Camera(args.source, args.width, args.height, args.fps, args.realtime, seed=i)
+        for i in range(count)
+    ]
+    run = StageRun()
+    monitor = ResourceMonitor()
+    warmup_end = time.perf_counter() + args.warmup
+    deadline = warmup_end + args.duration
+
+    tasks = [
+        asyncio.create_task(WORKERS[stage](camera, args, run, warmup_end, deadline))
+        for camera in cameras
+    ]
+    await asyncio.sleep(max(0.0, warmup_end - time.perf_counter()))
+    monitor.start()
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    resources = monitor.stop()
+    run.errors.extend(repr(o) for o in outcomes if isinstance(o, BaseException))
+
+    fps = run.frames / args.duration
+    return {
+        'stage': stage,
+        'cameras': count,
+        'duration': args.duration,
+        'frames': run.frames,
+        'fps': round(fps, 2),
+        'fps_per_camera': round(fps / count, 2),
+        'latency_ms': latency_summary(run.latencies),
+        **resources,
+        'errors': run.errors[:10]
+    }
+
+
+def print_result(result):
+    latency = result['latency_ms']
+    print(
+        f"{result['stage']:>8} x{result['cameras']:<3} "
+        f"{result['fps']:>8.1f} fps ({result['fps_per_camera']:.1f}/cam)  "
+        f"p50 {latency['p50']} ms  p99 {latency['p99']} ms  "
+        f"cpu {result['cpu_percent']}%  rss {result['rss_mb']} MB"
+        + (f"  errors: {len(result['errors'])}" if result['errors'] else '')
+    )
+
+
+def compare(results, baseline_path, threshold):
+    """Print changes against a previous run; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {(r['stage'], r['cameras']): r for r in json.load(f)['results']}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        old = baseline.get((result['stage'], result['cameras']))
+        if not old:
+            continue
+        notes = []
+        if old['fps']:
+            change = (result['fps'] - old['fps']) / old['fps']
+            notes.append(f"fps {change:+.1%}")
+            if change < -threshold:
+                notes.append('REGRESSION')
+                regressions += 1
+        old_p99, new_p99 = old['latency_ms']['p99'], result['latency_ms']['p99']
+        if old_p99 and new_p99:
+            change = (new_p99 - old_p99) / old_p99
+            notes.append(f"p99 {change:+.1%}")
+            if change > threshold:
+                notes.append('REGRESSION')
+                regressions += 1
+        print(f"{result['stage']:>8} x{result['cameras']:<3} " + '  '.join(notes))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=SYNTHETIC,
+                        help="'synthetic', a video file (looped) or an RTSP URL")
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma separated: ' + ', '.join(STAGES))
+    parser.add_argument('--cameras', default='1,2,4', help='comma separated camera counts')
+    parser.add_argument('--duration', type=float, default=15.0, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=3.0, help='unmeasured seconds per run')
+    parser.add_argument('--width', type=int, default=1920, help='synthetic frame width')
+    parser.add_argument('--height', type=int, default=1080, help='synthetic frame height')
+    parser.add_argument('--fps', type=float, default=30.0, help='source frame rate, 0 = unpaced')
+    parser.add_argument('--realtime', action='store_true', help='pace file sources at --fps')
+    parser.add_argument('--profile', default='high', help='VideoStreamTrack profile')
+    parser.add_argument('--enhancement', type=json.loads, default=None,
+                        help='enhancement settings as JSON, defaults to the pipeline defaults')
+    parser.add_argument('--detection', action='store_true', help='run YOLO in the manager stages')
+    parser.add_argument('--jpeg-width', type=int, default=None)
+    parser.add_argument('--jpeg-quality', type=int, default=85)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as a regression')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args(argv)
+
+    args.stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    args.cameras = [int(count) for count in args.cameras.split(',')]
+    return args
+
+
+async def main(args):
+    results = []
+    for stage in args.stages:
+        for count in args.cameras:
+            result = await run_stage(stage, count, args)
+            print_result(result)
+            results.append(result)
+            # Let reader threads from this run exit before the next one
+            gc.collect()
+            await asyncio.sleep(1.0)
+    return results
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+    results = asyncio.run(main(args))
+
+    if args.output:
+        report = {
+            'environment': environment(),
+            'config': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'compare', 'log_level')},
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
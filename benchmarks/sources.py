@@ -0,0 +1,251 @@
+"""Frame sources and measurement helpers shared by the benchmarks.
+
+Captures here stand in for ``cv2.VideoCapture`` through the
+``capture_factory`` hook of ``FrameReader``, ``VideoStreamTrack`` and
+``StreamManager``, so the real reader threads and pipelines are exercised
+without a camera or the database.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+try:
+    import psutil
+except ImportError:  # optional, /proc is used instead
+    psutil = None
+
+SYNTHETIC = 'synthetic'
+TIMESTAMP_HISTORY = 512
+
+
+class SyntheticCapture:
+    """VideoCapture look-alike producing a scrolling noise image at ``fps``.
+
+    Each frame is a fresh array, like a decoder would return, and the image
+    moves so motion detection sees activity. ``fps=0`` reads unpaced.
+    """
+
+    def __init__(self, width=1920, height=1080, fps=30, seed=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._base = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+        self._shift = 0
+        self._next = None
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps
+        }.get(prop, 0)
+
+    def read(self):
+        if self.fps:
+            now = time.perf_counter()
+            self._next = now if self._next is None else self._next
+            if self._next > now:
+                time.sleep(self._next - now)
+            self._next += 1.0 / self.fps
+        self._shift = (self._shift + 8) % self.width
+        return True, np.roll(self._base, self._shift, axis=1)
+
+    def release(self):
+        pass
+
+
+class TimedCapture:
+    """Wraps a capture and remembers when each frame left ``read()``.
+
+    Frames are looked up by reader sequence number (``FrameReader`` counts
+    one per successful read) or by object identity, which survives
+    ``StreamManager`` since boxes are drawn in place. Files are rewound at the
+    end so a short clip can feed a long run, optionally paced at ``fps``.
+    """
+
+    def __init__(self, inner, loop=False, fps=0):
+        self.inner = inner
+        self.loop = loop
+        self.fps = fps
+        self.count = 0
+        self._times = {}
+        self._ids = {}
+        self._order = deque()
+        self._next = None
+        self._lock = threading.Lock()
+
+    def isOpened(self):
+        return self.inner.isOpened()
+
+    def set(self, prop, value):
+        return self.inner.set(prop, value)
+
+    def get(self, prop):
+        return self.inner.get(prop)
+
+    def release(self):
+        self.inner.release()
+
+    def read(self):
+        if self.fps:
+            now = time.perf_counter()
+            self._next = now if self._next is None else self._next
+            if self._next > now:
+                time.sleep(self._next - now)
+            self._next += 1.0 / self.fps
+
+        ret, frame = self.inner.read()
+        if not ret and self.loop:
+            self.inner.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.inner.read()
+        if ret and frame is not None:
+            now = time.perf_counter()
+            with self._lock:
+                self.count += 1
+                self._times[self.count] = now
+                self._ids[id(frame)] = now
+                self._order.append((self.count, id(frame), now))
+                while len(self._order) > TIMESTAMP_HISTORY:
+                    seq, key, stamp = self._order.popleft()
+                    self._times.pop(seq, None)
+                    # Ids are reused once frames are freed, keep newer entries
+                    if self._ids.get(key) == stamp:
+                        del self._ids[key]
+        return ret, frame
+
+    def captured_at(self, seq=None, frame=None):
+        with self._lock:
+            if seq is not None:
+                return self._times.get(seq)
+            return self._ids.get(id(frame))
+
+
+class Camera:
+    """One simulated camera: builds its capture when the reader opens it."""
+
+    def __init__(self, source, width, height, fps, realtime=False, seed=0):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.realtime = realtime
+        self.seed = seed
+        self.capture = None
+
+    def factory(self, source, api_preference=cv2.CAP_ANY, params=None):
+        if source == SYNTHETIC:
+            inner = SyntheticCapture(self.width, self.height, self.fps, seed=self.seed)
+            self.capture = TimedCapture(inner)
+        else:
+            inner = cv2.VideoCapture(source, api_preference, params or [])
+            is_file = os.path.exists(source)
+            pace = (self.fps or inner.get(cv2.CAP_PROP_FPS) or 30) if (is_file and self.realtime) else 0
+            self.capture = TimedCapture(inner, loop=is_file, fps=pace)
+        return self.capture
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_summary(seconds):
+    """p50/p99/mean in milliseconds for a list of latencies in seconds."""
+    if not seconds:
+        return {'p50': None, 'p99': None, 'mean': None, 'samples': 0}
+    return {
+        'p50': round(percentile(seconds, 50) * 1000, 3),
+        'p99': round(percentile(seconds, 99) * 1000, 3),
+        'mean': round(sum(seconds) / len(seconds) * 1000, 3),
+        'samples': len(seconds)
+    }
+
+
+def rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class ResourceMonitor:
+    """Process CPU% (all threads, 100 = one core) and RSS over a measured window."""
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        self.start_rss = rss_bytes()
+        self.peak_rss = self.start_rss
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name='bench-rss', daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        end_rss = rss_bytes()
+        self.peak_rss = max(self.peak_rss, end_rss)
+        return {
+            'cpu_percent': round(cpu / wall * 100, 1) if wall > 0 else None,
+            'rss_mb': round(end_rss / 2 ** 20, 1),
+            'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1),
+            'rss_growth_mb': round((end_rss - self.start_rss) / 2 ** 20, 1)
+        }
+
+
+def environment():
+    """What a result was measured on, so runs can be compared across commits."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'platform': sys.platform,
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
@@ -0,0 +1,318 @@
+"""Load test of WebRTC signalling and delivery with many concurrent peers.
+
+The app runs in-process behind Quart's test client: /offer is called with a
+real token, the device cache is primed with synthetic cameras, and every
+capture is a SyntheticCapture, so no database, camera or network beyond
+loopback is needed. Client peers are aiortc RTCPeerConnections that receive
+the video and count frames.
+
+Peers are added in steps. After each step the run settles, then measures:
+offer/answer latency and time to first frame of the new peers, delivered
+FPS per peer, event-loop lag, CPU% and RSS. The ramp stops at the first step
+where throughput collapses, and the report says why.
+
+Client peers decode in the same process, so CPU% and RSS include their cost
+as well as the server's. Compare against a run with fewer devices to see
+what is per-peer encoding and what is per-camera capture.
+
+Example:
+  python benchmarks/webrtc_load.py --devices 4 --step 25 --max-peers 400 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from types import SimpleNamespace
+
+# Loopback only: a public STUN server would only slow down ICE gathering
+os.environ.setdefault('ICE_SERVERS', '')
+# Primed synthetic devices must outlive the whole ramp, there is no DB to reload them
+os.environ.setdefault('DEVICE_CACHE_TTL', str(7 * 24 * 3600))
+
+from sources import ResourceMonitor, SYNTHETIC, SyntheticCapture, TimedCapture, environment, latency_summary, percentile
+
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError
+
+from vrae import app
+from vrae.auth import token_verifier
+from vrae.capture_hub import CaptureHub
+from vrae.models import Device
+from vrae.webrtc_stream import VideoStreamTrack
+
+LAG_INTERVAL = 0.05
+
+
+class SyntheticCameras:
+    """Capture factory handed to every server-side VideoStreamTrack."""
+
+    def __init__(self, width, height, fps):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.opened = 0
+
+    def __call__(self, source, api_preference=None, params=None):
+        self.opened += 1
+        return TimedCapture(SyntheticCapture(self.width, self.height, self.fps, seed=self.opened))
+
+
+class Peer:
+    """One client viewer: negotiates through /offer and counts received frames."""
+
+    def __init__(self, index, device_id):
+        self.index = index
+        self.device_id = device_id
+        self.pc = None
+        self.offer_latency = None
+        self.first_frame = None
+        self.frames = 0
+        self.error = None
+        self._started = None
+        self._receiver = None
+        self._first = asyncio.Event()
+
+    async def connect(self, client, token, profile):
+        self.pc = RTCPeerConnection()
+        self.pc.addTransceiver('video', direction='recvonly')
+
+        @self.pc.on('track')
+        def on_track(track):
+            self._receiver = asyncio.create_task(self._receive(track))
+
+        self._started = time.perf_counter()
+        await self.pc.setLocalDescription(await self.pc.createOffer())
+
+        posted = time.perf_counter()
+        response = await client.post('/offer', json={
+            'device_id': self.device_id,
+            'sdp': self.pc.localDescription.sdp,
+            'type': self.pc.localDescription.type,
+            'profile': profile,
+            'auto_quality': False
+        }, headers={'Authorization': f'Bearer {token}'})
+        self.offer_latency = time.perf_counter() - posted
+        if response.status_code != 200:
+            raise RuntimeError(f"/offer returned {response.status_code}: {await response.get_data(as_text=True)}")
+
+        answer = await response.get_json()
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp=answer['sdp'], type=answer['type']))
+
+    async def _receive(self, track):
+        try:
+            while True:
+                await track.recv()
+                if self.first_frame is None:
+                    self.first_frame = time.perf_counter() - self._started
+                    self._first.set()
+                self.frames += 1
+        except MediaStreamError:
+            pass
+
+    async def wait_first_frame(self, timeout):
+        await asyncio.wait_for(self._first.wait(), timeout)
+
+    @property
+    def state(self):
+        return self.pc.connectionState if self.pc else 'new'
+
+    async def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+        if self.pc is not None:
+            await self.pc.close()
+
+
+class LoopLag:
+    """Measures how late the event loop wakes a sleeper, a direct saturation signal."""
+
+    def __init__(self):
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.samples.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+    def take(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def collapse_reasons(step, args, cpu_capacity):
+    """Why this step counts as collapsed; empty while throughput holds."""
+    reasons = []
+    target = args.fps * args.collapse_ratio
+    if step['fps_per_peer']['p50'] is not None and step['fps_per_peer']['p50'] < target:
+        reasons.append(f"median delivered fps {step['fps_per_peer']['p50']} < {target:.1f}")
+    attempted = step['new_peers']
+    if attempted and step['failed'] / attempted > args.max_failures:
+        reasons.append(f"{step['failed']}/{attempted} new peers failed ({', '.join(step['failures'][:3])})")
+    if step['loop_lag_ms']['p99'] is not None and step['loop_lag_ms']['p99'] > args.max_lag_ms:
+        reasons.append(f"event loop lag p99 {step['loop_lag_ms']['p99']} ms > {args.max_lag_ms} ms")
+    if reasons and step['cpu_percent'] is not None and step['cpu_percent'] >= 0.9 * cpu_capacity:
+        reasons.append(f"CPU saturated ({step['cpu_percent']}% of {cpu_capacity}%)")
+    return reasons
+
+
+async def add_peers(peers, count, client, token, args, next_index):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    new = [Peer(next_index + i, (next_index + i) % args.devices + 1) for i in range(count)]
+
+    async def start(peer):
+        async with semaphore:
+            try:
+                await peer.connect(client, token, args.profile)
+                await peer.wait_first_frame(args.ttff_timeout)
+            except asyncio.TimeoutError:
+                peer.error = f"no frame within {args.ttff_timeout}s (state {peer.state})"
+            except Exception as e:
+                peer.error = f"{type(e).__name__}: {e}"
+
+    await asyncio.gather(*(start(peer) for peer in new))
+    peers.extend(new)
+    return new
+
+
+async def run(args):
+    VideoStreamTrack.capture_factory = staticmethod(SyntheticCameras(args.width, args.height, args.fps))
+    for device_id in range(1, args.devices + 1):
+        Device.cache_device({
+            'id': device_id,
+            'name': f"synthetic-{device_id}",
+            'rtsp_url': SYNTHETIC,
+            'settings': {'enhancement': args.enhancement} if args.enhancement is not None else {},
+            'profiles': {}
+        })
+    token = token_verifier.issue(SimpleNamespace(id=0, username='loadtest'))
+
+    client = app.test_client()
+    peers, steps = [], []
+    lag = LoopLag()
+    lag.start()
+    cpu_capacity = (os.cpu_count() or 1) * 100
+    baseline_rss = None
+
+    try:
+        while len(peers) < args.max_peers:
+            count = min(args.step, args.max_peers - len(peers))
+            monitor = ResourceMonitor()
+            monitor.start()
+            if baseline_rss is None:
+                baseline_rss = monitor.start_rss
+
+            new = await add_peers(peers, count, client, token, args, len(peers))
+            await asyncio.sleep(args.settle)
+
+            live = [peer for peer in peers if peer.error is None and peer.state == 'connected']
+            before = {peer.index: peer.frames for peer in live}
+            lag.take()
+            await asyncio.sleep(args.window)
+            fps = [(peer.frames - before[peer.index]) / args.window for peer in live]
+            lag_samples = lag.take()
+            resources = monitor.stop()
+
+            failures = [peer.error for peer in new if peer.error]
+            step = {
+                'peers': len(peers),
+                'connected': len(live),
+                'new_peers': len(new),
+                'failed': len(failures),
+                'failures': failures[:10],
+                'offer_ms': latency_summary([p.offer_latency for p in new if p.offer_latency is not None]),
+                'ttff_ms': latency_summary([p.first_frame for p in new if p.first_frame is not None]),
+                'fps_per_peer': {
+                    'p50': round(percentile(fps, 50), 2) if fps else None,
+                    'min': round(min(fps), 2) if fps else None
+                },
+                'delivered_fps': round(sum(fps), 1),
+                'loop_lag_ms': latency_summary(lag_samples),
+                'server_peers': len(app.pc_pool),
+                **resources,
+                'rss_per_peer_mb': round((resources['rss_mb'] - baseline_rss / 2 ** 20) / len(peers), 2)
+            }
+            step['collapse'] = collapse_reasons(step, args, cpu_capacity)
+            steps.append(step)
+            print_step(step)
+
+            if step['collapse']:
+                print(f"Throughput collapsed at {len(peers)} peers: {'; '.join(step['collapse'])}")
+                break
+    finally:
+        await lag.stop()
+        await asyncio.gather(*(peer.close() for peer in peers), return_exceptions=True)
+        await asyncio.gather(*(pc.close() for pc in list(app.pc_pool)), return_exceptions=True)
+        await CaptureHub.close_all()
+
+    collapsed = next((step for step in steps if step['collapse']), None)
+    return {
+        'steps': steps,
+        'collapse': {
+            'peers': collapsed['peers'],
+            'last_healthy_peers': steps[-2]['peers'] if len(steps) > 1 else 0,
+            'reasons': collapsed['collapse']
+        } if collapsed else None
+    }
+
+
+def print_step(step):
+    print(
+        f"{step['peers']:>5} peers ({step['connected']} live, {step['failed']} failed)  "
+        f"offer p50 {step['offer_ms']['p50']} ms  ttff p50 {step['ttff_ms']['p50']} ms  "
+        f"fps/peer p50 {step['fps_per_peer']['p50']}  lag p99 {step['loop_lag_ms']['p99']} ms  "
+        f"cpu {step['cpu_percent']}%  rss {step['rss_mb']} MB ({step['rss_per_peer_mb']} MB/peer)"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=4, help='synthetic cameras peers are spread over')
+    parser.add_argument('--step', type=int, default=25, help='peers added per step')
+    parser.add_argument('--max-peers', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=10, help='offers in flight at once')
+    parser.add_argument('--settle', type=float, default=5.0, help='seconds after a step before measuring')
+    parser.add_argument('--window', type=float, default=10.0, help='measured seconds per step')
+    parser.add_argument('--ttff-timeout', type=float, default=20.0)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=float, default=15.0)
+    parser.add_argument('--profile', default='high')
+    parser.add_argument('--enhancement', type=json.loads, default=None,
+                        help='enhancement settings as JSON, defaults to the pipeline defaults')
+    parser.add_argument('--collapse-ratio', type=float, default=0.8,
+                        help='collapsed once median per-peer fps drops below this share of --fps')
+    parser.add_argument('--max-failures', type=float, default=0.05, help='tolerated share of failed new peers')
+    parser.add_argument('--max-lag-ms', type=float, default=100.0, help='tolerated event loop lag p99')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'environment': environment(),
+                'config': {key: value for key, value in vars(args).items() if key not in ('output', 'log_level')},
+                **report
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+    if report['collapse'] is None:
+        print(f"No collapse up to {args.max_peers} peers")
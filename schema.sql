@@ -11,6 +11,8 @@ CREATE TABLE IF NOT EXISTS devices (
     vendor VARCHAR(100),
     stream_path TEXT,
     user_id INT,
+    settings JSON,
+    profiles JSON,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
@@ -33,4 +35,44 @@ CREATE TABLE IF NOT EXISTS login_logs (
     KEY user_id (user_id),
     CONSTRAINT login_logs_ibfk_1 FOREIGN KEY (user_id) 
     REFERENCES users (id) ON DELETE CASCADE
-) ENGINE=InnoDB;
\ No newline at end of file
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti CHAR(32) NOT NULL,
+    user_id INT,
+    expires_at DATETIME NOT NULL,
+    revoked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (jti),
+    KEY expires_at (expires_at)
+) ENGINE=InnoDB;
+
+-- Raw detections, partitioned by day. Partitioned tables cannot carry foreign
+-- keys and every unique key must include the partition column, hence (id, ts).
+-- Daily partitions are added ahead of time (and expired) by DetectionStore.
+CREATE TABLE IF NOT EXISTS detection_events (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    device_id INT NOT NULL,
+    ts DATETIME(3) NOT NULL,
+    class VARCHAR(64) NOT NULL,
+    confidence FLOAT NOT NULL,
+    x1 SMALLINT NOT NULL,
+    y1 SMALLINT NOT NULL,
+    x2 SMALLINT NOT NULL,
+    y2 SMALLINT NOT NULL,
+    PRIMARY KEY (id, ts),
+    KEY device_ts (device_id, ts),
+    KEY class_ts (class, ts)
+) ENGINE=InnoDB
+PARTITION BY RANGE COLUMNS (ts) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+-- Per-minute rollup maintained on ingest, serves the count queries
+CREATE TABLE IF NOT EXISTS detection_counts_minute (
+    device_id INT NOT NULL,
+    minute DATETIME NOT NULL,
+    class VARCHAR(64) NOT NULL,
+    count INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (device_id, minute, class),
+    KEY class_minute (class, minute)
+) ENGINE=InnoDB;
@@ -0,0 +1,139 @@
+import asyncio
+import importlib
+from types import SimpleNamespace
+import pytest
+
+# Importing vrae loads the whole app
+for _module in ('dotenv', 'quart', 'quart_cors', 'quart_auth', 'aiortc', 'av', 'cv2', 'numpy', 'aiomysql', 'jwt', 'werkzeug'):
+    pytest.importorskip(_module)
+
+import jwt
+from vrae.auth import BloomFilter, TokenVerifier
+
+# ``vrae.auth`` the attribute is the app's QuartAuth instance, not this module
+auth = importlib.import_module('vrae.auth')
+
+SECRET = 'test-secret-long-enough-for-hs256!'
+OTHER_SECRET = 'other-secret-long-enough-for-hs256'
+
+
+class RevokedTokens:
+    """In-memory ``revoked_tokens`` table behind ``Database.execute_query``."""
+
+    def __init__(self):
+        self.rows = {}
+        self.lookups = 0
+
+    async def execute_query(self, query, params=()):
+        statement = ' '.join(query.split())
+        if statement.startswith('INSERT IGNORE INTO revoked_tokens'):
+            jti, user_id, expires_at = params
+            self.rows.setdefault(jti, expires_at)
+            return None
+        if statement.startswith('SELECT 1 FROM revoked_tokens'):
+            self.lookups += 1
+            return [(1,)] if params[0] in self.rows else []
+        if statement.startswith('SELECT jti FROM revoked_tokens'):
+            return [(jti,) for jti, expires_at in self.rows.items() if expires_at > params[0]]
+        raise AssertionError(f"Unexpected query: {statement}")
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = RevokedTokens()
+    monkeypatch.setattr(auth.Database, 'execute_query', table.execute_query)
+    return table
+
+
+def issue(verifier, user_id=1):
+    return verifier.issue(SimpleNamespace(id=user_id, username=f"user{user_id}"))
+
+
+def test_verify_caches_claims(table):
+    verifier = TokenVerifier(secret=SECRET)
+    token = issue(verifier)
+
+    first = asyncio.run(verifier.verify(token))
+    second = asyncio.run(verifier.verify(token))
+
+    assert first == second
+    assert first['id'] == 1
+    assert verifier.stats == {'hits': 1, 'misses': 1, 'revoked': 0}
+    # Nothing revoked: the bloom filter answers without the database
+    assert table.lookups == 0
+
+
+def test_cached_token_expires(table, monkeypatch):
+    verifier = TokenVerifier(secret=SECRET)
+    token = issue(verifier)
+    claims = asyncio.run(verifier.verify(token))
+
+    later = claims['exp'] + 1
+    monkeypatch.setattr(auth.time, 'time', lambda: later)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        asyncio.run(verifier.verify(token))
+    assert token not in verifier._claims
+
+
+def test_invalid_signature_rejected(table):
+    token = issue(TokenVerifier(secret=OTHER_SECRET))
+    with pytest.raises(jwt.InvalidTokenError):
+        asyncio.run(TokenVerifier(secret=SECRET).verify(token))
+
+
+def test_claims_cache_is_bounded(table):
+    verifier = TokenVerifier(secret=SECRET, cache_size=2)
+    tokens = [issue(verifier, user_id) for user_id in (1, 2, 3)]
+    for token in tokens:
+        asyncio.run(verifier.verify(token))
+
+    assert list(verifier._claims) == tokens[1:]
+
+
+def test_revoked_token_rejected(table):
+    verifier = TokenVerifier(secret=SECRET)
+    token = issue(verifier)
+    claims = asyncio.run(verifier.verify(token))
+
+    asyncio.run(verifier.revoke(token, claims))
+
+    with pytest.raises(jwt.InvalidTokenError, match='revoked'):
+        asyncio.run(verifier.verify(token))
+    assert verifier.stats['revoked'] == 1
+    assert table.lookups == 1
+
+
+def test_revocation_reaches_other_workers_on_refresh(table):
+    worker, other = TokenVerifier(secret=SECRET), TokenVerifier(secret=SECRET)
+    token = issue(worker)
+    claims = asyncio.run(worker.verify(token))
+    asyncio.run(other.verify(token))
+
+    asyncio.run(worker.revoke(token, claims))
+    # Until its next refresh the other worker's filter has not seen the revocation
+    asyncio.run(other.verify(token))
+
+    asyncio.run(other.refresh())
+    with pytest.raises(jwt.InvalidTokenError):
+        asyncio.run(other.verify(token))
+
+
+def test_filter_false_positive_is_confirmed_against_database(table):
+    verifier = TokenVerifier(secret=SECRET)
+    token = issue(verifier)
+    claims = jwt.decode(token, SECRET, algorithms=['HS256'])
+    verifier._revoked.add(claims['jti'])
+
+    assert asyncio.run(verifier.verify(token))['jti'] == claims['jti']
+    assert table.lookups == 1
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"jti-{n}" for n in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{n}" in bloom for n in range(10000))
+    assert false_positives < 300
@@ -0,0 +1,137 @@
+import os
+from fractions import Fraction
+from types import SimpleNamespace
+import pytest
+
+# Importing vrae loads the whole app
+for _module in ('dotenv', 'quart', 'quart_cors', 'quart_auth', 'aiortc', 'av', 'cv2', 'numpy', 'aiomysql', 'jwt', 'werkzeug'):
+    pytest.importorskip(_module)
+
+from vrae.clips import Clip, EventRecorder, PacketRing, clip_label, events_dir
+from vrae.config import Config
+
+TIME_BASE = Fraction(1, 90000)
+
+
+def packet(seconds, keyframe=False, size=1000):
+    return SimpleNamespace(pts=int(seconds * 90000), time_base=TIME_BASE, is_keyframe=keyframe, size=size)
+
+
+def fill(ring, seconds, gop=1.0, step=0.25, size=1000):
+    """One keyframe every ``gop`` seconds and a packet every ``step``."""
+    ticks = int(round(gop / step))
+    packets = [packet(n * step, keyframe=n % ticks == 0, size=size) for n in range(int(round(seconds / step)))]
+    for p in packets:
+        ring.append(p)
+    return packets
+
+
+class FakeWriter:
+    def __init__(self):
+        self.calls = []
+
+    def write(self, clip, packets):
+        self.calls.append(('write', clip, list(packets)))
+
+    def close(self, clip):
+        self.calls.append(('close', clip, None))
+
+
+def test_ring_keeps_whole_gops_covering_seconds():
+    ring = PacketRing(seconds=2)
+    fill(ring, 10)
+
+    packets = ring.snapshot(0)
+    assert packets[0].is_keyframe
+    # At least ``seconds`` held, at most one GOP more
+    assert 2 <= ring.span < 3
+    assert ring.bytes == sum(p.size for p in packets)
+
+
+def test_ring_byte_cap_drops_oldest_gops():
+    ring = PacketRing(seconds=60, max_bytes=10000)
+    fill(ring, 10, size=1000)
+
+    assert ring.bytes <= 10000
+    assert ring.snapshot(0)[0].is_keyframe
+    assert ring.last_time == pytest.approx(9.75)
+
+
+def test_ring_always_keeps_the_current_gop():
+    ring = PacketRing(seconds=1, max_bytes=100)
+    fill(ring, 3, gop=3.0, size=1000)
+
+    # A GOP over the byte cap is still kept whole: it is all there is
+    assert len(ring.snapshot(0)) == 12
+
+
+def test_ring_snapshot_starts_at_keyframe_before_since():
+    ring = PacketRing(seconds=10)
+    fill(ring, 6)
+
+    packets = ring.snapshot(3.5)
+    assert packets[0].is_keyframe
+    assert packets[0].pts == 3 * 90000
+    assert packets[-1].pts == int(5.75 * 90000)
+
+
+def test_empty_ring():
+    ring = PacketRing(seconds=2)
+    assert ring.span == 0.0
+    assert ring.last_time is None
+    assert ring.snapshot(0) == []
+
+
+@pytest.mark.parametrize('label, expected', [
+    (None, None),
+    ('', None),
+    ('person', 'person'),
+    ('traffic light', 'traffic_light'),
+    ('../../../../tmp/x', '____________tmp_x'),
+    ('a/b\\c', 'a_b_c'),
+    ('x' * 100, 'x' * 64),
+])
+def test_clip_label_is_safe_for_file_names(label, expected):
+    assert clip_label(label) == expected
+
+
+def test_clip_path_stays_in_device_events_dir():
+    clip = Clip(7, 'manual', '../../../../tmp/x', 0.0, 5, 5, 60)
+
+    assert os.path.dirname(clip.path) == events_dir(7)
+    assert '/' not in os.path.basename(clip.path)
+    assert clip.label == '____________tmp_x'
+
+
+def test_clip_rejects_unknown_reason():
+    with pytest.raises(ValueError):
+        Clip(7, '../x', None, 0.0, 5, 5, 60)
+
+
+def test_recorder_refuses_to_open_clip_outside_events_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'RECORDINGS_DIR', str(tmp_path / 'recordings'))
+    writer = FakeWriter()
+    recorder = EventRecorder(7, writer=writer)
+    clip = Clip(7, 'manual', None, 0.0, 5, 5, 60)
+    clip.path = str(tmp_path / 'elsewhere' / 'x.mp4')
+    recorder._clip = clip
+
+    recorder._open(clip, stream=None, packets=[packet(0, keyframe=True)])
+
+    assert clip.failed
+    assert writer.calls == [('close', clip, None)]
+    assert recorder._clip is None
+    assert not (tmp_path / 'elsewhere').exists()
+
+
+def test_trigger_before_buffering_is_armed_until_first_packet():
+    recorder = EventRecorder(7, writer=FakeWriter())
+
+    clip = recorder.trigger('manual')
+    assert clip is not None and clip.trigger_time is None
+    # A second trigger joins the armed clip
+    assert recorder.trigger('motion') is clip
+
+    clip.anchor(12.0)
+    assert clip.trigger_time == 12.0
+    assert clip.end == 12.0 + clip.post
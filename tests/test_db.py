@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+
+# Importing vrae loads the whole app
+for _module in ('dotenv', 'quart', 'quart_cors', 'quart_auth', 'aiortc', 'av', 'cv2', 'numpy', 'aiomysql', 'jwt', 'werkzeug'):
+    pytest.importorskip(_module)
+
+from vrae.config import Config
+from vrae.db import Database
+
+
+class SlowPool:
+    """Pool whose acquire hands over a connection after ``delay`` seconds.
+
+    Cancellation arrives too late to stop it, as when the timeout fires just
+    as the pool completes the acquire.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.released = []
+
+    async def acquire(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            await asyncio.sleep(self.delay)
+        return object()
+
+    def release(self, conn):
+        self.released.append(conn)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = SlowPool(0.05)
+
+    async def get_pool():
+        return pool
+
+    monkeypatch.setattr(Database, 'get_pool', get_pool)
+    monkeypatch.setattr(Config, 'DB_ACQUIRE_TIMEOUT', 0.01)
+    return pool
+
+
+def test_connection_acquired_after_timeout_is_released(pool):
+    async def main():
+        with pytest.raises(RuntimeError, match='Timed out'):
+            async with Database.connection():
+                pass
+        # The acquire finishes after the caller gave up
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    assert len(pool.released) == 1
+
+
+def test_connection_released_when_caller_is_cancelled(pool, monkeypatch):
+    monkeypatch.setattr(Config, 'DB_ACQUIRE_TIMEOUT', 1)
+
+    async def main():
+        async def use():
+            async with Database.connection():
+                await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(use())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert len(pool.released) == 1
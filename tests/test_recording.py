@@ -0,0 +1,156 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+
+# Importing vrae loads the whole app
+for _module in ('dotenv', 'quart', 'quart_cors', 'quart_auth', 'aiortc', 'av', 'cv2', 'numpy', 'aiomysql', 'jwt', 'werkzeug'):
+    pytest.importorskip(_module)
+
+from vrae.config import Config
+from vrae.recording import INDEX_NAME, SEGMENT_START, Recordings, SegmentIndex, segment_name
+
+DAY = datetime(2026, 3, 10)
+DEVICE = 3
+
+
+def ms(at):
+    return int(at.timestamp() * 1000)
+
+
+def write_index(path, records):
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        for record in records:
+            SegmentIndex.append(fd, *record)
+    finally:
+        os.close(fd)
+
+
+def segment_records(segment, start, fragments, gop=2.0, init_size=1000, fragment_size=5000):
+    """Index records of one segment: ``fragments`` GOPs of ``gop`` seconds from ``start``."""
+    return [
+        (ms(start + timedelta(seconds=n * gop)), init_size + n * fragment_size, segment,
+         SEGMENT_START if n == 0 else 0)
+        for n in range(fragments)
+    ]
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / INDEX_NAME)
+
+
+@pytest.fixture
+def recordings(tmp_path, monkeypatch):
+    """A day with segment 0 at 12:00:00-12:00:10 and segment 1 at 12:05:00-12:05:10."""
+    monkeypatch.setattr(Config, 'RECORDINGS_DIR', str(tmp_path))
+    directory = tmp_path / 'continuous' / str(DEVICE) / DAY.date().isoformat()
+    directory.mkdir(parents=True)
+    spans = [(0, DAY.replace(hour=12)), (1, DAY.replace(hour=12, minute=5))]
+    records = []
+    for segment, start in spans:
+        records += segment_records(segment, start, 5)
+        path = directory / segment_name(segment)
+        path.write_bytes(b'\0' * 100)
+        # The segment's last write: the end of its last fragment
+        end = (start + timedelta(seconds=10)).timestamp()
+        os.utime(path, (end, end))
+    write_index(str(directory / INDEX_NAME), records)
+    return directory
+
+
+def test_empty_or_missing_index(index_path):
+    with SegmentIndex(index_path) as index:
+        assert len(index) == 0
+        assert index.find(ms(DAY)) is None
+        assert index.segments(0, ms(DAY)) == []
+
+
+def test_find_is_last_record_at_or_before(index_path):
+    records = segment_records(0, DAY, 4)
+    write_index(index_path, records)
+
+    with SegmentIndex(index_path) as index:
+        assert index.find(records[0][0] - 1) is None
+        assert index.find(records[0][0]) == 0
+        assert index.find(records[2][0] + 500) == 2
+        assert index.find(records[-1][0] + 10 ** 6) == 3
+        assert index[1] == records[1]
+        assert index[-1] == records[-1]
+
+
+def test_segment_start_bisects_to_first_record_of_segment(index_path):
+    records = []
+    for segment in range(10):
+        records += segment_records(segment, DAY + timedelta(minutes=segment), 7)
+    write_index(index_path, records)
+
+    with SegmentIndex(index_path) as index:
+        for position in range(len(index)):
+            start = index.segment_start(position)
+            assert index[start][2] == index[position][2]
+            assert index[start][3] & SEGMENT_START
+            assert start == 0 or index[start - 1][2] != index[position][2]
+
+
+def test_segments_overlapping_range(index_path):
+    records = segment_records(0, DAY, 3) + segment_records(1, DAY + timedelta(minutes=1), 3)
+    write_index(index_path, records)
+
+    with SegmentIndex(index_path) as index:
+        segments = index.segments(ms(DAY + timedelta(seconds=3)), ms(DAY + timedelta(minutes=2)))
+
+    assert [s['segment'] for s in segments] == [0, 1]
+    assert segments[0]['start_ms'] == records[0][0]
+    assert segments[0]['end_ms'] == records[3][0]
+    assert segments[0]['init_size'] == records[0][1]
+
+
+def test_seek_returns_fragment_containing_time(recordings):
+    found = Recordings.seek(DEVICE, DAY.replace(hour=12, second=5))
+
+    assert found['name'] == segment_name(0)
+    # GOPs start every 2 s: 12:00:05 is in the fragment starting at 12:00:04
+    assert found['time_ms'] == ms(DAY.replace(hour=12, second=4))
+    assert found['offset'] == 1000 + 2 * 5000
+    assert found['init_size'] == 1000
+
+
+def test_seek_in_later_segment(recordings):
+    found = Recordings.seek(DEVICE, DAY.replace(hour=12, minute=5, second=9))
+
+    assert found['segment'] == 1
+    assert found['time_ms'] == ms(DAY.replace(hour=12, minute=5, second=8))
+
+
+@pytest.mark.parametrize('at', [
+    DAY.replace(hour=11, minute=59),             # before the first recording of the day
+    DAY.replace(hour=12, minute=2),              # between segments: camera down
+    DAY.replace(hour=12, minute=5, second=10),   # right after the last segment ended
+    DAY.replace(hour=18),                        # hours after the last segment
+])
+def test_seek_in_gap_returns_none(recordings, at):
+    assert Recordings.seek(DEVICE, at) is None
+
+
+def test_seek_missing_segment_file(recordings):
+    os.remove(recordings / segment_name(0))
+    assert Recordings.seek(DEVICE, DAY.replace(hour=12, second=5)) is None
+
+
+def test_seek_previous_day_segment_past_midnight(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'RECORDINGS_DIR', str(tmp_path))
+    yesterday = DAY - timedelta(days=1)
+    directory = tmp_path / 'continuous' / str(DEVICE) / yesterday.date().isoformat()
+    directory.mkdir(parents=True)
+    start = DAY - timedelta(seconds=4)
+    write_index(str(directory / INDEX_NAME), segment_records(0, start, 2))
+    path = directory / segment_name(0)
+    path.write_bytes(b'\0' * 100)
+    end = (DAY + timedelta(seconds=1)).timestamp()
+    os.utime(path, (end, end))
+
+    found = Recordings.seek(DEVICE, DAY + timedelta(milliseconds=500))
+    assert found['day'] == yesterday.date().isoformat()
+    assert found['time_ms'] == ms(DAY - timedelta(seconds=2))
+    assert Recordings.seek(DEVICE, DAY + timedelta(seconds=2)) is None
@@ -5,9 +5,12 @@ import logging
 import os
 import weakref
 from aiortc import RTCPeerConnection
-from logging.handlers import RotatingFileHandler
 from .config import Config
 from .db import Database
+from .write_behind import write_queue
+from .events import DetectionStore
+from .auth import token_verifier
+from .access_log import setup_logging, stop_logging, init_access_log
 
 # Initialize Quart app
 app = Quart(__name__)
@@ -38,34 +41,57 @@ app.config.update(
 # Setup auth
 auth = QuartAuth(app)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            'logs/api.log',
-            maxBytes=10000000,
-            backupCount=5
-        ),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: handlers run on a background thread behind a queue
+setup_logging()
+init_access_log(app)
 
 # Initialize database
 @app.before_serving
 async def init_db():
     try:
         await Database.get_pool()
+        await Database.migrate()
+        write_queue.start()
+        DetectionStore.start_maintenance()
+        token_verifier.start()
         logging.info("Database connection initialized")
     except Exception as e:
         logging.error(f"Failed to initialize database: {str(e)}")
         raise
 
+@app.before_serving
+async def start_recorders():
+    from .clips import EventRecorders
+    from .recording import Recordings
+    try:
+        await EventRecorders.start_all()
+        await Recordings.start_all()
+    except Exception as e:
+        # Recording is not required to serve the API
+        logging.error(f"Failed to start recorders: {str(e)}")
+
 @app.after_serving
 async def cleanup():
+    from .capture_hub import CaptureHub
+    from .inference import InferenceService
+    from .probe import probe_pool
+    from .discovery import discovery
+    from .clips import EventRecorders
+    from .recording import Recordings
+    # Finalize open clips and segments before their readers go away
+    await EventRecorders.stop_all()
+    await Recordings.stop_all()
+    await CaptureHub.close_all()
+    await InferenceService.close()
+    probe_pool.close()
+    discovery.close()
+    await DetectionStore.stop_maintenance()
+    await token_verifier.stop()
+    # Flush queued rows (login logs, events) before the pool goes away
+    await write_queue.stop()
     await Database.close_pool()
     logging.info("Database connection closed")
+    stop_logging()
 
 # Import routes after app initialization
 from . import routes
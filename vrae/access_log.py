@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from quart import request, g
+from .config import Config
+
+REDACT_KEYS = ('password', 'token', 'secret', 'authorization')
+REDACTED = '[redacted]'
+
+access_logger = logging.getLogger('vrae.access')
+_listener = None
+
+
+def redact(value):
+    """Copy of ``value`` with secrets replaced, matched on key names."""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if any(word in str(key).lower() for word in REDACT_KEYS) else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def _capped(value, limit):
+    """Redacted payload, or a truncated string once it serialises past ``limit``."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return value if len(value) <= limit else f"{value[:limit]}... ({len(value)} chars)"
+    value = redact(value)
+    text = json.dumps(value, default=str, ensure_ascii=False)
+    return value if len(text) <= limit else f"{text[:limit]}... ({len(text)} chars)"
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line; access fields are redacted and capped here.
+
+    Runs on the listener thread, so serialisation never costs the event loop.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname
+        }
+        access = getattr(record, 'access', None)
+        if access is None:
+            entry['message'] = record.getMessage()
+        else:
+            entry.update(access)
+            for key in ('payload', 'response'):
+                if key in entry:
+                    entry[key] = _capped(entry[key], Config.ACCESS_LOG_PAYLOAD_MAX)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def setup_logging():
+    """Route every log record through a queue to handlers on a background thread.
+
+    Application logs keep the plain text format in ``LOG_FILE`` and on the
+    console; ``vrae.access`` records become JSON lines in ``ACCESS_LOG_FILE``.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    for path in (Config.LOG_FILE, Config.ACCESS_LOG_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    text = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    not_access = lambda record: not record.name.startswith(access_logger.name)
+
+    app_file = RotatingFileHandler(Config.LOG_FILE, maxBytes=10000000, backupCount=5)
+    console = logging.StreamHandler()
+    for handler in (app_file, console):
+        handler.setFormatter(text)
+        handler.addFilter(not_access)
+
+    access_file = RotatingFileHandler(Config.ACCESS_LOG_FILE, maxBytes=10000000, backupCount=5)
+    access_file.setFormatter(JsonLineFormatter())
+    access_file.addFilter(logging.Filter(access_logger.name))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(Config.LOG_LEVEL.upper())
+    root.handlers[:] = [QueueHandler(log_queue)]
+
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+    access_logger.handlers[:] = [QueueHandler(log_queue)]
+
+    _listener = QueueListener(log_queue, app_file, console, access_file, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Drain the queue and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def init_access_log(app):
+    """Log one sampled JSON line per request with its route and latency.
+
+    Errors are always logged; other requests at ``ACCESS_LOG_SAMPLE``.
+    Request and response bodies are only captured for a further
+    ``ACCESS_LOG_PAYLOAD_SAMPLE`` fraction, and only when they are JSON of a
+    known length below ``ACCESS_LOG_PAYLOAD_MAX`` - streamed responses such
+    as MJPEG are never read. Latency is measured up to the response headers.
+    """
+
+    @app.before_request
+    async def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    async def log_access(response):
+        try:
+            start = g.get('request_start')
+            latency = time.perf_counter() - start if start is not None else None
+            g.request_latency = latency
+
+            if response.status_code < 400 and random.random() >= Config.ACCESS_LOG_SAMPLE:
+                return response
+
+            rule = request.url_rule
+            entry = {
+                'method': request.method,
+                'path': request.path,
+                'route': rule.rule if rule is not None else None,
+                'status': response.status_code,
+                'latency_ms': round(latency * 1000, 2) if latency is not None else None,
+                'bytes': response.content_length,
+                'remote': request.remote_addr
+            }
+
+            if random.random() < Config.ACCESS_LOG_PAYLOAD_SAMPLE:
+                limit = Config.ACCESS_LOG_PAYLOAD_MAX
+                if request.is_json:
+                    if (request.content_length or 0) <= limit:
+                        entry['payload'] = await request.get_json(silent=True)
+                    else:
+                        entry['payload'] = f"<{request.content_length} bytes>"
+                if response.mimetype == 'application/json' and response.content_length is not None:
+                    if response.content_length <= limit:
+                        entry['response'] = await response.get_data(as_text=True)
+                    else:
+                        entry['response'] = f"<{response.content_length} bytes>"
+
+            access_logger.info('access', extra={'access': entry})
+        except Exception as e:
+            logging.error(f"Error writing access log: {str(e)}")
+        return response
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import jwt
+import logging
+import math
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash, check_password_hash
+from .config import Config
+from .db import Database
+from .metrics import Metric, registry
+
+
+class HasherBusy(RuntimeError):
+    pass
+
+
+class PasswordHasher:
+    """Runs Werkzeug password hashing on a small bounded thread pool.
+
+    Werkzeug 3 hashes with scrypt by default (about 16 MiB per hash) and
+    still checks older PBKDF2 hashes. hashlib releases the GIL while deriving
+    keys for both, so threads keep the event loop free without the cost of a
+    process pool; the worker count also caps scrypt's memory. At most ``max_pending``
+    hashes may be running or queued; beyond that ``HasherBusy`` is raised so
+    a login burst is shed instead of queueing without bound.
+    """
+
+    def __init__(self, workers=Config.HASH_WORKERS, max_pending=Config.HASH_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hasher')
+        self._pending = 0
+
+    async def _submit(self, fn, *args):
+        if self._pending >= self.max_pending:
+            raise HasherBusy("Too many password hashes pending")
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    @property
+    def pending(self):
+        return self._pending
+
+    async def hash(self, password):
+        return await self._submit(generate_password_hash, password)
+
+    async def check(self, password_hash, password):
+        return await self._submit(check_password_hash, password_hash, password)
+
+
+class LoginRateLimiter:
+    """Token buckets of failed logins per key (username, client IP).
+
+    Each key may fail ``burst`` times, regaining one attempt every
+    ``refill_seconds``. Blocked keys are refused before any hashing is done.
+    Only the ``max_keys`` most recently used buckets are kept.
+    """
+
+    def __init__(self, burst=Config.LOGIN_FAIL_BURST,
+                 refill_seconds=Config.LOGIN_FAIL_REFILL_SECONDS, max_keys=10000):
+        self.burst = burst
+        self.rate = 1.0 / refill_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def _tokens(self, key, now):
+        tokens, last = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - last) * self.rate)
+
+    def allowed(self, *keys):
+        now = time.monotonic()
+        return all(self._tokens(key, now) >= 1 for key in keys)
+
+    def failed(self, *keys):
+        now = time.monotonic()
+        for key in keys:
+            self._buckets[key] = (max(0.0, self._tokens(key, now) - 1), now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings, sized for ``capacity`` at ``error_rate``."""
+
+    def __init__(self, capacity=100000, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class TokenVerifier:
+    """JWT verification without a database round trip per request.
+
+    Decoded claims of recently seen tokens are kept in a bounded LRU and
+    ``exp`` is re-checked on every hit. Revoked token ids (``jti``) live in
+    the ``revoked_tokens`` table; each worker keeps a bloom filter of them,
+    rebuilt every ``REVOCATION_REFRESH`` seconds, and only a filter hit (a
+    revoked token or a rare false positive) is confirmed against MySQL. With
+    several hypercorn workers a revocation made on one worker is seen by the
+    others after at most one refresh interval.
+    """
+
+    def __init__(self, secret=None, cache_size=Config.TOKEN_CACHE_SIZE):
+        self.secret = secret or Config.SECRET_KEY
+        self.cache_size = cache_size
+        self.stats = {'hits': 0, 'misses': 0, 'revoked': 0}
+        self._claims = OrderedDict()
+        self._revoked = BloomFilter(Config.REVOCATION_CAPACITY)
+        self._task = None
+
+    def issue(self, user):
+        """Signed token for ``user`` with an expiry and a revocable id."""
+        now = int(time.time())
+        return jwt.encode({
+            'id': user.id,
+            'username': user.username,
+            'iat': now,
+            'exp': now + Config.JWT_TTL,
+            'jti': uuid.uuid4().hex
+        }, self.secret, algorithm='HS256')
+
+    async def verify(self, token):
+        """Claims of a valid token; raises ``jwt.InvalidTokenError`` otherwise."""
+        claims = self._claims.get(token)
+        if claims is not None:
+            self._claims.move_to_end(token)
+            self.stats['hits'] += 1
+            if claims['exp'] <= time.time():
+                del self._claims[token]
+                raise jwt.ExpiredSignatureError('Signature has expired')
+        else:
+            self.stats['misses'] += 1
+            claims = jwt.decode(
+                token, self.secret, algorithms=['HS256'],
+                options={'require': ['exp', 'jti']}
+            )
+            self._claims[token] = claims
+            while len(self._claims) > self.cache_size:
+                self._claims.popitem(last=False)
+
+        if claims['jti'] in self._revoked and await self._is_revoked(claims['jti']):
+            self._claims.pop(token, None)
+            self.stats['revoked'] += 1
+            raise jwt.InvalidTokenError('Token has been revoked')
+        return claims
+
+    async def _is_revoked(self, jti):
+        rows = await Database.execute_query(
+            "SELECT 1 FROM revoked_tokens WHERE jti = %s", (jti,)
+        )
+        return bool(rows)
+
+    async def revoke(self, token, claims):
+        await Database.execute_query(
+            "INSERT IGNORE INTO revoked_tokens (jti, user_id, expires_at) VALUES (%s, %s, %s)",
+            (claims['jti'], claims.get('id'), datetime.fromtimestamp(claims['exp']))
+        )
+        self._revoked.add(claims['jti'])
+        self._claims.pop(token, None)
+
+    async def refresh(self):
+        """Rebuild the revocation filter from the unexpired revoked tokens."""
+        rows = await Database.execute_query(
+            "SELECT jti FROM revoked_tokens WHERE expires_at > %s", (datetime.now(),)
+        )
+        revoked = BloomFilter(max(Config.REVOCATION_CAPACITY, len(rows) * 2))
+        for row in rows:
+            revoked.add(row[0])
+        self._revoked = revoked
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+                await Database.execute_query(
+                    "DELETE FROM revoked_tokens WHERE expires_at < %s",
+                    (datetime.now() - timedelta(days=1),)
+                )
+            except Exception as e:
+                logging.error(f"Error refreshing token revocations: {str(e)}")
+            await asyncio.sleep(Config.REVOCATION_REFRESH)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+token_verifier = TokenVerifier()
+password_hasher = PasswordHasher()
+login_limiter = LoginRateLimiter()
+
+
+@registry.collector
+def _auth_metrics():
+    lookups = Metric('counter', 'vrae_token_verifications_total', 'JWT verifications by outcome', ('outcome',))
+    for outcome, count in token_verifier.stats.items():
+        lookups.labels(outcome).value = count
+    pending = Metric('gauge', 'vrae_password_hashes_pending', 'Password hashes running or queued')
+    pending.set(password_hasher.pending)
+    return [lookups, pending]
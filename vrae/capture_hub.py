@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from aiortc.contrib.media import MediaRelay
+from .enhance import EnhancementPipeline
+from .models import Device
+from .metrics import Metric, registry
+from .webrtc_stream import VideoStreamTrack, PassthroughTrack
+from .packet_reader import PacketReader
+
+
+def use_passthrough(settings):
+    """Passthrough is opt-in and only used when no enhancement stage is enabled."""
+    if not settings.get('passthrough'):
+        return False
+    enhancement = settings.get('enhancement')
+    if enhancement is not None and EnhancementPipeline(enhancement).active:
+        logging.info("Passthrough requested but enhancement is enabled, decoding instead")
+        return False
+    return True
+
+
+class CaptureHub:
+    """One camera capture per device and profile, fanned out to every WebRTC viewer.
+
+    Consumers of encoded packets (recorders) share one demux-only
+    ``PacketReader`` per device and profile through ``add_packet_listener``.
+
+    A profile without its own substream URL is served by the 'high' capture
+    (see ``Device.capture_profile``), so a camera is never opened twice for
+    the same URL.
+
+    Opening a camera can take the whole open timeout, so it is serialized per
+    key only: an unreachable camera never delays captures of other cameras.
+    The dicts themselves are only touched between awaits.
+    """
+    _sources = {}
+    _subscribers = {}
+    _packet_readers = {}
+    _relay = None
+    _locks = {}
+    # (device id, requested profile) -> profile of the capture serving it
+    _aliases = {}
+
+    @classmethod
+    def _get_lock(cls, key):
+        lock = cls._locks.get(key)
+        if lock is None:
+            lock = cls._locks[key] = asyncio.Lock()
+        return lock
+
+    @classmethod
+    def _key(cls, device_id, profile):
+        return f"{device_id}/{cls._aliases.get((str(device_id), profile), profile)}"
+
+    @classmethod
+    async def _resolve(cls, device_id, profile):
+        """The device record; also records which capture serves ``profile``."""
+        device = await Device.get_device(device_id)
+        if not device:
+            raise ValueError(f"No device found with id {device_id}")
+        cls._aliases[(str(device_id), profile)] = Device.capture_profile(device, profile)
+        return device
+
+    @classmethod
+    async def subscribe(cls, device_id, profile='high'):
+        device = await cls._resolve(device_id, profile)
+        key = cls._key(device_id, profile)
+        profile = cls._aliases[(str(device_id), profile)]
+        async with cls._get_lock(key):
+            source = cls._sources.get(key)
+            if source is not None and source.readyState != "live":
+                # Capture ended on its own (camera dropped), start a fresh one
+                logging.info(f"Discarding ended capture for device {key}")
+                cls._sources.pop(key, None)
+                cls._subscribers.pop(key, None)
+                source = None
+
+            if source is None:
+                if use_passthrough(device.get('settings') or {}):
+                    source = PassthroughTrack(device_id=device_id, profile=profile)
+                else:
+                    source = VideoStreamTrack(device_id=device_id, profile=profile)
+                await source.connect_to_camera(device)
+                cls._sources[key] = source
+                cls._subscribers[key] = set()
+                logging.info(f"Capture started for device {key}")
+
+            if cls._relay is None:
+                cls._relay = MediaRelay()
+
+            # Encoded packets must not be dropped mid-GOP, decoded frames may
+            passthrough = isinstance(source, PassthroughTrack)
+            track = cls._relay.subscribe(source, buffered=passthrough)
+            cls._subscribers[key].add(track)
+            logging.info(f"Device {key} now has {len(cls._subscribers[key])} viewer(s)")
+            return track
+
+    @classmethod
+    def unsubscribe(cls, device_id, track, profile='high'):
+        track.stop()
+        # Looked up by track: the profile's alias may have changed since it subscribed
+        key = next((key for key, tracks in cls._subscribers.items() if track in tracks), None)
+        if key is None:
+            return
+        subscribers = cls._subscribers[key]
+
+        subscribers.discard(track)
+        logging.info(f"Device {key} now has {len(subscribers)} viewer(s)")
+        if not subscribers:
+            source = cls._sources.pop(key, None)
+            cls._subscribers.pop(key, None)
+            if source is not None:
+                source.stop()
+            logging.info(f"Capture stopped for device {key}")
+
+    @classmethod
+    async def add_packet_listener(cls, device_id, listener, profile='high'):
+        """Call ``listener(packet, stream)`` from the reader thread for every packet of the device."""
+        device = await cls._resolve(device_id, profile)
+        key = cls._key(device_id, profile)
+        profile = cls._aliases[(str(device_id), profile)]
+        async with cls._get_lock(f"{key}/packets"):
+            reader = cls._packet_readers.get(key)
+            if reader is not None and not reader.alive:
+                logging.info(f"Discarding stopped packet reader for device {key}")
+                cls._packet_readers.pop(key, None)
+                reader = None
+
+            if reader is None:
+                reader = PacketReader(Device.stream_url(device, profile), name=f"{key}/packets", queue_size=0)
+                try:
+                    await reader.start()
+                except BaseException:
+                    # Also on cancellation, or the reader thread would outlive its caller
+                    reader.stop()
+                    raise
+                cls._packet_readers[key] = reader
+                logging.info(f"Packet capture started for device {key}")
+
+            reader.add_listener(listener)
+            return reader
+
+    @classmethod
+    def remove_packet_listener(cls, device_id, listener, profile='high'):
+        key = next((key for key, reader in cls._packet_readers.items() if reader.has_listener(listener)), None)
+        if key is None:
+            return
+        reader = cls._packet_readers[key]
+        reader.remove_listener(listener)
+        if not reader.listeners:
+            cls._packet_readers.pop(key, None)
+            reader.stop()
+            logging.info(f"Packet capture stopped for device {key}")
+
+    @classmethod
+    def is_passthrough(cls, device_id, profile='high'):
+        return isinstance(cls._sources.get(cls._key(device_id, profile)), PassthroughTrack)
+
+    @classmethod
+    def viewers(cls, device_id, profile='high'):
+        return len(cls._subscribers.get(cls._key(device_id, profile), ()))
+
+    @classmethod
+    def metrics(cls):
+        viewers = Metric('gauge', 'vrae_capture_viewers', 'Viewers per shared capture', ('source', 'mode'))
+        for key, source in list(cls._sources.items()):
+            mode = 'passthrough' if isinstance(source, PassthroughTrack) else 'decode'
+            viewers.labels(key, mode).set(len(cls._subscribers.get(key, ())))
+        return [viewers]
+
+    @classmethod
+    async def close_all(cls):
+        for key, source in list(cls._sources.items()):
+            for track in cls._subscribers.get(key, ()):
+                track.stop()
+            source.stop()
+            logging.info(f"Capture stopped for device {key}")
+        cls._sources.clear()
+        cls._subscribers.clear()
+        for key, reader in list(cls._packet_readers.items()):
+            reader.stop()
+            logging.info(f"Packet capture stopped for device {key}")
+        cls._packet_readers.clear()
+
+
+registry.collector(CaptureHub.metrics)
@@ -0,0 +1,463 @@
+import av
+import asyncio
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from .capture_hub import CaptureHub
+from .config import Config
+from .metrics import Metric, registry
+from .models import Device
+from .packet_reader import rebased_copy
+from .supervisor import Backoff
+
+CLIPS = registry.counter(
+    'vrae_clips_total', 'Event clips by trigger reason and outcome', ('reason', 'outcome'))
+CLIP_WRITE = registry.histogram(
+    'vrae_clip_write_seconds', 'Time to finalize an event clip after its last packet')
+
+DEFAULT_CLIP_SETTINGS = {
+    'events': False,             # keep a pre-event buffer and write clips for this device
+    'profile': 'high',
+    'pre_seconds': Config.CLIP_PRE_SECONDS,
+    'post_seconds': Config.CLIP_POST_SECONDS,
+    'max_seconds': Config.CLIP_MAX_SECONDS,
+    'classes': Config.CLIP_TRIGGER_CLASSES,  # detection classes that trigger a clip
+    'motion': False              # trigger on motion alone
+}
+
+
+# Trigger reasons, also the second part of a clip's file name
+REASONS = ('manual', 'detection', 'motion')
+
+
+def clip_label(label):
+    """``label`` made safe for a file name (letters, digits, '_' and '-'), or None."""
+    if not label:
+        return None
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(label))[:64]
+
+
+def events_dir(device_id=None):
+    root = os.path.join(Config.RECORDINGS_DIR, 'events')
+    return root if device_id is None else os.path.join(root, str(int(device_id)))
+
+
+def packet_time(packet):
+    return float(packet.pts * packet.time_base)
+
+
+class PacketRing:
+    """Encoded packets of the last ``seconds``, kept as whole GOPs.
+
+    The oldest GOP is dropped once the rest still covers ``seconds``, so the
+    buffer always starts on a keyframe and holds at most one GOP more than
+    asked for. ``max_bytes`` is a hard cap on top of that. Memory follows the
+    stream's bitrate, never its resolution. Not thread safe.
+    """
+
+    def __init__(self, seconds, max_bytes=Config.CLIP_BUFFER_MAX_BYTES):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.last_time = None
+        self._gops = deque()
+
+    @property
+    def span(self):
+        if not self._gops:
+            return 0.0
+        return self.last_time - self._gops[0][0]
+
+    def append(self, packet):
+        now = packet_time(packet)
+        if packet.is_keyframe or not self._gops:
+            # (start time, packets, bytes)
+            self._gops.append([now, [], 0])
+        gop = self._gops[-1]
+        gop[1].append(packet)
+        gop[2] += packet.size
+        self.bytes += packet.size
+        self.last_time = now
+
+        while len(self._gops) > 1 and (
+            now - self._gops[1][0] >= self.seconds or self.bytes > self.max_bytes
+        ):
+            self.bytes -= self._gops.popleft()[2]
+
+    def snapshot(self, since):
+        """Packets from the last keyframe at or before ``since`` up to now."""
+        start = 0
+        for index, gop in enumerate(self._gops):
+            if gop[0] > since:
+                break
+            start = index
+        return [packet for gop in list(self._gops)[start:] for packet in gop[1]]
+
+
+class Clip:
+    def __init__(self, device_id, reason, label, trigger_time, pre, post, max_seconds):
+        if reason not in REASONS:
+            raise ValueError(f"Unknown clip reason: {reason}")
+        self.device_id = device_id
+        self.reason = reason
+        self.label = label = clip_label(label)
+        self.created_at = datetime.now()
+        self.trigger_time = trigger_time
+        self.pre = pre
+        self.end = trigger_time + post if trigger_time is not None else None
+        self.post = post
+        self.max_seconds = max_seconds
+        name = f"{self.created_at:%Y%m%d-%H%M%S}-{reason}" + (f"-{label}" if label else '')
+        self.path = os.path.join(events_dir(device_id), f"{name}.mp4")
+        self.start_time = None
+        self.first_pts = None
+        self.packets = 0
+        self.output = None
+        self.stream = None
+        self.failed = False
+        self.closed = False
+
+    def anchor(self, now):
+        """Armed before anything was buffered: the clip is triggered at the first packet."""
+        if self.trigger_time is None:
+            self.trigger_time = now
+            self.end = now + self.post
+
+    def extend(self, now):
+        """Another trigger while recording: keep going ``post`` seconds past it."""
+        if self.trigger_time is None:
+            return
+        limit = (self.start_time if self.start_time is not None else self.trigger_time) + self.max_seconds
+        self.end = min(max(self.end, now + self.post), limit)
+
+    def info(self):
+        return {
+            'device_id': self.device_id,
+            'reason': self.reason,
+            'label': self.label,
+            'path': self.path,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class ClipWriter:
+    """Muxes event clips to MP4 on one background thread, without re-encoding.
+
+    The output container is opened by the recorder in the camera's reader
+    thread (its input stream is the template); packets and the final close
+    are queued here. At most ``max_packets`` packets wait at once; a clip that
+    would exceed that is abandoned rather than growing memory. Closes are not
+    counted against that limit, so queueing never blocks the caller.
+    """
+
+    def __init__(self, max_packets=Config.CLIP_WRITER_QUEUE):
+        self.max_packets = max_packets
+        self._queue = queue.SimpleQueue()
+        self._pending = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='clip-writer', daemon=True)
+                self._thread.start()
+
+    def write(self, clip, packets):
+        with self._lock:
+            full = self._pending + len(packets) > self.max_packets
+            if not full:
+                self._pending += len(packets)
+        if full:
+            if not clip.failed:
+                logging.error(f"Clip writer queue full, abandoning {clip.path}")
+            clip.failed = True
+            return
+        self._start()
+        self._queue.put(('write', clip, packets))
+
+    def close(self, clip):
+        # Never dropped: the container must be finalized even when the queue is full
+        self._start()
+        self._queue.put(('close', clip, None))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            op, clip, packets = item
+            try:
+                if op == 'write':
+                    self._mux(clip, packets)
+                else:
+                    self._finish(clip)
+            except Exception as e:
+                if not clip.failed:
+                    logging.error(f"Writing clip {clip.path} failed: {str(e)}")
+                clip.failed = True
+            finally:
+                if op == 'write':
+                    with self._lock:
+                        self._pending -= len(packets)
+
+    def _mux(self, clip, packets):
+        if clip.failed or clip.closed:
+            return
+        for packet in packets:
+            if clip.first_pts is None:
+                clip.first_pts = packet.pts
+            # Ring packets may be shared with a later clip
+            clip.output.mux(rebased_copy(packet, clip.stream, clip.first_pts))
+            clip.packets += 1
+
+    def _finish(self, clip):
+        if clip.closed:
+            # Closed again after a stop raced the reader opening it: drop the late output
+            if clip.output is not None:
+                try:
+                    clip.output.close()
+                except Exception:
+                    pass
+                clip.output = clip.stream = None
+                try:
+                    os.remove(clip.path)
+                except OSError:
+                    pass
+            return
+        clip.closed = True
+        start = time.perf_counter()
+        try:
+            if clip.output is not None:
+                clip.output.close()
+        except Exception as e:
+            logging.error(f"Closing clip {clip.path} failed: {str(e)}")
+            clip.failed = True
+        clip.output = None
+        clip.stream = None
+        if clip.failed or not clip.packets:
+            try:
+                os.remove(clip.path)
+            except OSError:
+                pass
+            CLIPS.labels(clip.reason, 'failed').inc()
+            return
+        CLIP_WRITE.observe(time.perf_counter() - start)
+        CLIPS.labels(clip.reason, 'written').inc()
+        logging.info(f"Clip written: {clip.path} ({clip.packets} packets)")
+
+    def stop(self, timeout=10):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+
+
+clip_writer = ClipWriter()
+
+
+class EventRecorder:
+    """Pre-event buffer of one camera that turns triggers into MP4 clips.
+
+    Packets arrive in the camera's reader thread from a ``CaptureHub`` packet
+    listener and go into a ``PacketRing``. ``trigger`` (from the event loop)
+    arms a clip; the next packet opens it with the buffer from ``pre_seconds``
+    before the trigger, and later packets are streamed to the writer until
+    ``post_seconds`` after the last trigger.
+    """
+
+    def __init__(self, device_id, settings=None, writer=clip_writer):
+        self.device_id = device_id
+        self.settings = dict(DEFAULT_CLIP_SETTINGS, **(settings or {}))
+        self.profile = self.settings['profile']
+        self.writer = writer
+        self.classes = set(self.settings['classes'] or ())
+        self.ring = PacketRing(self.settings['pre_seconds'] + 1)
+        self._lock = threading.Lock()
+        self._armed = None
+        self._clip = None
+        self._task = None
+        self._stopped = False
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._connect())
+
+    async def _connect(self):
+        # The hub's reader reconnects by itself once live; only the first open is retried here
+        backoff = Backoff()
+        while not self._stopped:
+            try:
+                await CaptureHub.add_packet_listener(self.device_id, self._on_packet, self.profile)
+                logging.info(f"Event recorder for device {self.device_id} buffering {self.settings['pre_seconds']}s")
+                return
+            except Exception as e:
+                delay = backoff.next()
+                logging.warning(f"Event recorder for device {self.device_id}: {str(e)}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def stop(self):
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+        CaptureHub.remove_packet_listener(self.device_id, self._on_packet, self.profile)
+        with self._lock:
+            clip, self._clip, self._armed = self._clip, None, None
+        # Queued outside the lock; a write still in flight from the reader is ignored once closed
+        if clip is not None:
+            self.writer.close(clip)
+
+    def trigger(self, reason, label=None):
+        """Start a clip, or extend the one being written.
+
+        Before the first packet is buffered the clip is armed without a
+        trigger time and starts with the stream.
+        """
+        with self._lock:
+            now = self.ring.last_time
+            clip = self._clip or self._armed
+            if clip is not None:
+                if now is not None:
+                    clip.extend(now)
+                return clip
+            self._armed = Clip(
+                self.device_id, reason, label, now,
+                self.settings['pre_seconds'], self.settings['post_seconds'], self.settings['max_seconds']
+            )
+            logging.info(f"Clip triggered for device {self.device_id}: {reason} {label or ''}".rstrip())
+            return self._armed
+
+    def on_detections(self, detections):
+        for det in detections:
+            if det['class'] in self.classes:
+                return self.trigger('detection', det['class'])
+        return None
+
+    def _on_packet(self, packet, stream):
+        # Reader thread. Only state changes happen under the lock, which the
+        # event loop shares through trigger(); the writer is called after it.
+        opening = closing = writing = None
+        packets = ()
+        with self._lock:
+            self.ring.append(packet)
+            if self._armed is not None:
+                opening, self._armed = self._armed, None
+                opening.anchor(self.ring.last_time)
+                packets = self.ring.snapshot(opening.trigger_time - opening.pre)
+                opening.start_time = packet_time(packets[0])
+                self._clip = opening
+            elif self._clip is not None:
+                if self.ring.last_time > self._clip.end or self._clip.failed:
+                    closing, self._clip = self._clip, None
+                else:
+                    writing, packets = self._clip, [packet]
+
+        if opening is not None:
+            self._open(opening, stream, packets)
+        elif closing is not None:
+            self.writer.close(closing)
+        elif writing is not None:
+            self.writer.write(writing, packets)
+
+    def _open(self, clip, stream, packets):
+        try:
+            root = os.path.realpath(events_dir())
+            if os.path.commonpath([root, os.path.realpath(clip.path)]) != root:
+                raise ValueError("clip path is outside the events directory")
+            os.makedirs(os.path.dirname(clip.path), exist_ok=True)
+            clip.output = av.open(clip.path, 'w', format='mp4')
+            clip.stream = clip.output.add_stream(template=stream)
+        except Exception as e:
+            logging.error(f"Could not open clip {clip.path}: {str(e)}")
+            clip.failed = True
+        with self._lock:
+            current = self._clip is clip
+            if clip.failed and current:
+                self._clip = None
+        if clip.failed or not current:
+            # Failed, or stop() already took it while the file was being opened
+            self.writer.close(clip)
+            return
+        self.writer.write(clip, packets)
+
+    def stats(self):
+        return {'seconds': round(self.ring.span, 2), 'bytes': self.ring.bytes, 'recording': self._clip is not None}
+
+
+class EventRecorders:
+    """Running event recorders, one per device with ``settings.recording.events`` on."""
+    _recorders = {}
+
+    @classmethod
+    def start(cls, device_id, settings=None):
+        recorder = cls._recorders.get(str(device_id))
+        if recorder is None:
+            recorder = EventRecorder(device_id, settings)
+            cls._recorders[str(device_id)] = recorder
+            recorder.start()
+        return recorder
+
+    @classmethod
+    def stop(cls, device_id):
+        recorder = cls._recorders.pop(str(device_id), None)
+        if recorder is not None:
+            recorder.stop()
+
+    @classmethod
+    def get(cls, device_id):
+        return cls._recorders.get(str(device_id))
+
+    @classmethod
+    def trigger(cls, device_id, reason, label=None):
+        recorder = cls.get(device_id)
+        return recorder.trigger(reason, label) if recorder is not None else None
+
+    @classmethod
+    def on_detections(cls, device_id, detections):
+        recorder = cls.get(device_id)
+        if recorder is not None and detections:
+            recorder.on_detections(detections)
+
+    @classmethod
+    def on_motion(cls, device_id):
+        recorder = cls.get(device_id)
+        if recorder is not None and recorder.settings['motion']:
+            recorder.trigger('motion')
+
+    @classmethod
+    async def start_all(cls):
+        for device in await Device.get_all_devices():
+            recording = (device.get('settings') or {}).get('recording') or {}
+            if recording.get('events'):
+                cls.start(device['id'], recording)
+        logging.info(f"Event recorders running: {len(cls._recorders)}")
+
+    @classmethod
+    async def stop_all(cls):
+        for device_id in list(cls._recorders):
+            cls.stop(device_id)
+        # Joining the writer waits for open clips to be finalized
+        await asyncio.get_running_loop().run_in_executor(None, clip_writer.stop)
+
+    @classmethod
+    def metrics(cls):
+        seconds = Metric('gauge', 'vrae_clip_buffer_seconds', 'Pre-event video held per camera', ('device',))
+        size = Metric('gauge', 'vrae_clip_buffer_bytes', 'Pre-event buffer size per camera', ('device',))
+        pending = Metric('gauge', 'vrae_clip_writer_pending', 'Clip packets waiting for the writer thread')
+        for device_id, recorder in list(cls._recorders.items()):
+            stats = recorder.stats()
+            seconds.labels(device_id).set(stats['seconds'])
+            size.labels(device_id).set(stats['bytes'])
+        pending.set(clip_writer.pending)
+        return [seconds, size, pending]
+
+
+registry.collector(EventRecorders.metrics)
@@ -10,3 +10,96 @@ class Config:
     MYSQL_USER = os.environ.get('MYSQL_USER') or 'root'
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or ''
     MYSQL_DB = os.environ.get('MYSQL_DB') or 'vrae'
+
+    # Comma separated STUN/TURN URLs for server peer connections; empty for none
+    ICE_SERVERS = os.environ.get('ICE_SERVERS', 'stun:stun.l.google.com:19302')
+
+    # Logging and the JSON access log
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_FILE = os.environ.get('LOG_FILE') or 'logs/api.log'
+    ACCESS_LOG_FILE = os.environ.get('ACCESS_LOG_FILE') or 'logs/access.log'
+    ACCESS_LOG_SAMPLE = float(os.environ.get('ACCESS_LOG_SAMPLE') or 1.0)
+    ACCESS_LOG_PAYLOAD_SAMPLE = float(os.environ.get('ACCESS_LOG_PAYLOAD_SAMPLE') or 0.0)
+    ACCESS_LOG_PAYLOAD_MAX = int(os.environ.get('ACCESS_LOG_PAYLOAD_MAX') or 2048)
+
+    # JWT sessions
+    JWT_TTL = int(os.environ.get('JWT_TTL') or 12 * 3600)
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE') or 4096)
+    REVOCATION_CAPACITY = int(os.environ.get('REVOCATION_CAPACITY') or 100000)
+    REVOCATION_REFRESH = float(os.environ.get('REVOCATION_REFRESH') or 30)
+
+    # Password hashing pool and failed-login throttling
+    HASH_WORKERS = int(os.environ.get('HASH_WORKERS') or 2)
+    HASH_MAX_PENDING = int(os.environ.get('HASH_MAX_PENDING') or 32)
+    LOGIN_FAIL_BURST = int(os.environ.get('LOGIN_FAIL_BURST') or 5)
+    LOGIN_FAIL_REFILL_SECONDS = float(os.environ.get('LOGIN_FAIL_REFILL_SECONDS') or 60)
+
+    # aiomysql pool
+    DB_POOL_MINSIZE = int(os.environ.get('DB_POOL_MINSIZE') or 1)
+    DB_POOL_MAXSIZE = int(os.environ.get('DB_POOL_MAXSIZE') or 10)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 3600)
+    DB_CONNECT_TIMEOUT = float(os.environ.get('DB_CONNECT_TIMEOUT') or 10)
+    DB_ACQUIRE_TIMEOUT = float(os.environ.get('DB_ACQUIRE_TIMEOUT') or 5)
+    DB_QUERY_TIMEOUT = float(os.environ.get('DB_QUERY_TIMEOUT') or 30)
+    DB_PING_IDLE = float(os.environ.get('DB_PING_IDLE') or 30)
+
+    # Write-behind queue for fire-and-forget rows (login logs, events)
+    WRITE_BEHIND_MAX_ROWS = int(os.environ.get('WRITE_BEHIND_MAX_ROWS') or 10000)
+    WRITE_BEHIND_BATCH = int(os.environ.get('WRITE_BEHIND_BATCH') or 500)
+    WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL') or 1.0)
+
+    # Camera connections: FFmpeg timeouts and reconnect supervision
+    CAMERA_OPEN_TIMEOUT = float(os.environ.get('CAMERA_OPEN_TIMEOUT') or 10)
+    CAMERA_READ_TIMEOUT = float(os.environ.get('CAMERA_READ_TIMEOUT') or 5)
+    CAMERA_RTSP_TRANSPORT = os.environ.get('CAMERA_RTSP_TRANSPORT') or 'tcp'
+    CAMERA_BACKOFF_BASE = float(os.environ.get('CAMERA_BACKOFF_BASE') or 1)
+    CAMERA_BACKOFF_MAX = float(os.environ.get('CAMERA_BACKOFF_MAX') or 30)
+    CAMERA_DOWN_AFTER = float(os.environ.get('CAMERA_DOWN_AFTER') or 60)
+    CAMERA_STALL_TIMEOUT = float(os.environ.get('CAMERA_STALL_TIMEOUT') or 1.0)
+
+    # Stream probing for device registration
+    FFPROBE_PATH = os.environ.get('FFPROBE_PATH') or 'ffprobe'
+    PROBE_CONCURRENCY = int(os.environ.get('PROBE_CONCURRENCY') or 8)
+    PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT') or 10)
+    BULK_IMPORT_MAX = int(os.environ.get('BULK_IMPORT_MAX') or 200)
+
+    # Subnet discovery
+    DISCOVERY_MAX_HOSTS = int(os.environ.get('DISCOVERY_MAX_HOSTS') or 256)
+    DISCOVERY_CONCURRENCY = int(os.environ.get('DISCOVERY_CONCURRENCY') or 256)
+    DISCOVERY_CONNECT_TIMEOUT = float(os.environ.get('DISCOVERY_CONNECT_TIMEOUT') or 1.0)
+    DISCOVERY_ONVIF_WORKERS = int(os.environ.get('DISCOVERY_ONVIF_WORKERS') or 16)
+    DISCOVERY_ONVIF_TIMEOUT = float(os.environ.get('DISCOVERY_ONVIF_TIMEOUT') or 5)
+    DISCOVERY_PROBE_CONCURRENCY = int(os.environ.get('DISCOVERY_PROBE_CONCURRENCY') or 32)
+    DISCOVERY_CACHE_TTL = float(os.environ.get('DISCOVERY_CACHE_TTL') or 600)
+
+    # Event clips: pre-event buffer of encoded packets per camera
+    RECORDINGS_DIR = os.environ.get('RECORDINGS_DIR') or 'recordings'
+    CLIP_PRE_SECONDS = float(os.environ.get('CLIP_PRE_SECONDS') or 10)
+    CLIP_POST_SECONDS = float(os.environ.get('CLIP_POST_SECONDS') or 10)
+    CLIP_MAX_SECONDS = float(os.environ.get('CLIP_MAX_SECONDS') or 120)
+    CLIP_BUFFER_MAX_BYTES = int(os.environ.get('CLIP_BUFFER_MAX_BYTES') or 32 * 2 ** 20)
+    CLIP_WRITER_QUEUE = int(os.environ.get('CLIP_WRITER_QUEUE') or 20000)
+    CLIP_TRIGGER_CLASSES = [c.strip() for c in (os.environ.get('CLIP_TRIGGER_CLASSES') or 'person').split(',') if c.strip()]
+
+    # Continuous recording: fMP4 segments, daily index and retention
+    RECORDING_SEGMENT_SECONDS = float(os.environ.get('RECORDING_SEGMENT_SECONDS') or 60)
+    RECORDING_GAP_SECONDS = float(os.environ.get('RECORDING_GAP_SECONDS') or 2)
+    RECORDING_WRITER_QUEUE = int(os.environ.get('RECORDING_WRITER_QUEUE') or 2000)
+    RECORDING_RETENTION_DAYS = int(os.environ.get('RECORDING_RETENTION_DAYS') or 7)
+    # 0 disables the quota; the free-space floor still applies
+    RECORDING_QUOTA_BYTES = int(float(os.environ.get('RECORDING_QUOTA_GB') or 0) * 2 ** 30)
+    RECORDING_MIN_FREE_BYTES = int(float(os.environ.get('RECORDING_MIN_FREE_GB') or 5) * 2 ** 30)
+    RECORDING_PRUNE_INTERVAL = float(os.environ.get('RECORDING_PRUNE_INTERVAL') or 60)
+
+    # YOLO inference service
+    YOLO_MODEL = os.environ.get('YOLO_MODEL') or 'yolov8n.pt'
+    INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH') or 8)
+    INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS') or 20)
+
+    # Device metadata cache
+    DEVICE_CACHE_TTL = float(os.environ.get('DEVICE_CACHE_TTL') or 30)
+    DEVICE_CACHE_SIZE = int(os.environ.get('DEVICE_CACHE_SIZE') or 1024)
+
+    # Detection event store
+    DETECTION_RETENTION_DAYS = int(os.environ.get('DETECTION_RETENTION_DAYS') or 30)
+    DETECTION_PARTITIONS_AHEAD = int(os.environ.get('DETECTION_PARTITIONS_AHEAD') or 7)
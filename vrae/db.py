@@ -1,9 +1,22 @@
 import aiomysql
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from .config import Config
+from .metrics import Histogram, Metric, registry
+
+# Columns added to tables that already existed; CREATE TABLE IF NOT EXISTS skips them
+COLUMN_MIGRATIONS = (
+    ('devices', 'settings', 'JSON'),
+    ('devices', 'profiles', 'JSON'),
+)
 
 class Database:
     _pool = None
+    _acquire_wait = Histogram()
+    _query_latency = {}
+    _errors = 0
 
     @classmethod
     async def get_pool(cls):
@@ -15,27 +28,160 @@ class Database:
                     password=Config.MYSQL_PASSWORD,
                     db=Config.MYSQL_DB,
                     autocommit=True,
-                    charset='utf8mb4'
+                    charset='utf8mb4',
+                    minsize=Config.DB_POOL_MINSIZE,
+                    maxsize=Config.DB_POOL_MAXSIZE,
+                    pool_recycle=Config.DB_POOL_RECYCLE,
+                    connect_timeout=Config.DB_CONNECT_TIMEOUT
+                )
+                logging.info(
+                    f"Database pool created successfully "
+                    f"(size {Config.DB_POOL_MINSIZE}-{Config.DB_POOL_MAXSIZE}, "
+                    f"recycle {Config.DB_POOL_RECYCLE}s)"
                 )
-                logging.info("Database pool created successfully")
             except Exception as e:
                 logging.error(f"Error creating database pool: {str(e)}")
                 raise
         return cls._pool
 
     @classmethod
-    async def execute_query(cls, query, params=None):
+    @asynccontextmanager
+    async def connection(cls):
+        """Acquire a pooled connection, bounded by DB_ACQUIRE_TIMEOUT.
+
+        Connections idle for longer than DB_PING_IDLE are pinged (and
+        transparently reconnected) before use, so a server-side timeout never
+        surfaces as a failed query.
+        """
         pool = await cls.get_pool()
-        async with pool.acquire() as conn:
+        start = time.perf_counter()
+        acquire = asyncio.ensure_future(pool.acquire())
+        try:
+            conn = await asyncio.wait_for(asyncio.shield(acquire), Config.DB_ACQUIRE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # The acquire may still succeed after we stop waiting: hand that connection back
+            acquire.cancel()
+            acquire.add_done_callback(lambda task: cls._release_abandoned(pool, task))
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            cls._errors += 1
+            raise RuntimeError(
+                f"Timed out waiting {Config.DB_ACQUIRE_TIMEOUT}s for a database connection"
+            )
+        cls._acquire_wait.observe(time.perf_counter() - start)
+
+        try:
+            if asyncio.get_running_loop().time() - conn.last_usage > Config.DB_PING_IDLE:
+                await conn.ping(reconnect=True)
+            yield conn
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # State of a connection interrupted mid-query is unknown, drop it
+            conn.close()
+            raise
+        finally:
+            pool.release(conn)
+
+    @staticmethod
+    def _release_abandoned(pool, task):
+        if not task.cancelled() and task.exception() is None:
+            pool.release(task.result())
+
+    @classmethod
+    def _observe_query(cls, query, elapsed):
+        label = query.split(None, 1)[0].upper() if query.strip() else 'UNKNOWN'
+        histogram = cls._query_latency.get(label)
+        if histogram is None:
+            histogram = cls._query_latency[label] = Histogram()
+        histogram.observe(elapsed)
+
+    @classmethod
+    async def execute_query(cls, query, params=None):
+        async with cls.connection() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(query, params or ())
-                if query.strip().upper().startswith('SELECT'):
-                    result = await cur.fetchall()
-                else:
-                    result = cur.lastrowid
-                    await conn.commit()
+                start = time.perf_counter()
+                try:
+                    await asyncio.wait_for(cur.execute(query, params or ()), Config.DB_QUERY_TIMEOUT)
+                    # Statements that return rows have a description, writes do not
+                    if cur.description:
+                        result = await cur.fetchall()
+                    else:
+                        result = cur.lastrowid
+                        await conn.commit()
+                except Exception:
+                    cls._errors += 1
+                    raise
+                finally:
+                    cls._observe_query(query, time.perf_counter() - start)
                 return result
 
+    @classmethod
+    @asynccontextmanager
+    async def transaction(cls):
+        """Cursor inside an explicit transaction, committed on success."""
+        async with cls.connection() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cur:
+                    yield cur
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+    @classmethod
+    async def execute_many(cls, query, rows):
+        """Run ``query`` for every params tuple in ``rows`` in one transaction.
+
+        aiomysql folds ``INSERT ... VALUES`` statements into multi-row inserts,
+        so a batch costs one round trip instead of one per row.
+        """
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        try:
+            async with cls.transaction() as cur:
+                await asyncio.wait_for(cur.executemany(query, rows), Config.DB_QUERY_TIMEOUT)
+                return cur.rowcount
+        except Exception:
+            cls._errors += 1
+            raise
+        finally:
+            cls._observe_query(query, time.perf_counter() - start)
+
+    @classmethod
+    def stats(cls):
+        """Pool occupancy plus acquire-wait and per-statement latency histograms."""
+        pool = cls._pool
+        return {
+            'size': pool.size if pool else 0,
+            'free': pool.freesize if pool else 0,
+            'in_use': (pool.size - pool.freesize) if pool else 0,
+            'maxsize': pool.maxsize if pool else Config.DB_POOL_MAXSIZE,
+            'errors': cls._errors,
+            'acquire_wait': cls._acquire_wait.snapshot(),
+            'query_latency': {
+                label: histogram.snapshot()
+                for label, histogram in cls._query_latency.items()
+            }
+        }
+
+    @classmethod
+    def metrics(cls):
+        """Scrape-time view of the pool for the metrics registry."""
+        pool = cls._pool
+        connections = Metric('gauge', 'vrae_db_pool_connections', 'aiomysql pool connections', ('state',))
+        connections.labels('in_use').set((pool.size - pool.freesize) if pool else 0)
+        connections.labels('free').set(pool.freesize if pool else 0)
+        connections.labels('max').set(pool.maxsize if pool else Config.DB_POOL_MAXSIZE)
+        errors = Metric('counter', 'vrae_db_errors_total', 'Failed database statements')
+        errors.labels().value = cls._errors
+        acquire = Metric('histogram', 'vrae_db_acquire_seconds', 'Wait for a pool connection')
+        acquire.attach((), cls._acquire_wait)
+        queries = Metric('histogram', 'vrae_db_query_seconds', 'Statement latency', ('statement',))
+        for label, histogram in list(cls._query_latency.items()):
+            queries.attach((label,), histogram)
+        return [connections, errors, acquire, queries]
+
     @classmethod
     async def close_pool(cls):
         if cls._pool is not None:
@@ -60,12 +206,31 @@ class Database:
                         if statement.strip():
                             await cur.execute(statement)
                     await conn.commit()
-            
+            await cls.migrate()
+
             logging.info("Database initialized successfully")
             
         except Exception as e:
             logging.error(f"Error initializing database: {str(e)}")
             raise
 
+    @classmethod
+    async def migrate(cls):
+        """Add the columns an older schema lacks; safe to run on every start."""
+        rows = await cls.execute_query("""
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_schema = DATABASE()
+        """)
+        existing = {(row[0].lower(), row[1].lower()) for row in rows}
+        tables = {table for table, _ in existing}
+        for table, column, definition in COLUMN_MIGRATIONS:
+            # Missing tables are created by init_db with every column
+            if table not in tables or (table, column) in existing:
+                continue
+            await cls.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logging.info(f"Added column {table}.{column}")
+
+registry.collector(Database.metrics)
+
 # Create an alias for the execute_query method to maintain compatibility
 execute_query = Database.execute_query
\ No newline at end of file
@@ -0,0 +1,265 @@
+import asyncio
+import cv2
+import logging
+import math
+import numpy as np
+import time
+from .inference import InferenceService
+from .metrics import registry
+
+DETECTION_LATENCY = registry.histogram(
+    'vrae_detection_seconds', 'Time from submitting a frame to using its detections', ('device',))
+DETECTION_FRAMES = registry.counter(
+    'vrae_detection_frames_total', 'Frames seen by the detection scheduler', ('device', 'outcome'))
+
+DEFAULT_SCHEDULER_SETTINGS = {
+    'interval': None,       # fixed N, or None to adapt from inference latency
+    'target_dps': None,     # detections per second cap, overrides a faster interval
+    'min_interval': 1,
+    'max_interval': 30,
+    'track_motion': True
+}
+
+DEFAULT_MOTION_SETTINGS = {
+    'enabled': True,
+    'width': 160,           # motion is measured on a copy this wide
+    'pixel_threshold': 25,  # grey-level change that counts as a changed pixel
+    'threshold': 0.01,      # fraction of changed pixels (within the ROIs) to run inference
+    'learning_rate': 0.05,
+    'hold_seconds': 2.0,    # keep detecting this long after the last motion
+    'rois': []              # polygons in normalised [x, y] coordinates
+}
+
+LATENCY_ALPHA = 0.2
+TRACK_WIDTH = 320
+REPORT_INTERVAL = 1000
+
+
+class MotionDetector:
+    """Cheap scene-change test on a downscaled, blurred grayscale frame.
+
+    Each frame is compared against a running-average background; the share of
+    changed pixels inside the device's regions of interest (or the whole frame
+    when none are configured) decides whether the scene moved.
+    """
+
+    def __init__(self, settings=None, name=None):
+        self.name = name
+        self.settings = dict(DEFAULT_MOTION_SETTINGS, **(settings or {}))
+        self.motion = 0.0
+        self._background = None
+        self._mask = None
+        self._area = 0
+        self._last_motion = None
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.settings['width'] / width)
+        small = cv2.resize(frame, (int(width * scale), int(height * scale)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _build_mask(self, shape):
+        height, width = shape
+        self._mask = None
+        self._area = width * height
+        rois = self.settings['rois']
+        if rois:
+            self._mask = np.zeros(shape, dtype=np.uint8)
+            for roi in rois:
+                polygon = np.array([[x * width, y * height] for x, y in roi], dtype=np.int32)
+                cv2.fillPoly(self._mask, [polygon], 255)
+            self._area = max(cv2.countNonZero(self._mask), 1)
+
+    def detect(self, frame):
+        """True when the scene changed enough (or recently enough) to run inference."""
+        gray = self._prepare(frame)
+        now = time.monotonic()
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            self._build_mask(gray.shape)
+            self._last_motion = now
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        _, changed = cv2.threshold(diff, self.settings['pixel_threshold'], 255, cv2.THRESH_BINARY)
+        if self._mask is not None:
+            changed = cv2.bitwise_and(changed, self._mask)
+        self.motion = cv2.countNonZero(changed) / self._area
+        cv2.accumulateWeighted(gray, self._background, self.settings['learning_rate'])
+
+        if self.motion >= self.settings['threshold']:
+            self._last_motion = now
+            return True
+        return now - self._last_motion < self.settings['hold_seconds']
+
+
+class BoxTracker:
+    """Moves the last detection boxes along with the scene using sparse optical flow."""
+
+    def __init__(self):
+        self._gray = None
+        self._points = None
+        self._owners = None
+        self._scale = 1.0
+        self.detections = []
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        self._scale = min(1.0, TRACK_WIDTH / width)
+        small = cv2.resize(frame, (int(width * self._scale), int(height * self._scale)),
+                           interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def reset(self, frame, detections):
+        self._gray = self._prepare(frame)
+        self.detections = [dict(det, bbox=list(det['bbox'])) for det in detections]
+        points, owners = [], []
+        for index, det in enumerate(self.detections):
+            x1, y1, x2, y2 = [v * self._scale for v in det['bbox']]
+            cx, cy, qx, qy = (x1 + x2) / 2, (y1 + y2) / 2, (x2 - x1) / 4, (y2 - y1) / 4
+            for px, py in ((cx, cy), (cx - qx, cy - qy), (cx + qx, cy - qy),
+                           (cx - qx, cy + qy), (cx + qx, cy + qy)):
+                points.append((px, py))
+                owners.append(index)
+        self._points = np.array(points, dtype=np.float32).reshape(-1, 1, 2) if points else None
+        self._owners = np.array(owners)
+
+    def update(self, frame):
+        if self._points is None or self._gray is None:
+            return self.detections
+
+        gray = self._prepare(frame)
+        points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._gray, gray, self._points, None, winSize=(15, 15), maxLevel=2
+        )
+        moved = (points - self._points).reshape(-1, 2)
+        good = status.reshape(-1) == 1
+        for index, det in enumerate(self.detections):
+            mask = good & (self._owners == index)
+            if not mask.any():
+                continue
+            dx, dy = np.median(moved[mask], axis=0) / self._scale
+            det['bbox'] = [int(det['bbox'][0] + dx), int(det['bbox'][1] + dy),
+                           int(det['bbox'][2] + dx), int(det['bbox'][3] + dy)]
+
+        self._gray = gray
+        self._points = points
+        return self.detections
+
+
+class DetectionScheduler:
+    """Runs inference on every Nth frame that shows motion, reusing the last boxes otherwise.
+
+    Inference runs in the background so frames keep flowing at the camera's
+    rate. With no fixed ``interval``, N follows the measured inference latency
+    so that the model is only asked for as many detections as it can deliver,
+    optionally capped by ``target_dps``. Boxes are carried between detections
+    by ``BoxTracker`` when ``track_motion`` is on.
+    """
+
+    def __init__(self, settings=None, name=None, motion=None, on_detections=None, on_motion=None):
+        self.name = name
+        self.on_detections = on_detections
+        self.on_motion = on_motion
+        self.settings = dict(DEFAULT_SCHEDULER_SETTINGS, **(settings or {}))
+        self.motion = MotionDetector(motion, name=name) if (motion or {}).get('enabled', True) else None
+        self.stats = {'frames': 0, 'inferences': 0, 'skipped_no_motion': 0}
+        self.interval = self.settings['interval'] or self.settings['min_interval']
+        self.latency = None
+        self.fps = None
+        self.detections = []
+        self._tracker = BoxTracker() if self.settings['track_motion'] else None
+        self._pending = None
+        self._submitted_at = None
+        self._frames_since = 0
+        self._last_frame_time = None
+        self._latency_metric = DETECTION_LATENCY.labels(name)
+        self._outcomes = {
+            outcome: DETECTION_FRAMES.labels(name, outcome)
+            for outcome in ('inferred', 'skipped_no_motion', 'reused')
+        }
+
+    def update(self, frame):
+        """Feed the next frame and return the detections to draw on it."""
+        now = time.perf_counter()
+        if self._last_frame_time is not None:
+            dt = now - self._last_frame_time
+            if dt > 0:
+                fps = 1.0 / dt
+                self.fps = fps if self.fps is None else self.fps + LATENCY_ALPHA * (fps - self.fps)
+        self._last_frame_time = now
+        self._frames_since += 1
+        self.stats['frames'] += 1
+        if self.stats['frames'] % REPORT_INTERVAL == 0:
+            logging.info(f"Detection stats for {self.name}: {self.stats}")
+
+        fresh = False
+        if self._pending is not None and self._pending.done():
+            fresh = self._collect(frame, now)
+
+        if self._pending is None and self._frames_since >= self.interval:
+            moving = self.motion is not None and self.motion.detect(frame)
+            # Actual change only, not the first frame or the hold period after motion
+            if moving and self.on_motion is not None and self.motion.motion >= self.motion.settings['threshold']:
+                self.on_motion()
+            if self.motion is None or moving:
+                self.submit(frame)
+                self._outcomes['inferred'].inc()
+            else:
+                # Static scene: the last boxes are still valid, skip the model
+                self._frames_since = 0
+                self.stats['skipped_no_motion'] += 1
+                self._outcomes['skipped_no_motion'].inc()
+        else:
+            self._outcomes['reused'].inc()
+            if not fresh and self._tracker is not None:
+                self.detections = self._tracker.update(frame)
+        return self.detections
+
+    def submit(self, frame):
+        """Start inference on ``frame`` right away."""
+        self._frames_since = 0
+        self.stats['inferences'] += 1
+        self._submitted_at = time.perf_counter()
+        # The caller draws on its frame, the model gets its own copy
+        self._pending = asyncio.ensure_future(InferenceService.detect(frame.copy()))
+
+    def _collect(self, frame, now):
+        pending, self._pending = self._pending, None
+        if pending.cancelled():
+            return False
+        if pending.exception() is not None:
+            logging.error(f"Detection failed for {self.name}: {pending.exception()}")
+            return False
+
+        self.detections = pending.result()
+        if self.on_detections is not None:
+            self.on_detections(self.detections)
+        latency = now - self._submitted_at
+        self._latency_metric.observe(latency)
+        self.latency = latency if self.latency is None else self.latency + LATENCY_ALPHA * (latency - self.latency)
+        if self._tracker is not None:
+            self._tracker.reset(frame, self.detections)
+        self._adapt()
+        return True
+
+    def _adapt(self):
+        if self.settings['interval']:
+            return
+        interval = self.settings['min_interval']
+        if self.fps:
+            interval = max(interval, math.ceil(self.latency * self.fps))
+            if self.settings['target_dps']:
+                interval = max(interval, math.ceil(self.fps / self.settings['target_dps']))
+        interval = min(interval, self.settings['max_interval'])
+        if interval != self.interval:
+            logging.debug(f"Detection interval for {self.name}: {self.interval} -> {interval} "
+                          f"(latency {self.latency * 1000:.0f} ms, {self.fps:.1f} fps)")
+            self.interval = interval
+
+    def close(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
@@ -0,0 +1,321 @@
+import asyncio
+import ipaddress
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit, urlunsplit
+from .cache import TTLCache
+from .config import Config
+from .metrics import registry
+from .models import Device
+from .probe import ProbePool, ProbeError, mask_url
+from .quality import PROFILES
+
+try:
+    from onvif import ONVIFCamera
+    import zeep
+    from zeep.transports import Transport
+
+    # Works around onvif-zeep failing to parse xsd:anySimpleType values
+    zeep.xsd.simple.AnySimpleType.pythonvalue = lambda self, value: value
+except ImportError:  # optional, common RTSP paths are tried instead
+    ONVIFCamera = None
+
+ONVIF_PORT = 80
+RTSP_PORT = 554
+
+# Tried in order when a host has no usable ONVIF media service
+RTSP_PATHS = (
+    '/ONVIF/MediaInput?profile=2_def_profile6',
+    '/ONVIF/MediaInput',
+    '/Streaming/Channels/101',
+    '/Streaming/Channels/102',
+    '/cam/realmonitor?channel=1&subtype=0',
+    '/cam/realmonitor?channel=1&subtype=1',
+    '/h264Preview_01_main',
+    '/stream1',
+    '/live',
+    '/',
+)
+PLAYABLE_CODECS = ('h264',)
+
+DISCOVERY_HOSTS = registry.counter(
+    'vrae_discovery_hosts_total', 'Scanned hosts by result', ('result',))
+DISCOVERY_SECONDS = registry.histogram(
+    'vrae_discovery_scan_seconds', 'Duration of subnet scans',
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300))
+
+
+def with_credentials(url, username, password):
+    """``url`` with credentials inserted, as ONVIF stream URIs come without them."""
+    if not username:
+        return url
+    parts = urlsplit(url)
+    if parts.username:
+        return url
+    netloc = f"{quote(username, safe='')}:{quote(password or '', safe='')}@{parts.netloc}"
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def without_credentials(url):
+    """``url`` with any user and password removed, for storing next to the device."""
+    parts = urlsplit(url)
+    if parts.username is None and parts.password is None:
+        return url
+    return urlunsplit(parts._replace(netloc=parts.netloc.rpartition('@')[2]))
+
+
+def assign_profiles(streams):
+    """Map validated streams onto the quality profiles, biggest resolution as 'high'."""
+    playable = [s for s in streams if s['codec'] in PLAYABLE_CODECS] or streams
+    ordered = sorted(playable, key=lambda s: (s['width'] or 0) * (s['height'] or 0), reverse=True)
+    if not ordered:
+        return {}
+    # high, low and medium, in that order of preference, without reusing a stream
+    picks = {'high': ordered[0]}
+    if len(ordered) > 1:
+        picks['low'] = ordered[-1]
+    if len(ordered) > 2:
+        picks['medium'] = ordered[len(ordered) // 2]
+    return {profile: picks[profile]['url'] for profile in PROFILES if profile in picks}
+
+
+class Discovery:
+    """Finds cameras on a subnet and turns them into device records.
+
+    A scan runs three bounded stages concurrently across hosts: a TCP connect
+    on ports 80 and 554, ONVIF profile enumeration on a thread pool (zeep is
+    blocking) and stream validation through a dedicated ``ProbePool``. Each
+    host's result is cached per credentials for ``DISCOVERY_CACHE_TTL``
+    seconds, so re-scanning a site only probes hosts that changed.
+    """
+
+    def __init__(self, concurrency=Config.DISCOVERY_CONCURRENCY,
+                 connect_timeout=Config.DISCOVERY_CONNECT_TIMEOUT,
+                 onvif_workers=Config.DISCOVERY_ONVIF_WORKERS,
+                 onvif_timeout=Config.DISCOVERY_ONVIF_TIMEOUT,
+                 probe_concurrency=Config.DISCOVERY_PROBE_CONCURRENCY):
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.onvif_workers = onvif_workers
+        self.onvif_timeout = onvif_timeout
+        self.probes = ProbePool(concurrency=probe_concurrency)
+        self._results = TTLCache(Config.DISCOVERY_MAX_HOSTS, Config.DISCOVERY_CACHE_TTL, name='discovery')
+        self._executor = None
+        self._semaphore = None
+        self._onvif_slots = None
+
+    @staticmethod
+    def hosts(subnet):
+        """Host addresses of ``subnet`` (CIDR or a single IP); raises ValueError.
+
+        Only private LAN ranges may be scanned: not public, loopback or
+        link-local addresses (cloud metadata services live on the latter).
+        """
+        network = ipaddress.ip_network(subnet, strict=False)
+        if not network.is_private or network.is_loopback or network.is_link_local:
+            raise ValueError(f"Subnet {subnet} is not a private network")
+        if network.num_addresses > Config.DISCOVERY_MAX_HOSTS + 2:
+            raise ValueError(f"Subnet {subnet} is larger than {Config.DISCOVERY_MAX_HOSTS} hosts")
+        return [str(host) for host in network.hosts()] or [str(network.network_address)]
+
+    async def scan(self, subnet, username=None, password=None, refresh=False):
+        """Cameras found in ``subnet``, each with its validated streams and profiles."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        hosts = self.hosts(subnet)
+        start = time.perf_counter()
+
+        async def scan_host(ip):
+            key = (ip, username, password)
+            if refresh:
+                self._results.invalidate(key)
+            return await self._results.get_or_load(key, lambda: self._scan_host(ip, username, password))
+
+        results = await asyncio.gather(*(scan_host(ip) for ip in hosts), return_exceptions=True)
+        cameras = []
+        for ip, result in zip(hosts, results):
+            if isinstance(result, Exception):
+                logging.error(f"Discovery of {ip} failed: {str(result)}")
+                DISCOVERY_HOSTS.labels('error').inc()
+            elif result is None:
+                DISCOVERY_HOSTS.labels('closed').inc()
+            else:
+                DISCOVERY_HOSTS.labels('camera' if result['streams'] else 'no_stream').inc()
+                cameras.append(result)
+
+        elapsed = time.perf_counter() - start
+        DISCOVERY_SECONDS.observe(elapsed)
+        logging.info(f"Discovery of {subnet}: {len(cameras)} cameras in {len(hosts)} hosts, {elapsed:.1f}s")
+        return cameras
+
+    async def _scan_host(self, ip, username, password):
+        async with self._semaphore:
+            onvif, rtsp = await asyncio.gather(
+                self._port_open(ip, ONVIF_PORT), self._port_open(ip, RTSP_PORT)
+            )
+        if not rtsp:
+            # Nothing to stream from, even if a web interface answers on port 80
+            return None
+
+        camera = {'ip': ip, 'vendor': None, 'model': None, 'onvif': False, 'streams': [], 'profiles': {}}
+        candidates = []
+        if onvif and ONVIFCamera is not None:
+            try:
+                info = await self._onvif(ip, username, password)
+                camera.update(vendor=info['vendor'], model=info['model'], onvif=True)
+                candidates = [with_credentials(uri, username, password) for uri in info['uris']]
+            except Exception as e:
+                logging.debug(f"ONVIF on {ip} unavailable: {str(e)}")
+
+        if candidates:
+            probed = await asyncio.gather(*(self._validate(url) for url in candidates))
+            camera['streams'] = [stream for stream in probed if stream]
+        else:
+            stream = await self._first_stream(ip, username, password)
+            camera['streams'] = [stream] if stream else []
+
+        camera['profiles'] = assign_profiles(camera['streams'])
+        return camera
+
+    async def _port_open(self, ip, port):
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def _validate(self, url):
+        try:
+            return dict(await self.probes.probe(url), url=url)
+        except ProbeError as e:
+            logging.debug(f"Discovery probe failed: {str(e)}")
+            return None
+
+    async def _first_stream(self, ip, username, password):
+        """Earliest of ``RTSP_PATHS`` that probes successfully; all are probed at once."""
+        urls = [
+            with_credentials(f"rtsp://{ip}:{RTSP_PORT}{path}", username, password)
+            for path in RTSP_PATHS
+        ]
+        tasks = [asyncio.ensure_future(self._validate(url)) for url in urls]
+        try:
+            # Prefer earlier (more specific) paths among those that answer
+            for task in tasks:
+                found = await task
+                if found:
+                    return found
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _onvif(self, ip, username, password):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.onvif_workers, thread_name_prefix='onvif')
+            self._onvif_slots = asyncio.Semaphore(self.onvif_workers)
+        loop = asyncio.get_running_loop()
+        # One call per worker, so the timeout below never counts time queued for a thread
+        await self._onvif_slots.acquire()
+        try:
+            future = loop.run_in_executor(self._executor, self._onvif_profiles, ip, username, password)
+        except BaseException:
+            self._onvif_slots.release()
+            raise
+        # The slot is freed with the thread, even when the wait below gives up first
+        future.add_done_callback(lambda _: self._onvif_slots.release())
+        # The zeep transport timeouts bound the thread; wait_for only stops waiting
+        return await asyncio.wait_for(asyncio.shield(future), self.onvif_timeout * 2)
+
+    def _onvif_profiles(self, ip, username, password):
+        transport = Transport(timeout=self.onvif_timeout, operation_timeout=self.onvif_timeout)
+        cam = ONVIFCamera(ip, ONVIF_PORT, username or '', password or '', transport=transport)
+
+        vendor = model = None
+        try:
+            device_info = cam.devicemgmt.GetDeviceInformation()
+            vendor, model = device_info.Manufacturer, device_info.Model
+        except Exception:
+            pass
+
+        media = cam.create_media_service()
+        uris = []
+        for profile in media.GetProfiles():
+            uri = media.GetStreamUri({
+                'ProfileToken': profile.token,
+                'StreamSetup': {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}}
+            })
+            if uri.Uri and uri.Uri not in uris:
+                uris.append(uri.Uri)
+        return {'vendor': vendor, 'model': model, 'uris': uris}
+
+    @staticmethod
+    async def save(cameras, user_id, username=None, password=None):
+        """Add every camera with streams as a device; IPs the user already has are skipped."""
+        existing = {device['ip'] for device in await Device.get_devices(user_id=user_id)}
+        results = []
+        for camera in cameras:
+            result = {'ip': camera['ip']}
+            results.append(result)
+            if not camera['streams']:
+                result['status'] = 'no_stream'
+                continue
+            if camera['ip'] in existing:
+                result['status'] = 'exists'
+                continue
+
+            main = camera['profiles'].get('high') or camera['streams'][0]['url']
+            stream = next(s for s in camera['streams'] if s['url'] == main)
+            name = ' '.join(filter(None, (camera['vendor'], camera['model']))) or 'Camera'
+            try:
+                added = await Device.add_device({
+                    'name': f"{name} {camera['ip']}",
+                    'protocol': 'RTSP',
+                    'ip': camera['ip'],
+                    'username': username,
+                    'password': password,
+                    'type': 'camera',
+                    'status': 'active',
+                    'rtsp_url': main,
+                    'vendor': camera['vendor'],
+                    'stream_path': urlsplit(main)._replace(scheme='', netloc='').geturl() or None,
+                    'user_id': user_id,
+                    'settings': {
+                        'stream': {key: value for key, value in stream.items() if key != 'url'},
+                        'discovery': {
+                            'onvif': camera['onvif'],
+                            'model': camera['model'],
+                            'streams': [dict(s, url=without_credentials(s['url'])) for s in camera['streams']]
+                        }
+                    },
+                    'profiles': camera['profiles']
+                })
+                existing.add(camera['ip'])
+                result.update(status='added', device_id=added.get('device_id'))
+            except Exception as e:
+                result.update(status='failed', error=str(e))
+        return results
+
+    @staticmethod
+    def public(camera):
+        """``camera`` with credentials masked, for API responses and logs."""
+        return dict(
+            camera,
+            streams=[dict(stream, url=mask_url(stream['url'])) for stream in camera['streams']],
+            profiles={profile: mask_url(url) for profile, url in camera['profiles'].items()}
+        )
+
+    def close(self):
+        self.probes.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+discovery = Discovery()
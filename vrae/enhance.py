@@ -0,0 +1,106 @@
+import cv2
+import logging
+import numpy as np
+import time
+
+# Built once instead of on every frame
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'area': cv2.INTER_AREA,
+    'cubic': cv2.INTER_CUBIC,
+    'lanczos4': cv2.INTER_LANCZOS4
+}
+
+DEFAULT_SETTINGS = {
+    'resize': {'enabled': True, 'width': 1920, 'height': 1080, 'interpolation': 'lanczos4'},
+    'sharpen': {'enabled': True},
+    'contrast': {'enabled': True, 'alpha': 1.1, 'beta': 5}
+}
+
+REPORT_INTERVAL = 300
+
+
+class EnhancementPipeline:
+    """Per-device frame enhancement: resize, sharpen and contrast on BGR frames.
+
+    Stages can be switched off through the device ``settings['enhancement']``.
+    Resize is skipped when the source already has the target size, sharpen and
+    contrast are fused into a single ``filter2D`` pass (or a LUT when only
+    contrast is on) and output buffers are reused between frames. Frames stay
+    BGR, so the track hands them to aiortc as ``bgr24`` without a cvtColor.
+    """
+
+    def __init__(self, settings=None, name=None):
+        self.name = name
+        self.settings = {stage: dict(values) for stage, values in DEFAULT_SETTINGS.items()}
+        for stage, values in (settings or {}).items():
+            if stage in self.settings and isinstance(values, dict):
+                self.settings[stage].update(values)
+
+        resize = self.settings['resize']
+        self.size = (int(resize['width']), int(resize['height']))
+        self._interpolation = INTERPOLATIONS.get(resize.get('interpolation'), cv2.INTER_LANCZOS4)
+
+        contrast = self.settings['contrast']
+        alpha, beta = float(contrast['alpha']), float(contrast['beta'])
+        self._kernel = SHARPEN_KERNEL * alpha if contrast['enabled'] else SHARPEN_KERNEL
+        self._delta = beta if contrast['enabled'] else 0.0
+        self._lut = np.clip(np.arange(256, dtype=np.float32) * alpha + beta, 0, 255).astype(np.uint8)
+
+        self._buffers = {}
+        self._stats = {}
+        self._frames = 0
+
+    @property
+    def active(self):
+        return any(self.settings[stage]['enabled'] for stage in self.settings)
+
+    def process(self, frame):
+        """Run the enabled stages on ``frame`` and return the enhanced BGR frame."""
+        resize = self.settings['resize']['enabled']
+        sharpen = self.settings['sharpen']['enabled']
+        contrast = self.settings['contrast']['enabled']
+
+        if resize and (frame.shape[1], frame.shape[0]) != self.size:
+            start = time.perf_counter()
+            out = self._buffer('resize', (self.size[1], self.size[0]) + frame.shape[2:], frame.dtype)
+            frame = cv2.resize(frame, self.size, dst=out, interpolation=self._interpolation)
+            self.record('resize', start)
+
+        if sharpen:
+            # Contrast is folded into the kernel and delta when both are on
+            start = time.perf_counter()
+            out = self._buffer('filter', frame.shape, frame.dtype)
+            frame = cv2.filter2D(frame, -1, self._kernel, dst=out, delta=self._delta)
+            self.record('sharpen+contrast' if contrast else 'sharpen', start)
+        elif contrast:
+            start = time.perf_counter()
+            out = self._buffer('filter', frame.shape, frame.dtype)
+            frame = cv2.LUT(frame, self._lut, dst=out)
+            self.record('contrast', start)
+
+        self._frames += 1
+        if self._frames % REPORT_INTERVAL == 0:
+            logging.info(f"Enhancement timings for {self.name}: {self.timings()}")
+        return frame
+
+    def timings(self):
+        """Average milliseconds spent per stage since the pipeline was created."""
+        return {
+            stage: round(total / count * 1000, 3)
+            for stage, (count, total) in self._stats.items()
+        }
+
+    def record(self, stage, start):
+        count, total = self._stats.get(stage, (0, 0.0))
+        self._stats[stage] = (count + 1, total + time.perf_counter() - start)
+
+    def _buffer(self, name, shape, dtype):
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+        return buf
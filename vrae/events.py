@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from .config import Config
+from .db import Database
+from .write_behind import write_queue
+
+INSERT_EVENT = """
+    INSERT INTO detection_events (device_id, ts, class, confidence, x1, y1, x2, y2)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+UPSERT_COUNT = """
+    INSERT INTO detection_counts_minute (device_id, minute, class, count)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+"""
+
+MAINTENANCE_INTERVAL = 6 * 3600
+
+
+class DetectionStore:
+    """Persists YOLO detections as compact events plus a per-minute rollup.
+
+    Rows go through the write-behind queue, so recording never waits on
+    MySQL. Counts are aggregated per class before they are queued and the
+    rollup is what the count queries read; raw events are only kept for
+    ``DETECTION_RETENTION_DAYS`` daily partitions.
+    """
+    _task = None
+
+    @staticmethod
+    def record(device_id, detections, ts=None):
+        if not detections:
+            return
+        ts = ts or datetime.now()
+        minute = ts.replace(second=0, microsecond=0)
+        for det in detections:
+            x1, y1, x2, y2 = det['bbox']
+            write_queue.enqueue(INSERT_EVENT, (
+                device_id, ts, det['class'], round(det['confidence'], 4), x1, y1, x2, y2
+            ))
+        for name, count in Counter(det['class'] for det in detections).items():
+            write_queue.enqueue(UPSERT_COUNT, (device_id, minute, name, count))
+
+    @staticmethod
+    async def counts_per_minute(device_id, start, end, class_name=None):
+        query = """
+            SELECT minute, class, count
+            FROM detection_counts_minute
+            WHERE device_id = %s AND minute >= %s AND minute < %s
+        """
+        params = [device_id, start, end]
+        if class_name:
+            query += " AND class = %s"
+            params.append(class_name)
+        query += " ORDER BY minute, class"
+
+        rows = await Database.execute_query(query, tuple(params))
+        return [
+            {'minute': row[0].isoformat(), 'class': row[1], 'count': row[2]}
+            for row in rows
+        ]
+
+    @staticmethod
+    async def ensure_partitions(today=None):
+        """Create daily partitions ahead of time and drop expired ones."""
+        today = today or datetime.now().date()
+        rows = await Database.execute_query("""
+            SELECT partition_name FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = 'detection_events'
+              AND partition_name IS NOT NULL
+        """)
+        existing = {row[0] for row in rows}
+
+        for offset in range(Config.DETECTION_PARTITIONS_AHEAD + 1):
+            day = today + timedelta(days=offset)
+            name = f"p{day:%Y%m%d}"
+            if name in existing:
+                continue
+            await Database.execute_query(f"""
+                ALTER TABLE detection_events REORGANIZE PARTITION p_future INTO (
+                    PARTITION {name} VALUES LESS THAN ('{day + timedelta(days=1):%Y-%m-%d}'),
+                    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+                )
+            """)
+            logging.info(f"Created detection partition {name}")
+
+        oldest = today - timedelta(days=Config.DETECTION_RETENTION_DAYS)
+        expired = sorted(name for name in existing if name != 'p_future' and name < f"p{oldest:%Y%m%d}")
+        if expired:
+            await Database.execute_query(
+                f"ALTER TABLE detection_events DROP PARTITION {', '.join(expired)}"
+            )
+            logging.info(f"Dropped expired detection partitions: {', '.join(expired)}")
+
+    @classmethod
+    def start_maintenance(cls):
+        if cls._task is None or cls._task.done():
+            cls._task = asyncio.create_task(cls._maintain())
+
+    @classmethod
+    async def _maintain(cls):
+        while True:
+            try:
+                await cls.ensure_partitions()
+            except Exception as e:
+                logging.error(f"Detection partition maintenance failed: {str(e)}")
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+    @classmethod
+    async def stop_maintenance(cls):
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
@@ -0,0 +1,187 @@
+import asyncio
+import cv2
+import logging
+import os
+import threading
+import time
+from .config import Config
+from .supervisor import ConnectionSupervisor, FrameTimeout
+
+OPEN_TIMEOUT = Config.CAMERA_OPEN_TIMEOUT + Config.CAMERA_READ_TIMEOUT
+READ_TIMEOUT = Config.CAMERA_READ_TIMEOUT
+
+# Read by OpenCV's FFmpeg backend on every open; timeouts are passed per capture below
+os.environ.setdefault(
+    'OPENCV_FFMPEG_CAPTURE_OPTIONS', f"rtsp_transport;{Config.CAMERA_RTSP_TRANSPORT}"
+)
+
+
+class FrameReader:
+    """Reads a cv2.VideoCapture in a dedicated thread, keeping only the newest frame.
+
+    Coroutines never touch the capture: they await ``read`` which returns as
+    soon as a frame newer than the last one they saw is available. Once the
+    first frame has arrived, a broken connection is reopened by a
+    ``ConnectionSupervisor`` in the same thread; meanwhile ``latest`` keeps
+    returning the last good frame and ``read`` raises ``FrameTimeout``.
+    """
+
+    def __init__(self, source, name=None, api_preference=cv2.CAP_ANY, properties=None,
+                 read_latency=None, capture_factory=None):
+        self.source = source
+        self.name = name if name is not None else str(source)
+        self._api_preference = api_preference
+        self._properties = properties or {}
+        # Optional histogram observed with the time of each blocking cap.read()
+        self._read_latency = read_latency
+        # Called as factory(source, api_preference, params); lets benchmarks feed synthetic frames
+        self._capture_factory = capture_factory or cv2.VideoCapture
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0
+        self._error = None
+        self._running = False
+        self._loop = None
+        self._waiters = set()
+        self.supervisor = ConnectionSupervisor(self.name, self._stop_event)
+
+    @property
+    def alive(self):
+        return self._running and not self._stop_event.is_set()
+
+    @property
+    def error(self):
+        return self._error
+
+    @property
+    def state(self):
+        return self.supervisor.state
+
+    async def start(self, timeout=OPEN_TIMEOUT):
+        """Open the capture in the reader thread and wait for the first frame."""
+        self._loop = asyncio.get_running_loop()
+        opened = self._loop.create_future()
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(opened,),
+            name=f"frame-reader-{self.name}",
+            daemon=True
+        )
+        self._thread.start()
+        try:
+            await asyncio.wait_for(opened, timeout)
+        except asyncio.TimeoutError:
+            self.stop()
+            raise RuntimeError(f"Timed out opening stream for {self.name}")
+        except Exception:
+            self.stop()
+            raise
+
+    async def read(self, last_seq=0, timeout=READ_TIMEOUT):
+        """Return ``(seq, frame)`` for the newest frame after ``last_seq``."""
+        while True:
+            with self._lock:
+                seq, frame = self._seq, self._frame
+            if frame is not None and seq != last_seq:
+                return seq, frame
+            if not self.alive:
+                raise RuntimeError(self._error or f"Frame reader for {self.name} stopped")
+
+            waiter = self._loop.create_future()
+            self._waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                raise FrameTimeout(f"No frame from {self.name} within {timeout}s ({self.state})")
+            finally:
+                self._waiters.discard(waiter)
+
+    def latest(self):
+        with self._lock:
+            return self._seq, self._frame
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _notify(self, opened=None, error=None):
+        # Runs on the event loop
+        if opened is not None and not opened.done():
+            if error:
+                opened.set_exception(RuntimeError(error))
+            else:
+                opened.set_result(True)
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    def _call_loop(self, *args):
+        try:
+            self._loop.call_soon_threadsafe(self._notify, *args)
+        except RuntimeError:
+            # Loop already closed during shutdown
+            pass
+
+    def _open(self):
+        if self._api_preference == cv2.CAP_FFMPEG:
+            # Bounded open and read instead of FFmpeg's own 30 s RTSP timeouts
+            params = [
+                cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(Config.CAMERA_OPEN_TIMEOUT * 1000),
+                cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(Config.CAMERA_READ_TIMEOUT * 1000)
+            ]
+            cap = self._capture_factory(self.source, self._api_preference, params)
+        else:
+            cap = self._capture_factory(self.source, self._api_preference)
+        for prop, value in self._properties.items():
+            cap.set(prop, value)
+        return cap
+
+    def _run(self, opened):
+        try:
+            self.supervisor.run(lambda: self._session(opened))
+        finally:
+            self._running = False
+            if self._error is None and self._frame is None:
+                self._error = f"Frame reader for {self.name} stopped"
+            self._call_loop(opened, self._error)
+
+    def _session(self, opened):
+        cap = None
+        try:
+            cap = self._open()
+            if not cap.isOpened():
+                raise RuntimeError(f"Could not open stream for {self.name}")
+
+            first = True
+            while not self._stop_event.is_set():
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                if self._read_latency is not None:
+                    self._read_latency.observe(time.perf_counter() - start)
+                if not ret or frame is None:
+                    raise RuntimeError(f"Could not read frame from {self.name}")
+                with self._lock:
+                    self._frame = frame
+                    self._seq += 1
+                if first:
+                    first = False
+                    logging.debug(f"Frame reader {self.name} opened, frame shape: {frame.shape}")
+                    self.supervisor.live()
+                    self._error = None
+                    self._call_loop(opened)
+                else:
+                    self._call_loop()
+
+        except Exception as e:
+            self._error = str(e)
+            if self._frame is None:
+                # Never delivered a frame: report to start() rather than retry
+                logging.error(f"Frame reader {self.name} stopped: {self._error}")
+                self._stop_event.set()
+            raise
+        finally:
+            if cap is not None:
+                cap.release()
@@ -0,0 +1,145 @@
+import asyncio
+import cv2
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .config import Config
+from .metrics import registry
+
+BOX_COLOR = (0, 255, 0)
+
+INFERENCE_LATENCY = registry.histogram(
+    'vrae_inference_seconds', 'Duration of one YOLO forward pass over a batch')
+INFERENCE_BATCH = registry.histogram(
+    'vrae_inference_batch_size', 'Frames per YOLO forward pass',
+    buckets=tuple(range(1, Config.INFERENCE_MAX_BATCH + 1)))
+INFERENCE_QUEUED = registry.histogram(
+    'vrae_inference_queue_seconds', 'Time a frame waits before its batch runs')
+INFERENCE_ERRORS = registry.counter(
+    'vrae_inference_errors_total', 'Failed YOLO batches')
+
+
+def draw_detections(frame, detections):
+    """Draw detection boxes and labels onto ``frame`` in place."""
+    for det in detections:
+        x1, y1, x2, y2 = det['bbox']
+        cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        label = f"{det['class']} {det['confidence']:.2f}"
+        cv2.putText(frame, label, (x1, max(y1 - 6, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, BOX_COLOR, 1, cv2.LINE_AA)
+    return frame
+
+
+class InferenceService:
+    """Single YOLO model shared by every camera, fed in micro-batches.
+
+    Callers await ``detect(frame)``. Frames queued by all streams are gathered
+    until ``INFERENCE_MAX_BATCH`` frames are waiting or ``INFERENCE_MAX_WAIT_MS``
+    has passed since the first one, then run through one forward pass on a
+    dedicated worker thread.
+    """
+    _model = None
+    _queue = None
+    _task = None
+    _executor = None
+    max_batch = Config.INFERENCE_MAX_BATCH
+    max_wait = Config.INFERENCE_MAX_WAIT_MS / 1000
+
+    @classmethod
+    def _ensure_started(cls):
+        if cls._task is None or cls._task.done():
+            cls._queue = asyncio.Queue(maxsize=cls.max_batch * 4)
+            cls._executor = cls._executor or ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='inference'
+            )
+            cls._task = asyncio.create_task(cls._run())
+            logging.info(
+                f"Inference service started (max batch {cls.max_batch}, "
+                f"max wait {cls.max_wait * 1000:.0f} ms)"
+            )
+
+    @classmethod
+    async def detect(cls, frame):
+        """Return the detections for ``frame`` as a list of dicts."""
+        cls._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await cls._queue.put((frame, future, loop.time()))
+        return await future
+
+    @classmethod
+    async def _run(cls):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await cls._queue.get()]
+            deadline = loop.time() + cls.max_wait
+            while len(batch) < cls.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(cls._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Skip frames whose stream went away while they were queued
+            batch = [(frame, future, queued) for frame, future, queued in batch if not future.done()]
+            if not batch:
+                continue
+
+            start = loop.time()
+            for _, _, queued in batch:
+                INFERENCE_QUEUED.observe(start - queued)
+            INFERENCE_BATCH.observe(len(batch))
+            try:
+                results = await loop.run_in_executor(
+                    cls._executor, cls._predict, [frame for frame, _, _ in batch]
+                )
+            except Exception as e:
+                INFERENCE_ERRORS.inc()
+                logging.error(f"Inference error: {str(e)}", exc_info=True)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                INFERENCE_LATENCY.observe(loop.time() - start)
+
+            for (_, future, _), detections in zip(batch, results):
+                if not future.done():
+                    future.set_result(detections)
+
+    @classmethod
+    def _predict(cls, frames):
+        # Runs on the inference thread
+        if cls._model is None:
+            from ultralytics import YOLO
+            cls._model = YOLO(Config.YOLO_MODEL)
+            logging.info(f"Loaded YOLO model {Config.YOLO_MODEL}")
+
+        results = cls._model(frames, verbose=False)
+        batch = []
+        for result in results:
+            boxes = result.boxes
+            detections = []
+            for bbox, conf, class_id in zip(boxes.xyxy.tolist(), boxes.conf.tolist(), boxes.cls.tolist()):
+                detections.append({
+                    'class': result.names[int(class_id)],
+                    'class_id': int(class_id),
+                    'confidence': float(conf),
+                    'bbox': [int(v) for v in bbox]
+                })
+            batch.append(detections)
+        return batch
+
+    @classmethod
+    async def close(cls):
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+            cls._executor = None
@@ -0,0 +1,188 @@
+from bisect import bisect_left
+
+# Seconds, suited to DB queries and per-frame work alike
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; ``observe`` is a bisect and two adds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """Cumulative bucket counts keyed by upper bound, plus count and sum."""
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            cumulative[bound] = running
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+class Counter:
+    """Monotonic count; ``inc`` is a single add."""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down."""
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+KINDS = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of counters, gauges or histograms keyed by label values.
+
+    Hot paths should resolve ``labels(...)`` once and keep the child, so a
+    per-frame update costs one attribute add (or a bisect for histograms).
+    """
+
+    def __init__(self, kind, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown metric kind {kind}")
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.children = {}
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self._new_child()
+        return child
+
+    def attach(self, values, child):
+        """Expose an existing ``child`` (e.g. a module's own Histogram) under ``values``."""
+        self.children[tuple(str(value) for value in values)] = child
+        return child
+
+    def remove(self, *values):
+        self.children.pop(tuple(str(value) for value in values), None)
+
+    def _new_child(self):
+        if self.kind == 'histogram':
+            return Histogram(self.buckets)
+        return KINDS[self.kind]()
+
+    # Unlabelled metrics forward to their single child
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            pairs = list(zip(self.labelnames, values))
+            if self.kind == 'histogram':
+                snapshot = child.snapshot()
+                for bound, count in snapshot['buckets'].items():
+                    le = _format_labels(pairs + [('le', _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{le} {count}")
+                labels = _format_labels(pairs)
+                lines.append(f"{self.name}_sum{labels} {_format_value(snapshot['sum'])}")
+                lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+            else:
+                lines.append(f"{self.name}{_format_labels(pairs)} {_format_value(child.value)}")
+        return lines
+
+
+class Registry:
+    """Process-wide metrics with Prometheus text exposition.
+
+    Metrics updated on hot paths are registered up front. State that already
+    lives elsewhere (pool sizes, cache stats) is read by collectors, callables
+    run only at scrape time that return freshly built ``Metric`` objects.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def _get(self, kind, name, help, labelnames=(), **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = Metric(kind, name, help, labelnames, **kwargs)
+        elif metric.kind != kind or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} already registered differently")
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get('counter', name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get('gauge', name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get('histogram', name, help, labelnames, buckets=buckets)
+
+    def collector(self, func):
+        """Register ``func`` (usable as a decorator) to be called at scrape time."""
+        self._collectors.append(func)
+        return func
+
+    def expose(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        for collect in self._collectors:
+            try:
+                for metric in collect():
+                    lines.extend(metric.expose())
+            except Exception as e:
+                lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
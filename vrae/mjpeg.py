@@ -0,0 +1,99 @@
+import asyncio
+import logging
+
+
+class MjpegBroadcaster:
+    """Runs one MJPEG pipeline stage and shares each item with every subscriber.
+
+    The source (an async iterator of annotated frames or of ready-to-send
+    multipart chunks) is only consumed while at least one client is
+    subscribed. Subscribers always get the newest item: a slow client skips
+    frames instead of queueing them, so it cannot hold back the others or
+    grow memory.
+    """
+
+    def __init__(self, source_factory, name=None, on_idle=None):
+        self.name = name
+        self._source_factory = source_factory
+        self._on_idle = on_idle
+        self._chunk = None
+        self._seq = 0
+        self._done = False
+        self._condition = asyncio.Condition()
+        self._task = None
+        self._subscribers = 0
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    async def subscribe(self):
+        """Async generator of multipart chunks for one client."""
+        self._subscribers += 1
+        if self._task is None or self._task.done():
+            self._done = False
+            self._task = asyncio.create_task(self._run())
+            logging.info(f"MJPEG source {self.name} started")
+        logging.info(f"MJPEG source {self.name} now has {self._subscribers} client(s)")
+
+        last_seq = self._seq
+        try:
+            while True:
+                async with self._condition:
+                    await self._condition.wait_for(lambda: self._seq != last_seq or self._done)
+                    if self._seq == last_seq:
+                        return
+                    chunk, last_seq = self._chunk, self._seq
+                yield chunk
+        finally:
+            self._subscribers -= 1
+            logging.info(f"MJPEG source {self.name} now has {self._subscribers} client(s)")
+            if self._subscribers == 0:
+                if self._task is not None:
+                    self._task.cancel()
+                    self._task = None
+                    logging.info(f"MJPEG source {self.name} stopped")
+                if self._on_idle is not None:
+                    self._on_idle(self)
+
+    async def _run(self):
+        source = self._source_factory()
+        try:
+            async for chunk in source:
+                async with self._condition:
+                    self._chunk = chunk
+                    self._seq += 1
+                    self._condition.notify_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"MJPEG source {self.name} failed: {str(e)}")
+        finally:
+            await source.aclose()
+            # A newer run may already own the broadcaster after a quick resubscribe
+            if self._task in (None, asyncio.current_task()):
+                async with self._condition:
+                    self._done = True
+                    self._condition.notify_all()
+
+
+_broadcasters = {}
+
+
+def get_broadcaster(key, source_factory):
+    """Return the broadcaster for ``key``, creating it on first use.
+
+    It is forgotten once its last client leaves, so keys that clients vary
+    do not pile up.
+    """
+    broadcaster = _broadcasters.get(key)
+    if broadcaster is None:
+        broadcaster = MjpegBroadcaster(source_factory, name=key, on_idle=_forget)
+        _broadcasters[key] = broadcaster
+    return broadcaster
+
+
+def _forget(broadcaster):
+    # A client may still be about to subscribe to it: it then runs unlisted until idle again
+    if _broadcasters.get(broadcaster.name) is broadcaster:
+        del _broadcasters[broadcaster.name]
@@ -1,7 +1,12 @@
 from quart_auth import AuthUser
-from werkzeug.security import generate_password_hash, check_password_hash
+from .auth import password_hasher, HasherBusy
 from .db import Database  # Changed from ..db to .db
+from .cache import TTLCache
+from .metrics import Metric, registry
+from .write_behind import write_queue
+from .config import Config
 import logging
+import json
 from datetime import datetime
 
 
@@ -12,8 +17,10 @@ class User(AuthUser):
         self.password_hash = password_hash
         self.id = id  # Adicionando o id
 
-    def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password) if self.password_hash else False
+    async def check_password(self, password: str) -> bool:
+        if not self.password_hash:
+            return False
+        return await password_hasher.check(self.password_hash, password)
 
     @staticmethod
     async def get(user_id: int):
@@ -50,9 +57,11 @@ class User(AuthUser):
     async def add_user(username, password):  # Adicionar async aqui
         try:
             query = "INSERT INTO users (username, password_hash) VALUES (%s, %s)"
-            params = (username, generate_password_hash(password))
-            result = await execute_query(query, params)  # Usar execute_query async
+            params = (username, await password_hasher.hash(password))
+            result = await Database.execute_query(query, params)
             return bool(result)
+        except HasherBusy:
+            raise
         except Exception as e:
             logging.error(f"Error adding user: {e}")
             return False
@@ -92,14 +101,19 @@ class LoginLog:
     @staticmethod
     async def add_log(user_id, token):  # Tornar método async
         try:
+            # Written in batches by the write-behind queue, off the request path
             query = "INSERT INTO login_logs (user_id, token) VALUES (%s, %s)"
-            await execute_query(query, (user_id, token))  # Usar execute_query async
-            return True
+            return write_queue.enqueue(query, (user_id, token))
         except Exception as e:
             logging.error(f"Error adding login log: {e}")
             return False
 
 
+# Device rows and per-user device lists, invalidated on every device write
+_device_cache = TTLCache(Config.DEVICE_CACHE_SIZE, Config.DEVICE_CACHE_TTL, name='devices')
+_device_list_cache = TTLCache(Config.DEVICE_CACHE_SIZE, Config.DEVICE_CACHE_TTL, name='device_lists')
+
+
 class Device:
     def __init__(self, id, name, protocol, ip, model=None, username=None, password=None, created_at=None):
         self.id = id
@@ -122,8 +136,8 @@ class Device:
             
             query = """
             INSERT INTO devices 
-            (name, protocol, ip, username, password, type, status, rtsp_url, vendor, stream_path, user_id) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            (name, protocol, ip, username, password, type, status, rtsp_url, vendor, stream_path, user_id, settings, profiles) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             values = (
                 data.get('name'),
@@ -136,10 +150,13 @@ class Device:
                 data.get('rtsp_url'),
                 data.get('vendor'),
                 data.get('stream_path'),
-                data.get('user_id')
+                data.get('user_id'),
+                json.dumps(data['settings']) if data.get('settings') else None,
+                json.dumps(data['profiles']) if data.get('profiles') else None
             )
             
             device_id = await Database.execute_query(query, values)
+            Device.invalidate(device_id=device_id, user_id=data.get('user_id'))
             return {
                 'success': True,
                 'message': 'Device added successfully',
@@ -152,14 +169,51 @@ class Device:
 
     @staticmethod
     async def get_devices(user_id=None):
+        return await _device_list_cache.get_or_load(user_id, lambda: Device._load_devices(user_id))
+
+    @staticmethod
+    async def get_all_devices():
+        """Every device of every user, uncached; for background services at startup."""
+        return await Device._load_devices(all_users=True)
+
+    @staticmethod
+    async def get_device(device_id):
+        return await _device_cache.get_or_load(str(device_id), lambda: Device._load_device(device_id))
+
+    @staticmethod
+    def invalidate(device_id=None, user_id=None):
+        """Drop cached rows after a device is added, updated or deleted."""
+        if device_id is not None:
+            _device_cache.invalidate(str(device_id))
+        if user_id is not None:
+            _device_list_cache.invalidate(user_id)
+        else:
+            _device_list_cache.clear()
+
+    @staticmethod
+    def cache_device(device):
+        """Seed the device cache with a row that is already known."""
+        _device_cache.set(str(device['id']), device)
+
+    @staticmethod
+    def cache_stats():
+        return {
+            'devices': _device_cache.stats(),
+            'device_lists': _device_list_cache.stats()
+        }
+
+    @staticmethod
+    async def _load_devices(user_id=None, all_users=False):
         try:
             query = """
                 SELECT id, name, protocol, ip, type, username, password, 
-                       status, rtsp_url, vendor, stream_path, created_at 
+                       status, rtsp_url, vendor, stream_path, created_at, settings, profiles 
                 FROM devices 
-                WHERE user_id = %s
             """
-            result = await Database.execute_query(query, (user_id,))
+            if all_users:
+                result = await Database.execute_query(query)
+            else:
+                result = await Database.execute_query(query + " WHERE user_id = %s", (user_id,))
             
             devices = []
             for row in result:
@@ -175,7 +229,9 @@ class Device:
                     'rtsp_url': row[8],
                     'vendor': row[9],
                     'stream_path': row[10],
-                    'created_at': row[11].isoformat() if row[11] else None
+                    'created_at': row[11].isoformat() if row[11] else None,
+                    'settings': json.loads(row[12]) if row[12] else {},
+                    'profiles': json.loads(row[13]) if row[13] else {}
                 }
                 devices.append(device)
                 
@@ -186,11 +242,11 @@ class Device:
             raise
 
     @staticmethod
-    async def get_device(device_id):
+    async def _load_device(device_id):
         try:
             query = """
                 SELECT id, name, protocol, ip, type, username, password, 
-                       status, rtsp_url, vendor, stream_path, created_at 
+                       status, rtsp_url, vendor, stream_path, created_at, settings, profiles 
                 FROM devices 
                 WHERE id = %s
             """
@@ -210,10 +266,35 @@ class Device:
                     'rtsp_url': row[8],
                     'vendor': row[9],
                     'stream_path': row[10],
-                    'created_at': row[11].isoformat() if row[11] else None
+                    'created_at': row[11].isoformat() if row[11] else None,
+                    'settings': json.loads(row[12]) if row[12] else {},
+                    'profiles': json.loads(row[13]) if row[13] else {}
                 }
             return None
                 
         except Exception as e:
             logging.error(f"Error getting device: {str(e)}", exc_info=True)
             raise
+
+    @staticmethod
+    def stream_url(device, profile='high'):
+        """RTSP URL of the requested substream, falling back to the main rtsp_url."""
+        return (device.get('profiles') or {}).get(profile) or device.get('rtsp_url')
+
+    @staticmethod
+    def capture_profile(device, profile='high'):
+        """Profile whose capture serves ``profile``: one that falls back to the main stream is 'high'."""
+        if profile != 'high' and Device.stream_url(device, profile) == Device.stream_url(device, 'high'):
+            return 'high'
+        return profile
+
+
+@registry.collector
+def _cache_metrics():
+    size = Metric('gauge', 'vrae_cache_entries', 'Entries held by in-process caches', ('cache',))
+    lookups = Metric('counter', 'vrae_cache_lookups_total', 'Cache lookups by result', ('cache', 'result'))
+    for name, stats in Device.cache_stats().items():
+        size.labels(name).set(stats['size'])
+        lookups.labels(name, 'hit').value = stats['hits']
+        lookups.labels(name, 'miss').value = stats['misses']
+    return [size, lookups]
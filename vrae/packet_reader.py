@@ -0,0 +1,253 @@
+import asyncio
+import av
+import logging
+import threading
+from .config import Config
+from .supervisor import ConnectionSupervisor, FrameTimeout
+
+OPEN_TIMEOUT = Config.CAMERA_OPEN_TIMEOUT + Config.CAMERA_READ_TIMEOUT
+READ_TIMEOUT = Config.CAMERA_READ_TIMEOUT
+QUEUE_SIZE = 120
+RTSP_OPTIONS = {
+    'rtsp_transport': Config.CAMERA_RTSP_TRANSPORT,
+    'stimeout': str(int(Config.CAMERA_READ_TIMEOUT * 1000000))
+}
+# One frame at 30 fps in the 90 kHz RTP clock, the gap left across a reconnect
+PTS_GAP = 3000
+
+
+def has_sps(data, limit=256):
+    """True if an H.264 SPS NAL unit appears near the start of ``data``."""
+    pos = data.find(b'\x00\x00\x01', 0, limit)
+    while pos != -1 and pos + 3 < len(data):
+        if data[pos + 3] & 0x1f == 7:
+            return True
+        pos = data.find(b'\x00\x00\x01', pos + 3, limit)
+    return False
+
+
+def rebased_copy(packet, stream, origin):
+    """A copy of ``packet`` for muxing into ``stream``, with timestamps starting at ``origin``.
+
+    Listeners share packets, so they are never re-targeted in place.
+    """
+    out = av.Packet(bytes(packet))
+    out.pts = packet.pts - origin
+    out.dts = (packet.dts if packet.dts is not None else packet.pts) - origin
+    out.time_base = packet.time_base
+    out.is_keyframe = packet.is_keyframe
+    out.stream = stream
+    return out
+
+
+class PacketReader:
+    """Demuxes an RTSP stream with PyAV in a dedicated thread, without decoding.
+
+    Encoded packets are handed to the event loop through a bounded queue. When
+    the consumer falls behind, the backlog is dropped and delivery resumes at
+    the next keyframe so the decoder on the other end never sees a broken GOP.
+    After the first packet, a dropped connection is reopened by a
+    ``ConnectionSupervisor``; timestamps continue where the previous session
+    stopped and delivery resumes at a keyframe.
+
+    Listeners added with ``add_listener`` are called in the reader thread as
+    ``listener(packet, stream)`` for every packet from the first keyframe of
+    each session on; ``stream`` is only valid during the call. They must not
+    block. With ``queue_size=0`` packets go to the listeners only.
+    """
+
+    def __init__(self, url, name=None, options=None, queue_size=QUEUE_SIZE):
+        self.url = url
+        self.name = name if name is not None else url
+        self.options = dict(RTSP_OPTIONS, **(options or {}))
+        self.codec = None
+        self.width = None
+        self.height = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._queue = asyncio.Queue(maxsize=queue_size) if queue_size else None
+        self._listeners = ()
+        self._wait_keyframe = True
+        self._error = None
+        self._running = False
+        self._loop = None
+        self._delivered = False
+        self._last_pts = None
+        self.supervisor = ConnectionSupervisor(self.name, self._stop_event)
+
+    @property
+    def alive(self):
+        return self._running and not self._stop_event.is_set()
+
+    @property
+    def state(self):
+        return self.supervisor.state
+
+    async def start(self, timeout=OPEN_TIMEOUT):
+        """Open the stream in the reader thread and wait for its stream info."""
+        self._loop = asyncio.get_running_loop()
+        opened = self._loop.create_future()
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(opened,),
+            name=f"packet-reader-{self.name}",
+            daemon=True
+        )
+        self._thread.start()
+        try:
+            await asyncio.wait_for(opened, timeout)
+        except asyncio.TimeoutError:
+            self.stop()
+            raise RuntimeError(f"Timed out opening stream for {self.name}")
+        except Exception:
+            self.stop()
+            raise
+
+    @property
+    def listeners(self):
+        return len(self._listeners)
+
+    def add_listener(self, listener):
+        # Copy on write: the reader thread iterates without a lock
+        self._listeners = self._listeners + (listener,)
+
+    def has_listener(self, listener):
+        # Equality, not identity: each access to a bound method creates a new object
+        return listener in self._listeners
+
+    def remove_listener(self, listener):
+        self._listeners = tuple(l for l in self._listeners if l != listener)
+
+    async def read(self, timeout=READ_TIMEOUT):
+        """Return the next encoded packet."""
+        if self._queue is None:
+            raise RuntimeError(f"Packet reader for {self.name} only feeds listeners")
+        if not self.alive and self._queue.empty():
+            raise RuntimeError(self._error or f"Packet reader for {self.name} stopped")
+        try:
+            packet = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise FrameTimeout(f"No packet from {self.name} within {timeout}s ({self.state})")
+        if packet is None:
+            raise RuntimeError(self._error or f"Packet reader for {self.name} stopped")
+        return packet
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _put(self, packet):
+        # Runs on the event loop
+        if self._queue is None:
+            return
+        if packet is None:
+            if self._queue.full():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+            return
+
+        if self._queue.full():
+            logging.warning(f"Packet reader {self.name} consumer too slow, dropping backlog")
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._wait_keyframe = True
+
+        if self._wait_keyframe:
+            if not packet.is_keyframe:
+                return
+            self._wait_keyframe = False
+        self._queue.put_nowait(packet)
+
+    def _resync(self):
+        # Runs on the event loop: a new session must start on a keyframe
+        self._wait_keyframe = True
+
+    def _call_loop(self, callback, *args):
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Loop already closed during shutdown
+            pass
+
+    def _opened(self, opened, error=None):
+        if not opened.done():
+            if error:
+                opened.set_exception(RuntimeError(error))
+            else:
+                opened.set_result(True)
+
+    def _run(self, opened):
+        try:
+            self.supervisor.run(lambda: self._session(opened))
+        finally:
+            self._running = False
+            self._call_loop(self._opened, opened, self._error or f"Packet reader for {self.name} stopped")
+            self._call_loop(self._put, None)
+
+    def _session(self, opened):
+        container = None
+        try:
+            container = av.open(
+                self.url, options=self.options,
+                timeout=(Config.CAMERA_OPEN_TIMEOUT, Config.CAMERA_READ_TIMEOUT)
+            )
+            stream = container.streams.video[0]
+            self.codec = stream.codec_context.name
+            self.width = stream.codec_context.width
+            self.height = stream.codec_context.height
+
+            # Some cameras only send SPS/PPS out of band (SDP), repeat them on keyframes
+            extradata = bytes(stream.codec_context.extradata or b'') if self.codec == 'h264' else b''
+
+            logging.info(f"Packet reader {self.name} opened: {self.codec} {self.width}x{self.height}")
+            offset = None
+            synced = False
+            for packet in container.demux(stream):
+                if self._stop_event.is_set():
+                    break
+                if packet.pts is None or packet.size == 0:
+                    continue
+                if packet.is_keyframe and extradata and not has_sps(bytes(packet)):
+                    patched = av.Packet(extradata + bytes(packet))
+                    patched.pts = packet.pts
+                    patched.dts = packet.dts
+                    patched.time_base = packet.time_base
+                    patched.is_keyframe = True
+                    packet = patched
+
+                if offset is None:
+                    # Continue the previous session's timeline so RTP timestamps never jump back
+                    offset = 0 if self._last_pts is None else self._last_pts + PTS_GAP - packet.pts
+                    self.supervisor.live()
+                    self._error = None
+                    self._call_loop(self._opened, opened)
+                    self._call_loop(self._resync)
+                if offset:
+                    packet.pts += offset
+                    if packet.dts is not None:
+                        packet.dts += offset
+                self._last_pts = packet.pts
+                self._delivered = True
+                if self._queue is not None:
+                    self._call_loop(self._put, packet)
+
+                synced = synced or packet.is_keyframe
+                if synced:
+                    for listener in self._listeners:
+                        try:
+                            listener(packet, stream)
+                        except Exception as e:
+                            logging.error(f"Packet listener on {self.name} failed: {str(e)}")
+            else:
+                raise RuntimeError(f"Stream for {self.name} ended")
+
+        except Exception as e:
+            self._error = str(e)
+            if not self._delivered:
+                # Never delivered a packet: report to start() rather than retry
+                logging.error(f"Packet reader {self.name} stopped: {self._error}")
+                self._stop_event.set()
+            raise
+        finally:
+            if container is not None:
+                container.close()
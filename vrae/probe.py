@@ -0,0 +1,156 @@
+import asyncio
+import json
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from urllib.parse import urlsplit, urlunsplit
+from .config import Config
+from .metrics import registry
+
+PROBE_LATENCY = registry.histogram(
+    'vrae_probe_seconds', 'Stream metadata probes by outcome', ('outcome',))
+PROBE_IN_FLIGHT = registry.gauge(
+    'vrae_probes_in_flight', 'Stream probes running or waiting for a slot')
+
+STREAM_ENTRIES = 'stream=codec_name,profile,width,height,pix_fmt,avg_frame_rate,r_frame_rate'
+
+
+class ProbeError(RuntimeError):
+    pass
+
+
+def mask_url(url):
+    """``url`` with any password replaced, safe for logs and API errors."""
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    netloc = f"{parts.username}:***@{parts.hostname}" + (f":{parts.port}" if parts.port else '')
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def _rate(value):
+    try:
+        rate = Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return round(float(rate), 2) if rate else None
+
+
+class ProbePool:
+    """Reads stream metadata (codec, resolution, fps) without decoding video.
+
+    At most ``concurrency`` probes run at once, the rest wait for a slot. Each
+    probe is an ``ffprobe`` subprocess that is killed and reaped on timeout or
+    cancellation; without an ffprobe binary PyAV opens the stream on a thread
+    pool of the same size and the container is always closed.
+    """
+
+    def __init__(self, concurrency=Config.PROBE_CONCURRENCY, timeout=Config.PROBE_TIMEOUT,
+                 ffprobe=Config.FFPROBE_PATH):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ffprobe = shutil.which(ffprobe)
+        self._semaphore = None
+        self._executor = None
+
+    async def probe(self, url):
+        """Metadata of the first video stream of ``url``; raises ``ProbeError``."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        PROBE_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            async with self._semaphore:
+                if self.ffprobe:
+                    info = await self._ffprobe(url)
+                else:
+                    info = await self._pyav(url)
+            outcome = 'ok'
+            return info
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            raise ProbeError(f"Probe of {mask_url(url)} timed out after {self.timeout}s")
+        finally:
+            PROBE_IN_FLIGHT.dec()
+            PROBE_LATENCY.labels(outcome).observe(time.perf_counter() - start)
+
+    async def _ffprobe(self, url):
+        args = [self.ffprobe, '-v', 'error', '-analyzeduration', '2000000', '-probesize', '1000000']
+        if url.startswith('rtsp'):
+            args += ['-rtsp_transport', Config.CAMERA_RTSP_TRANSPORT]
+        args += ['-select_streams', 'v:0', '-show_entries', STREAM_ENTRIES, '-of', 'json', url]
+
+        process = await asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        finally:
+            # Timeout or cancellation: never leave an ffprobe (and its RTSP session) behind
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        if process.returncode != 0:
+            message = stderr.decode(errors='replace').replace(url, mask_url(url)).strip().splitlines()
+            raise ProbeError(f"Could not probe {mask_url(url)}: {message[-1] if message else process.returncode}")
+
+        streams = json.loads(stdout or b'{}').get('streams') or []
+        if not streams:
+            raise ProbeError(f"No video stream in {mask_url(url)}")
+        stream = streams[0]
+        return {
+            'codec': stream.get('codec_name'),
+            'profile': stream.get('profile'),
+            'width': stream.get('width'),
+            'height': stream.get('height'),
+            'pix_fmt': stream.get('pix_fmt'),
+            'fps': _rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate'))
+        }
+
+    async def _pyav(self, url):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='probe')
+        loop = asyncio.get_running_loop()
+        # PyAV's own timeouts interrupt the I/O; wait_for only stops waiting
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._executor, self._open_pyav, url), self.timeout + 1
+        )
+
+    def _open_pyav(self, url):
+        import av
+        options = {'rtsp_transport': Config.CAMERA_RTSP_TRANSPORT} if url.startswith('rtsp') else {}
+        container = None
+        try:
+            container = av.open(url, options=options, timeout=(self.timeout, self.timeout))
+            if not container.streams.video:
+                raise ProbeError(f"No video stream in {mask_url(url)}")
+            stream = container.streams.video[0]
+            codec = stream.codec_context
+            return {
+                'codec': codec.name,
+                'profile': codec.profile,
+                'width': codec.width,
+                'height': codec.height,
+                'pix_fmt': codec.pix_fmt,
+                'fps': _rate(stream.average_rate) or _rate(stream.guessed_rate)
+            }
+        except ProbeError:
+            raise
+        except Exception as e:
+            raise ProbeError(f"Could not probe {mask_url(url)}: {str(e).replace(url, mask_url(url))}")
+        finally:
+            if container is not None:
+                container.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+probe_pool = ProbePool()
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from .capture_hub import CaptureHub
+
+PROFILES = ('low', 'medium', 'high')
+
+CHECK_INTERVAL = 2.0
+# RTCP receiver reports carry the loss fraction as n/256
+DOWNGRADE_LOSS = 0.10
+UPGRADE_LOSS = 0.02
+DOWNGRADE_RTT = 1.0
+DOWNGRADE_AFTER = 2
+UPGRADE_AFTER = 5
+
+
+def default_profile(data):
+    """Profile requested on /offer; grid views get the low substream by default."""
+    profile = data.get('profile')
+    if profile in PROFILES:
+        return profile
+    return 'low' if data.get('view') == 'grid' else 'high'
+
+
+class QualityController:
+    """Owns a viewer's hub subscription and follows the receiver's link quality.
+
+    Every ``CHECK_INTERVAL`` seconds the sender's remote-inbound stats (built
+    from the viewer's RTCP receiver reports) are checked. Sustained loss or
+    round-trip time steps the viewer down one substream; a sustained clean link
+    steps it back up, never above the profile it asked for.
+    """
+
+    def __init__(self, device_id, profile='high', auto=True):
+        self.device_id = device_id
+        self.profile = profile
+        self.max_profile = profile
+        self.auto = auto
+        self.track = None
+        self.sender = None
+        self._task = None
+        self._bad = 0
+        self._good = 0
+
+    async def subscribe(self):
+        self.track = await CaptureHub.subscribe(self.device_id, self.profile)
+        return self.track
+
+    def start(self, sender):
+        self.sender = sender
+        if self.auto and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.track is not None:
+            CaptureHub.unsubscribe(self.device_id, self.track, self.profile)
+            self.track = None
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(CHECK_INTERVAL)
+                await self._check()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logging.error(f"Quality controller for device {self.device_id} failed: {str(e)}")
+
+    async def _check(self):
+        report = await self.sender.getStats()
+        remote = next((s for s in report.values() if s.type == 'remote-inbound-rtp'), None)
+        if remote is None:
+            return
+
+        loss = (remote.fractionLost or 0) / 256
+        rtt = remote.roundTripTime or 0
+        if loss > DOWNGRADE_LOSS or rtt > DOWNGRADE_RTT:
+            self._bad, self._good = self._bad + 1, 0
+        elif loss < UPGRADE_LOSS:
+            self._bad, self._good = 0, self._good + 1
+        else:
+            self._bad = self._good = 0
+
+        index = PROFILES.index(self.profile)
+        if self._bad >= DOWNGRADE_AFTER and index > 0:
+            await self._switch(PROFILES[index - 1], loss, rtt)
+        elif self._good >= UPGRADE_AFTER and index < PROFILES.index(self.max_profile):
+            await self._switch(PROFILES[index + 1], loss, rtt)
+
+    async def _switch(self, profile, loss, rtt):
+        self._bad = self._good = 0
+        try:
+            track = await CaptureHub.subscribe(self.device_id, profile)
+        except Exception as e:
+            logging.warning(f"Could not switch device {self.device_id} to {profile}: {str(e)}")
+            return
+
+        # Whichever subscription is not kept is released, even if the task is cancelled
+        release, release_profile = track, profile
+        try:
+            # The negotiated codec cannot change mid-call
+            if CaptureHub.is_passthrough(self.device_id, profile) != CaptureHub.is_passthrough(self.device_id, self.profile):
+                return
+
+            logging.info(f"Device {self.device_id}: {self.profile} -> {profile} "
+                         f"(loss {loss:.1%}, rtt {rtt * 1000:.0f} ms)")
+            self.sender.replaceTrack(track)
+            release, release_profile = self.track, self.profile
+            self.track, self.profile = track, profile
+        finally:
+            if release is not None:
+                CaptureHub.unsubscribe(self.device_id, release, release_profile)
@@ -0,0 +1,640 @@
+import av
+import asyncio
+import bisect
+import io
+import logging
+import mmap
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+from .capture_hub import CaptureHub
+from .config import Config
+from .metrics import Metric, registry
+from .models import Device
+from .packet_reader import rebased_copy
+from .supervisor import Backoff
+
+RECORDING_BYTES = registry.counter(
+    'vrae_recording_bytes_total', 'Bytes of video written by continuous recording', ('device',))
+RECORDING_SEGMENTS = registry.counter(
+    'vrae_recording_segments_total', 'Continuous recording segments by outcome', ('outcome',))
+PRUNED_BYTES = registry.counter(
+    'vrae_recording_pruned_bytes_total', 'Bytes deleted by the retention pruner', ('reason',))
+DISK_USAGE = registry.gauge(
+    'vrae_recording_disk_bytes', 'Disk used by continuous recordings at the last prune')
+
+# Fragmented MP4: one fragment per GOP, moov written before the first fragment
+MOVFLAGS = 'frag_keyframe+empty_moov+delay_moov+default_base_moof'
+INDEX_NAME = 'index.bin'
+SEGMENT_START = 1
+
+DEFAULT_RECORDING_SETTINGS = {
+    'continuous': False,        # record this device around the clock
+    'profile': 'high',
+    'segment_seconds': Config.RECORDING_SEGMENT_SECONDS
+}
+
+_BOX = struct.Struct('>I4s')
+_LARGE_SIZE = struct.Struct('>Q')
+
+
+def recordings_root():
+    return os.path.join(Config.RECORDINGS_DIR, 'continuous')
+
+
+def segment_name(segment):
+    return f"{segment:05d}.mp4"
+
+
+class SegmentIndex:
+    """Read side of a day's index: fixed-size records, memory-mapped and bisected.
+
+    Each record is ``(time_ms, offset, segment, flags)``: the wall-clock time
+    of a keyframe, the byte offset of the fMP4 fragment it starts in segment
+    file ``segment`` and ``SEGMENT_START`` on a segment's first fragment
+    (whose offset is also the size of the segment's init section). Records
+    are only appended, in time order, so a lookup is a binary search over the
+    mapped file and never reads more than O(log n) records.
+    """
+    RECORD = struct.Struct('<qQII')
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._count = 0
+
+    def __enter__(self):
+        try:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                # A record being appended right now is not visible yet
+                self._count = size // self.RECORD.size
+                if self._count:
+                    self._map = mmap.mmap(f.fileno(), self._count * self.RECORD.size, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            self._count = 0
+        return self
+
+    def __exit__(self, *exc):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """Record ``index`` as a tuple; also what ``bisect`` compares on (time first)."""
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self.RECORD.unpack_from(self._map, index * self.RECORD.size)
+
+    def find(self, time_ms):
+        """Index of the last record at or before ``time_ms``, or None."""
+        index = bisect.bisect_right(self, (time_ms, 2 ** 64)) - 1
+        return index if index >= 0 else None
+
+    def segment_start(self, index):
+        """Index of the first record of the segment that record ``index`` belongs to."""
+        # Segment numbers only grow through a day's index: bisect on them like on time
+        segment = self[index][2]
+        low = 0
+        while low < index:
+            middle = (low + index) // 2
+            if self[middle][2] < segment:
+                low = middle + 1
+            else:
+                index = middle
+        return index
+
+    def segments(self, start_ms, end_ms):
+        """Segments overlapping ``[start_ms, end_ms)``, each as a dict.
+
+        ``end_ms`` is where the next segment starts; for the newest segment
+        it is the start of its last indexed fragment.
+        """
+        first = self.find(start_ms)
+        first = 0 if first is None else self.segment_start(first)
+        stop = bisect.bisect_left(self, (end_ms,))
+        segments = []
+        for index in range(first, min(stop, self._count)):
+            time_ms, offset, segment, flags = self[index]
+            if segments:
+                segments[-1]['end_ms'] = time_ms
+                if segments[-1]['segment'] == segment:
+                    continue
+            segments.append({'segment': segment, 'start_ms': time_ms, 'end_ms': time_ms,
+                             'init_size': offset if flags & SEGMENT_START else None})
+        return segments
+
+    @staticmethod
+    def append(fd, time_ms, offset, segment, flags=0):
+        os.write(fd, SegmentIndex.RECORD.pack(time_ms, offset, segment, flags))
+
+
+class FragmentSink:
+    """File-like target for the muxer that notes where each top-level 'moof' box starts.
+
+    Offsets come from the bytes actually written, so they stay exact however
+    the muxer buffers or delays its header.
+    """
+
+    def __init__(self, f):
+        self._file = f
+        self.offset = 0
+        self.fragments = deque()
+        self._next = 0
+        self._header = b''
+
+    def write(self, data):
+        self._file.write(data)
+        view = memoryview(data)
+        end = self.offset + len(view)
+        while self._next < end:
+            need = 8 if len(self._header) < 8 else 16
+            start = self._next + len(self._header) - self.offset
+            self._header += bytes(view[start:start + need - len(self._header)])
+            if len(self._header) < need:
+                break
+            size, kind = _BOX.unpack_from(self._header)
+            if size == 1:
+                if need == 8:
+                    continue
+                size = _LARGE_SIZE.unpack_from(self._header, 8)[0]
+            if size < 8:
+                # Box runs to the end of the file (or garbage): nothing more to find
+                self._next = float('inf')
+                break
+            if kind == b'moof':
+                self.fragments.append(self._next)
+            self._next += size
+            self._header = b''
+        self.offset = end
+        return len(view)
+
+    def flush(self):
+        self._file.flush()
+
+
+class SegmentRecorder:
+    """Records one camera around the clock into fixed-length fMP4 segments.
+
+    Packets arrive in the camera's reader thread from a ``CaptureHub`` packet
+    listener and are only queued there; the recorder's own writer thread
+    remuxes them, without decoding, to ``<device>/<YYYY-MM-DD>/<segment>.mp4``.
+    A new segment starts at the first keyframe after ``segment_seconds``,
+    after a gap in the stream and at midnight. Every fragment start is
+    appended to the day's ``index.bin`` as soon as the muxer writes it. When
+    the disk falls ``max_packets`` behind, packets are dropped up to the next
+    keyframe, where a new segment starts, so the reader never waits.
+    """
+
+    def __init__(self, device_id, settings=None, max_packets=Config.RECORDING_WRITER_QUEUE):
+        self.device_id = device_id
+        self.settings = dict(DEFAULT_RECORDING_SETTINGS, **(settings or {}))
+        self.profile = self.settings['profile']
+        self.segment_seconds = self.settings['segment_seconds']
+        self.directory = os.path.join(recordings_root(), str(device_id))
+        self.max_packets = max_packets
+        self._queue = queue.SimpleQueue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._dropping = False
+        self._source = None
+        self._template = None
+        self._thread = None
+        self._task = None
+        self._stopped = False
+        self._day = None
+        self._index_fd = None
+        self._segment = None
+        self._output = None
+        self._stream = None
+        self._file = None
+        self._sink = None
+        self._origin = None
+        self._started = None
+        self._last_wall = None
+        self._keyframes = deque()
+        self._segment_first = True
+        self._written = RECORDING_BYTES.labels(str(device_id))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{self.device_id}", daemon=True)
+        self._thread.start()
+        self._task = asyncio.ensure_future(self._connect())
+
+    async def _connect(self):
+        # The hub's reader reconnects by itself once live; only the first open is retried here
+        backoff = Backoff()
+        while not self._stopped:
+            try:
+                await CaptureHub.add_packet_listener(self.device_id, self._on_packet, self.profile)
+                logging.info(f"Continuous recording started for device {self.device_id}")
+                return
+            except Exception as e:
+                delay = backoff.next()
+                logging.warning(f"Recorder for device {self.device_id}: {str(e)}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def stop(self):
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+        CaptureHub.remove_packet_listener(self.device_id, self._on_packet, self.profile)
+        # The writer thread finishes the queued packets, then closes the segment and the index
+        self._queue.put(None)
+
+    def join(self, timeout=10):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def recording(self):
+        return self._output is not None
+
+    def _on_packet(self, packet, stream):
+        # Reader thread: nothing here may wait on the writer or the disk
+        if self._stopped:
+            return
+        now = time.time()
+        if stream is not self._source:
+            # New reader session. The reader may close its stream at any time, so
+            # the writer copies codec parameters from one held by an in-memory container
+            self._source = stream
+            self._template = av.open(io.BytesIO(), 'w', format='mp4').add_stream(template=stream)
+        with self._pending_lock:
+            resync = False
+            if self._dropping and packet.is_keyframe and self._pending < self.max_packets // 2:
+                self._dropping = False
+                resync = True
+            elif not self._dropping and self._pending >= self.max_packets:
+                self._dropping = True
+                logging.warning(f"Recording of device {self.device_id} is behind, dropping to the next keyframe")
+            if self._dropping:
+                return
+            self._pending += 1
+        self._queue.put((packet, self._template, now, resync))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                logging.error(f"Recording of device {self.device_id} failed: {str(e)}")
+                self._close_segment(failed=True)
+            finally:
+                with self._pending_lock:
+                    self._pending -= 1
+        self._close_segment()
+        if self._index_fd is not None:
+            os.close(self._index_fd)
+            self._index_fd = None
+
+    def _write(self, packet, stream, now, resync):
+        # Writer thread
+        gap = resync or self._last_wall is not None and now - self._last_wall > Config.RECORDING_GAP_SECONDS
+        self._last_wall = now
+        if gap and self._output is not None:
+            logging.info(f"Recording of device {self.device_id}: stream gap, closing segment")
+            self._close_segment()
+
+        if packet.is_keyframe and (
+            self._output is None
+            or now - self._started >= self.segment_seconds
+            or date.fromtimestamp(now).isoformat() != self._day
+        ):
+            self._close_segment()
+            self._open_segment(stream, now)
+        if self._output is None:
+            # Waiting for a keyframe to start on
+            return
+
+        try:
+            if self._origin is None:
+                self._origin = packet.pts
+            if packet.is_keyframe:
+                self._keyframes.append(int(now * 1000))
+            self._output.mux(rebased_copy(packet, self._stream, self._origin))
+            self._index_fragments()
+        except Exception as e:
+            logging.error(f"Recording of device {self.device_id} failed: {str(e)}")
+            self._close_segment(failed=True)
+
+    def _open_segment(self, stream, now):
+        day = date.fromtimestamp(now).isoformat()
+        directory = os.path.join(self.directory, day)
+        try:
+            if day != self._day:
+                os.makedirs(directory, exist_ok=True)
+                if self._index_fd is not None:
+                    os.close(self._index_fd)
+                index_path = os.path.join(directory, INDEX_NAME)
+                with SegmentIndex(index_path) as index:
+                    # Continue the numbering after a restart
+                    self._segment = index[-1][2] if len(index) else -1
+                self._index_fd = os.open(index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._day = day
+
+            self._segment += 1
+            self._file = open(os.path.join(directory, segment_name(self._segment)), 'wb')
+            self._sink = FragmentSink(self._file)
+            self._output = av.open(self._sink, 'w', format='mp4', options={'movflags': MOVFLAGS})
+            self._stream = self._output.add_stream(template=stream)
+        except Exception as e:
+            logging.error(f"Could not open recording segment for device {self.device_id}: {str(e)}")
+            self._close_segment(failed=True)
+            return
+        self._started = now
+        self._origin = None
+        self._keyframes.clear()
+        self._segment_first = True
+
+    def _index_fragments(self):
+        # The muxer writes a fragment when the next keyframe (or the trailer) arrives; pair them in order
+        while self._sink.fragments and self._keyframes:
+            offset = self._sink.fragments.popleft()
+            SegmentIndex.append(
+                self._index_fd, self._keyframes.popleft(), offset, self._segment,
+                SEGMENT_START if self._segment_first else 0
+            )
+            self._segment_first = False
+
+    def _close_segment(self, failed=False):
+        if self._output is None and self._file is None:
+            return
+        try:
+            if self._output is not None:
+                self._output.close()
+                self._index_fragments()
+        except Exception as e:
+            logging.error(f"Closing recording segment for device {self.device_id} failed: {str(e)}")
+            failed = True
+        finally:
+            if self._file is not None:
+                self._file.close()
+            if self._sink is not None:
+                self._written.inc(self._sink.offset)
+            self._output = self._stream = self._file = self._sink = None
+        RECORDING_SEGMENTS.labels('failed' if failed else 'written').inc()
+
+    def stats(self):
+        return {'day': self._day, 'segment': self._segment, 'recording': self.recording}
+
+
+class RetentionPruner:
+    """Deletes the oldest recordings: whole days past the retention period,
+    then single segments, oldest first across all devices, while usage is
+    over the quota or free space under the minimum.
+
+    Sizes of past days are cached between runs; only today's directories are
+    scanned every time. The segment being written is never deleted.
+    """
+
+    def __init__(self, root=None, retention_days=Config.RECORDING_RETENTION_DAYS,
+                 quota=Config.RECORDING_QUOTA_BYTES, min_free=Config.RECORDING_MIN_FREE_BYTES,
+                 interval=Config.RECORDING_PRUNE_INTERVAL):
+        self.root = root or recordings_root()
+        self.retention_days = retention_days
+        self.quota = quota
+        self.min_free = min_free
+        self.interval = interval
+        self._sizes = {}
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.prune)
+            except Exception as e:
+                logging.error(f"Recording pruner failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def _over(self, usage):
+        if self.quota and usage > self.quota:
+            return True
+        if self.min_free and os.path.isdir(self.root):
+            return shutil.disk_usage(self.root).free < self.min_free
+        return False
+
+    def _days(self):
+        """``{day: [day directory of each device]}``."""
+        days = {}
+        if not os.path.isdir(self.root):
+            return days
+        for device in os.scandir(self.root):
+            if not device.is_dir():
+                continue
+            for day in os.scandir(device.path):
+                if day.is_dir():
+                    days.setdefault(day.name, []).append(day.path)
+        return days
+
+    def _size(self, path, cache):
+        if cache and path in self._sizes:
+            return self._sizes[path]
+        size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        if cache:
+            self._sizes[path] = size
+        return size
+
+    def _remove_day(self, path, reason):
+        size = self._size(path, cache=False)
+        shutil.rmtree(path, ignore_errors=True)
+        self._sizes.pop(path, None)
+        PRUNED_BYTES.labels(reason).inc(size)
+        logging.info(f"Pruned recordings in {path} ({size} bytes, {reason})")
+        return size
+
+    def prune(self):
+        today = date.today().isoformat()
+        cutoff = (date.today() - timedelta(days=self.retention_days)).isoformat()
+        days = self._days()
+
+        usage = 0
+        for day in sorted(days):
+            if self.retention_days and day < cutoff:
+                for path in days.pop(day):
+                    self._remove_day(path, 'retention')
+                continue
+            usage += sum(self._size(path, cache=day != today) for path in days[day])
+
+        for day in sorted(days):
+            if not self._over(usage):
+                break
+            usage -= self._prune_day(day, days[day], usage, keep_newest=day == today)
+        DISK_USAGE.set(usage)
+
+    def _prune_day(self, day, paths, usage, keep_newest):
+        segments = []
+        for path in paths:
+            names = sorted(entry.name for entry in os.scandir(path) if entry.name.endswith('.mp4'))
+            if keep_newest:
+                names = names[:-1]
+            segments.extend((os.path.getmtime(os.path.join(path, name)), path, name) for name in names)
+        segments.sort()
+
+        freed = 0
+        for _, path, name in segments:
+            if not self._over(usage - freed):
+                break
+            file = os.path.join(path, name)
+            size = os.path.getsize(file)
+            os.remove(file)
+            freed += size
+            if path in self._sizes:
+                self._sizes[path] -= size
+        PRUNED_BYTES.labels('quota').inc(freed)
+        if freed:
+            logging.info(f"Pruned {freed} bytes of recordings from {day} for the disk quota")
+
+        if not keep_newest:
+            # A day with no segments left only holds its index
+            for path in paths:
+                if not any(entry.name.endswith('.mp4') for entry in os.scandir(path)):
+                    freed += self._remove_day(path, 'quota')
+        return freed
+
+
+class Recordings:
+    """Running continuous recorders and the pruner, plus lookups over the index."""
+    _recorders = {}
+    pruner = RetentionPruner()
+
+    @classmethod
+    def start(cls, device_id, settings=None):
+        recorder = cls._recorders.get(str(device_id))
+        if recorder is None:
+            recorder = SegmentRecorder(device_id, settings)
+            cls._recorders[str(device_id)] = recorder
+            recorder.start()
+        return recorder
+
+    @classmethod
+    def stop(cls, device_id):
+        recorder = cls._recorders.pop(str(device_id), None)
+        if recorder is not None:
+            recorder.stop()
+
+    @classmethod
+    async def start_all(cls):
+        for device in await Device.get_all_devices():
+            recording = (device.get('settings') or {}).get('recording') or {}
+            if recording.get('continuous'):
+                cls.start(device['id'], recording)
+        cls.pruner.start()
+        logging.info(f"Continuous recorders running: {len(cls._recorders)}")
+
+    @classmethod
+    async def stop_all(cls):
+        recorders = list(cls._recorders.values())
+        for device_id in list(cls._recorders):
+            cls.stop(device_id)
+        # Joining the writers waits for open segments to be finalized
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, recorder.join) for recorder in recorders))
+        await cls.pruner.stop()
+
+    @staticmethod
+    def _day_dir(device_id, day):
+        return os.path.join(recordings_root(), str(device_id), day)
+
+    @classmethod
+    def segments(cls, device_id, start, end):
+        """Segments of ``device_id`` overlapping ``[start, end)`` (naive local datetimes)."""
+        start_ms, end_ms = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+        segments = []
+        day = start.date()
+        while day <= end.date():
+            directory = cls._day_dir(device_id, day.isoformat())
+            with SegmentIndex(os.path.join(directory, INDEX_NAME)) as index:
+                for segment in index.segments(start_ms, end_ms):
+                    name = segment_name(segment['segment'])
+                    if os.path.exists(os.path.join(directory, name)):
+                        segments.append(dict(segment, day=day.isoformat(), name=name))
+            day += timedelta(days=1)
+        return segments
+
+    @classmethod
+    def seek(cls, device_id, at):
+        """Segment and byte offset of the fragment containing ``at``, or None."""
+        time_ms = int(at.timestamp() * 1000)
+        # A segment can start just before midnight: look at the previous day too
+        for day in (at.date(), at.date() - timedelta(days=1)):
+            directory = cls._day_dir(device_id, day.isoformat())
+            with SegmentIndex(os.path.join(directory, INDEX_NAME)) as index:
+                found = index.find(time_ms)
+                if found is None:
+                    continue
+                found_ms, offset, segment, _ = index[found]
+                init_size = index[index.segment_start(found)][1]
+                following = index[found + 1] if found + 1 < len(index) else None
+            name = segment_name(segment)
+            try:
+                # The segment's last write is where its last fragment ends
+                end_ms = os.stat(os.path.join(directory, name)).st_mtime * 1000
+            except OSError:
+                return None
+            if following is not None:
+                end_ms = following[0] if following[2] == segment else min(end_ms, following[0])
+            elif cls._writing(device_id, day.isoformat(), segment):
+                # Still being written (and possibly still buffered): runs up to now
+                end_ms = max(end_ms, time.time() * 1000)
+            if time_ms >= end_ms:
+                # Between segments (camera down, recording stopped): nothing contains it
+                return None
+            return {
+                'day': day.isoformat(),
+                'name': name,
+                'segment': segment,
+                'offset': offset,
+                'init_size': init_size,
+                'time_ms': found_ms
+            }
+        return None
+
+    @classmethod
+    def _writing(cls, device_id, day, segment):
+        recorder = cls._recorders.get(str(device_id))
+        if recorder is None:
+            return False
+        stats = recorder.stats()
+        return stats['recording'] and stats['day'] == day and stats['segment'] == segment
+
+    @classmethod
+    def segment_path(cls, device_id, day, name):
+        return os.path.join(cls._day_dir(device_id, day), name)
+
+    @classmethod
+    def metrics(cls):
+        recording = Metric('gauge', 'vrae_recording_active', 'Continuous recorders writing a segment', ('device',))
+        for device_id, recorder in list(cls._recorders.items()):
+            recording.labels(device_id).set(int(recorder.recording))
+        return [recording]
+
+
+registry.collector(Recordings.metrics)
@@ -1,28 +1,38 @@
-from quart import request, jsonify, Response, websocket
+from quart import request, jsonify, Response, websocket, send_file
 from quart_auth import login_required, current_user
 from . import app
 from functools import wraps
 import jwt
 import logging
 from .models import User, LoginLog, Device
-from .stream import StreamManager  # Import StreamManager first
-from .webrtc_stream import VideoStreamTrack
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
+from .auth import token_verifier, login_limiter, HasherBusy
+from .stream import get_stream_response, get_stop_stream_response, get_stream_manager
+from .capture_hub import CaptureHub
+from .quality import QualityController, default_profile
+from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer, RTCRtpSender
 from .camera_manager import CameraManager
+from .probe import ProbeError
+from .discovery import discovery
+from .clips import EventRecorders, REASONS, events_dir
+from .recording import Recordings
+from .events import DetectionStore
+from .access_log import redact
+from .config import Config
+from .metrics import Metric, registry
+import asyncio
+import os
+import re
+import time
+from datetime import datetime, timedelta
 
 # Define RTCConfiguration no início do arquivo, após os imports
-rtc_configuration = RTCConfiguration([
-    RTCIceServer(urls=["stun:stun.l.google.com:19302"])
-])
-
-# Create StreamManager instance after import
-stream_manager = StreamManager()
+ice_urls = [url.strip() for url in Config.ICE_SERVERS.split(',') if url.strip()]
+rtc_configuration = RTCConfiguration([RTCIceServer(urls=ice_urls)] if ice_urls else [])
 
 def token_required(f):
     @wraps(f)
     async def decorated(*args, **kwargs):
         try:
-            logging.debug("Entering token_required decorator")
             token = request.headers.get('Authorization')
             
             if not token:
@@ -33,13 +43,15 @@ def token_required(f):
             if token.startswith('Bearer '):
                 token = token.split(' ')[1]
             
-            logging.debug(f"Decoding token: {token}")
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            # Cached claims, exp and revocation checks; no DB hit on the common path
+            data = await token_verifier.verify(token)
             
             # Add user data to kwargs instead of positional args
             kwargs['user_data'] = data
             return await f(*args, **kwargs)
             
+        except jwt.ExpiredSignatureError:
+            return jsonify({'message': 'Token expirado'}), 401
         except jwt.InvalidTokenError as e:
             logging.error(f"Token validation error: {str(e)}")
             return jsonify({'message': 'Token inválido'}), 401
@@ -55,25 +67,29 @@ async def login():
     app.logger.info("Entering /login route")
     try:
         auth = await request.get_json()
-        app.logger.debug(f"Received login request: {auth}")
+        app.logger.debug(f"Received login request for {(auth or {}).get('username')}")
 
         if not auth or not auth.get('username') or not auth.get('password'):
             return jsonify({'message': 'Dados inválidos!'}), 401
 
+        # Throttle failed attempts per username and per client before hashing
+        limit_keys = (f"user:{auth['username']}", f"ip:{request.remote_addr}")
+        if not login_limiter.allowed(*limit_keys):
+            return jsonify({'message': 'Muitas tentativas, tente novamente mais tarde!'}), 429
+
         user = await User.get_by_username(auth['username'])
         if not user:
+            login_limiter.failed(*limit_keys)
             return jsonify({'message': 'Usuário não encontrado!'}), 401
 
-        if not user.check_password(auth['password']):
+        if not await user.check_password(auth['password']):
+            login_limiter.failed(*limit_keys)
             return jsonify({'message': 'Senha incorreta!'}), 401
 
-        # Gerar o token
-        token = jwt.encode({
-            'id': user.id,  # Agora user.id existe
-            'username': user.username
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        # Gerar o token (com exp e jti para expiração e revogação)
+        token = token_verifier.issue(user)
         
-        app.logger.debug(f"Token generated for user {user.username}: {token}")
+        app.logger.debug(f"Token generated for user {user.username}")
 
         # Registrar o login
         await LoginLog.add_log(user.id, token)  # Tornar add_log async também
@@ -83,11 +99,27 @@ async def login():
             'message': 'Login realizado com sucesso!'
         }), 200
 
+    except HasherBusy:
+        return jsonify({'message': 'Servidor ocupado, tente novamente!'}), 503
     except Exception as e:
         app.logger.error(f"Error in login route: {str(e)}")
         return jsonify({'message': 'Erro interno!'}), 500
 
 
+@app.route('/logout', methods=['POST'])
+@token_required
+async def logout(user_data):
+    try:
+        token = request.headers.get('Authorization', '')
+        if token.startswith('Bearer '):
+            token = token.split(' ')[1]
+        await token_verifier.revoke(token, user_data)
+        return jsonify({'message': 'Logout realizado com sucesso!'}), 200
+    except Exception as e:
+        app.logger.error(f"Error in logout route: {str(e)}")
+        return jsonify({'message': 'Erro interno!'}), 500
+
+
 @app.route('/protected', methods=['POST'])
 @token_required
 def protected_route(current_user):
@@ -105,7 +137,7 @@ async def register():
     app.logger.info("Entering /register route")
     try:
         auth = await request.get_json()
-        app.logger.debug(f"Received register request: {auth}")
+        app.logger.debug(f"Received register request for {(auth or {}).get('username')}")
 
         if not auth or not auth.get('username') or not auth.get('password'):
             app.logger.warning("Register data is missing!")
@@ -123,62 +155,134 @@ async def register():
         else:
             return jsonify({'message': 'Erro ao adicionar!'}), 401
 
+    except HasherBusy:
+        return jsonify({'message': 'Servidor ocupado, tente novamente!'}), 503
     except Exception as e:
         app.logger.error(f"Error in register route: {str(e)}")
         return jsonify({'message': 'Erro interno!'}), 500
 
 
+def mjpeg_args():
+    """``width`` and ``jpeg_quality`` query arguments; None if either is out of range."""
+    width = request.args.get('width', type=int)
+    quality = request.args.get('jpeg_quality', type=int)
+    if (width is not None and width <= 0) or (quality is not None and not 1 <= quality <= 100):
+        return None
+    return {'width': width, 'quality': quality}
+
+
 @app.route('/streaming')
 @login_required
 async def streaming_route():
     """Video streaming route."""
-    return Response(
-        await stream_manager.generate_frames(),
-        mimetype='multipart/x-mixed-replace; boundary=frame',
-        headers={
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'Pragma': 'no-cache',
-            'Expires': '0',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, OPTIONS'
-        }
-    )
+    options = mjpeg_args()
+    if options is None:
+        return jsonify({'message': 'width must be positive and jpeg_quality between 1 and 100'}), 400
+    return get_stream_response(profile=request.args.get('quality', 'high'), **options)
 
 
-@app.route('/stop_streaming', methods=['POST'])
+@app.route('/streaming/<int:device_id>')
 @token_required
-def stop_streaming_route(current_user):
-    return get_stop_stream_response(current_user)
+async def device_streaming_route(device_id, user_data):
+    """MJPEG stream of one device; ?quality=high|medium|low, &width=, &jpeg_quality=."""
+    options = mjpeg_args()
+    if options is None:
+        return jsonify({'message': 'width must be positive and jpeg_quality between 1 and 100'}), 400
+    devices = await Device.get_devices(user_id=user_data['id'])
+    if not any(device['id'] == device_id for device in devices):
+        return jsonify({'message': 'Device not found'}), 404
+    return get_stream_response(device_id, profile=request.args.get('quality', 'high'), **options)
+
+
+@app.route('/streaming/<int:device_id>/stats')
+@token_required
+async def streaming_stats_route(device_id, user_data):
+    devices = await Device.get_devices(user_id=user_data['id'])
+    if not any(device['id'] == device_id for device in devices):
+        return jsonify({'message': 'Device not found'}), 404
+    manager = get_stream_manager(device_id, create=False, profile=request.args.get('quality', 'high'))
+    if manager is None or manager.scheduler is None:
+        return jsonify({'message': 'Stream not active'}), 404
+    return jsonify(dict(
+        manager.scheduler.stats,
+        interval=manager.scheduler.interval,
+        latency_ms=round((manager.scheduler.latency or 0) * 1000, 1)
+    ))
 
 
-pcs = set()
+@app.route('/stop_streaming', methods=['POST'])
+@token_required
+async def stop_streaming_route(user_data):
+    data = await request.get_json(silent=True) or {}
+    device_id = data.get('device_id')
+    if device_id is not None:
+        # Without a device_id the local camera stream is stopped
+        try:
+            device_id = int(device_id)
+        except (TypeError, ValueError):
+            return jsonify({'message': 'device_id must be an integer'}), 400
+        devices = await Device.get_devices(user_id=user_data['id'])
+        if not any(device['id'] == device_id for device in devices):
+            return jsonify({'message': 'Device not found'}), 404
+    return get_stop_stream_response(device_id)
+
+
+OFFER_LATENCY = registry.histogram(
+    'vrae_offer_seconds', 'Time to answer a WebRTC offer', ('outcome',))
+
+
+@registry.collector
+def _peer_metrics():
+    peers = Metric('gauge', 'vrae_peer_connections', 'Open WebRTC peer connections', ('state',))
+    for state in ('new', 'connecting', 'connected', 'disconnected'):
+        peers.labels(state).set(0)
+    for pc in list(app.pc_pool):
+        peers.labels(pc.connectionState).inc()
+    return [peers]
+
+
+def force_codec(pc, sender, forced_codec):
+    kind = forced_codec.split('/')[0]
+    codecs = RTCRtpSender.getCapabilities(kind).codecs
+    transceiver = next(t for t in pc.getTransceivers() if t.sender == sender)
+    transceiver.setCodecPreferences(
+        [codec for codec in codecs if codec.mimeType == forced_codec]
+    )
 
 @app.route('/offer', methods=['POST'])
 @token_required
 async def offer(user_data):
     pc = None
-    video = None
+    quality = None
+    start = time.perf_counter()
     try:
         data = await request.get_json()
         device_id = data.get('device_id')
         if not device_id:
             return jsonify({"error": "No device_id provided"}), 400
 
-        logging.info(f"Creating WebRTC connection for device {device_id}")
+        # Grid views default to the low substream, single views to high
+        profile = default_profile(data)
+        logging.info(f"Creating WebRTC connection for device {device_id} ({profile})")
         
-        video = VideoStreamTrack(device_id=device_id)
-        await video.connect_to_camera()
+        # Every viewer of the same camera and profile shares a single capture
+        quality = QualityController(device_id, profile, auto=data.get('auto_quality', True))
+        video = await quality.subscribe()
 
         pc = RTCPeerConnection(configuration=rtc_configuration)
-        pc.addTrack(video)
+        sender = pc.addTrack(video)
+        if CaptureHub.is_passthrough(device_id, profile):
+            # Camera packets are forwarded as-is, so only H.264 can be negotiated
+            force_codec(pc, sender, 'video/H264')
         app.pc_pool.add(pc)
 
         @pc.on("connectionstatechange")
         async def on_connectionstatechange():
             logging.info(f"Connection state: {pc.connectionState}")
-            if pc.connectionState in ["failed", "closed"]:
-                if video:
-                    video.stop()
+            if pc.connectionState == "connected":
+                quality.start(sender)
+            elif pc.connectionState in ["failed", "closed"]:
+                quality.stop()
                 if pc in app.pc_pool:
                     app.pc_pool.discard(pc)
 
@@ -187,16 +291,19 @@ async def offer(user_data):
         
         answer = await pc.createAnswer()
         await pc.setLocalDescription(answer)
+        OFFER_LATENCY.labels('ok').observe(time.perf_counter() - start)
 
         return jsonify({
             "sdp": pc.localDescription.sdp,
-            "type": pc.localDescription.type
+            "type": pc.localDescription.type,
+            "profile": profile
         })
 
     except Exception as e:
         logging.error(f"Error in offer route: {str(e)}", exc_info=True)
-        if video:
-            video.stop()
+        OFFER_LATENCY.labels('error').observe(time.perf_counter() - start)
+        if quality:
+            quality.stop()
         if pc:
             await pc.close()
         return jsonify({"error": str(e)}), 500
@@ -216,17 +323,18 @@ async def list_devices(user_data):  # Added user_data parameter
 async def add_device(user_data):  # Now accepts user_data from token_required
     try:
         data = await request.get_json()
-        logging.debug(f"Received device data: {data}")
+        logging.debug(f"Received device data: {redact(data)}")
         
-        # Initialize camera manager and test connection
+        # Probe the stream metadata; bounded and never blocks the event loop
         camera_manager = CameraManager()
-        connection_success = await camera_manager.connect_camera(data)
-        
-        if not connection_success:
-            return jsonify({'message': 'Failed to connect to camera'}), 400
+        try:
+            stream = await camera_manager.connect_camera(data)
+        except ProbeError as e:
+            return jsonify({'message': f'Failed to connect to camera: {str(e)}'}), 400
         
         # Add user_id from token to device data
         data['user_id'] = user_data.get('id')
+        data['settings'] = dict(data.get('settings') or {}, stream=stream)
         
         # Add device to database
         logging.info("Adding device to database")
@@ -234,53 +342,256 @@ async def add_device(user_data):  # Now accepts user_data from token_required
         
         return jsonify({
             'message': 'Device added successfully',
-            'device_id': result.get('device_id')
+            'device_id': result.get('device_id'),
+            'stream': stream
         }), 201
             
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         logging.error(f"Error in add_device: {str(e)}", exc_info=True)
         return jsonify({'message': str(e)}), 500
 
 
-@app.after_request
-async def after_request(response):
+@app.route('/devices/bulk', methods=['POST'])
+@token_required
+async def bulk_add_devices(user_data):
+    """Probe a list of devices concurrently and add the reachable ones.
+
+    Accepts a list of device objects or ``{"devices": [...], "dry_run": bool}``.
+    Every device gets its own result; one failure never aborts the import.
+    """
     try:
-        content_type = response.headers.get('Content-Type', '')
-        
-        log_data = {
-            'date_created': str(getattr(response, 'date', None)),
-            'module': request.path,
-            'payload': 'No JSON Payload',
-            'response': ''
-        }
-
-        # Skip binary responses
-        if 'image' in content_type or 'video' in content_type:
-            log_data['response'] = f'Binary data ({content_type})'
+        data = await request.get_json()
+        if isinstance(data, dict):
+            devices, dry_run = data.get('devices'), bool(data.get('dry_run'))
         else:
-            try:
-                response_data = await response.get_data()
-                if response_data:
-                    if 'application/json' in content_type:
-                        log_data['response'] = response_data.decode('utf-8')
-                    elif 'text' in content_type:
-                        log_data['response'] = response_data.decode('utf-8')
-            except Exception as e:
-                log_data['response'] = f'Error getting response data: {str(e)}'
+            devices, dry_run = data, False
+        if not isinstance(devices, list) or not devices:
+            return jsonify({'message': 'A non-empty list of devices is required'}), 400
+        if len(devices) > Config.BULK_IMPORT_MAX:
+            return jsonify({'message': f'At most {Config.BULK_IMPORT_MAX} devices per import'}), 400
+
+        results = []
+        valid = []
+        for index, device in enumerate(devices):
+            result = {
+                'index': index,
+                'name': device.get('name') if isinstance(device, dict) else None,
+                'ip': device.get('ip') if isinstance(device, dict) else None
+            }
+            results.append(result)
+            if not isinstance(device, dict) or not device.get('protocol') or not device.get('ip'):
+                result.update(status='invalid', error='Protocol and IP are required fields')
+            else:
+                valid.append((result, device))
 
-        if request.is_json:
+        camera_manager = CameraManager()
+        probes = await camera_manager.connect_cameras([device for _, device in valid])
+
+        for (result, device), stream in zip(valid, probes):
+            if isinstance(stream, Exception):
+                result.update(status='unreachable', error=str(stream))
+                continue
+            result['stream'] = stream
+            if dry_run:
+                result['status'] = 'reachable'
+                continue
+            device['user_id'] = user_data.get('id')
+            device['settings'] = dict(device.get('settings') or {}, stream=stream)
             try:
-                json_data = await request.get_json()
-                log_data['payload'] = json_data
+                added = await Device.add_device(device)
+                result.update(status='added', device_id=added.get('device_id'))
             except Exception as e:
-                log_data['payload'] = f'Error parsing JSON: {str(e)}'
-            
-        app.logger.info(log_data)
-        
+                result.update(status='failed', error=str(e))
+
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        logging.info(f"Bulk import of {len(devices)} devices: {summary}")
+        return jsonify({'results': results, 'summary': summary}), 200
+
     except Exception as e:
-        app.logger.error(f"Error in after_request: {str(e)}")
-    
-    return response
+        logging.error(f"Error in bulk_add_devices: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Error importing devices'}), 500
+
+
+@app.route('/devices/discover', methods=['POST'])
+@token_required
+async def discover_devices(user_data):
+    """Scan a subnet for cameras; with ``save`` they are added as devices."""
+    try:
+        data = await request.get_json() or {}
+        subnet = data.get('subnet')
+        if not subnet:
+            return jsonify({'message': 'subnet is required'}), 400
+        username, password = data.get('username'), data.get('password')
+
+        cameras = await discovery.scan(subnet, username, password, refresh=bool(data.get('refresh')))
+        response = {'cameras': [discovery.public(camera) for camera in cameras]}
+        if data.get('save'):
+            response['results'] = await discovery.save(cameras, user_data.get('id'), username, password)
+        return jsonify(response), 200
+
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in discover_devices: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Error discovering devices'}), 500
+
+
+@app.route('/devices/<int:device_id>/clips', methods=['POST'])
+@token_required
+async def trigger_clip(device_id, user_data):
+    """Save an event clip around now, for devices with ``settings.recording.events`` on."""
+    try:
+        devices = await Device.get_devices(user_id=user_data['id'])
+        device = next((device for device in devices if device['id'] == device_id), None)
+        if device is None:
+            return jsonify({'message': 'Device not found'}), 404
+        recording = (device.get('settings') or {}).get('recording') or {}
+        if not recording.get('events'):
+            return jsonify({'message': 'Event recording is not enabled for this device'}), 409
+
+        data = await request.get_json(silent=True) or {}
+        reason = data.get('reason') or 'manual'
+        if reason not in REASONS:
+            return jsonify({'message': f"reason must be one of {', '.join(REASONS)}"}), 400
+        # Normally running since startup; a clip armed before anything is buffered starts with the stream
+        recorder = EventRecorders.get(device_id) or EventRecorders.start(device_id, recording)
+        clip = recorder.trigger(reason, data.get('label'))
+        return jsonify(clip.info()), 202
+    except Exception as e:
+        logging.error(f"Error triggering clip: {str(e)}")
+        return jsonify({'message': 'Error triggering clip'}), 500
+
+
+@app.route('/devices/<int:device_id>/clips', methods=['GET'])
+@token_required
+async def list_clips(device_id, user_data):
+    try:
+        devices = await Device.get_devices(user_id=user_data['id'])
+        if not any(device['id'] == device_id for device in devices):
+            return jsonify({'message': 'Device not found'}), 404
+
+        directory = events_dir(device_id)
+        clips = []
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.name.endswith('.mp4'):
+                    stat = entry.stat()
+                    clips.append({
+                        'name': entry.name,
+                        'size': stat.st_size,
+                        'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
+                    })
+        clips.sort(key=lambda clip: clip['name'], reverse=True)
+        recorder = EventRecorders.get(device_id)
+        return jsonify({'clips': clips, 'buffer': recorder.stats() if recorder else None})
+    except Exception as e:
+        logging.error(f"Error listing clips: {str(e)}")
+        return jsonify({'message': 'Error listing clips'}), 500
+
+
+@app.route('/devices/<int:device_id>/recordings', methods=['GET'])
+@token_required
+async def list_recordings(device_id, user_data):
+    """Continuous recording segments between ``start`` and ``end`` (default: last hour)."""
+    try:
+        devices = await Device.get_devices(user_id=user_data['id'])
+        if not any(device['id'] == device_id for device in devices):
+            return jsonify({'message': 'Device not found'}), 404
+
+        end = request.args.get('end')
+        end = datetime.fromisoformat(end) if end else datetime.now()
+        start = request.args.get('start')
+        start = datetime.fromisoformat(start) if start else end - timedelta(hours=1)
+        if (end - start).days > Config.RECORDING_RETENTION_DAYS + 1:
+            return jsonify({'message': 'Time range is too long'}), 400
+
+        loop = asyncio.get_running_loop()
+        segments = await loop.run_in_executor(None, Recordings.segments, device_id, start, end)
+        return jsonify(segments)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid date: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Error listing recordings: {str(e)}")
+        return jsonify({'message': 'Error listing recordings'}), 500
+
+
+@app.route('/devices/<int:device_id>/recordings/seek', methods=['GET'])
+@token_required
+async def seek_recording(device_id, user_data):
+    """Segment and byte offset of the fragment that contains time ``t``."""
+    try:
+        devices = await Device.get_devices(user_id=user_data['id'])
+        if not any(device['id'] == device_id for device in devices):
+            return jsonify({'message': 'Device not found'}), 404
+        at = request.args.get('t')
+        if not at:
+            return jsonify({'message': 't is required'}), 400
+
+        position = Recordings.seek(device_id, datetime.fromisoformat(at))
+        if position is None:
+            return jsonify({'message': 'No recording at that time'}), 404
+        return jsonify(position)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid date: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Error seeking recording: {str(e)}")
+        return jsonify({'message': 'Error seeking recording'}), 500
+
+
+@app.route('/devices/<int:device_id>/recordings/<day>/<name>', methods=['GET'])
+@token_required
+async def get_recording(device_id, day, name, user_data):
+    """One segment file; supports Range requests so players can start at a fragment offset."""
+    devices = await Device.get_devices(user_id=user_data['id'])
+    if not any(device['id'] == device_id for device in devices):
+        return jsonify({'message': 'Device not found'}), 404
+    if not re.fullmatch(r'\d{4}-\d{2}-\d{2}', day) or not re.fullmatch(r'\d{5}\.mp4', name):
+        return jsonify({'message': 'Invalid segment'}), 400
+
+    path = Recordings.segment_path(device_id, day, name)
+    if not os.path.exists(path):
+        return jsonify({'message': 'Segment not found'}), 404
+    return await send_file(path, mimetype='video/mp4', conditional=True)
+
+
+@app.route('/detections/counts', methods=['GET'])
+@token_required
+async def detection_counts(user_data):
+    """Detections per class per minute for one device, from the rollup table."""
+    try:
+        device_id = request.args.get('device_id', type=int)
+        if not device_id:
+            return jsonify({'message': 'device_id is required'}), 400
+
+        devices = await Device.get_devices(user_id=user_data['id'])
+        if not any(device['id'] == device_id for device in devices):
+            return jsonify({'message': 'Device not found'}), 404
+
+        end = request.args.get('end')
+        end = datetime.fromisoformat(end) if end else datetime.now()
+        start = request.args.get('start')
+        start = datetime.fromisoformat(start) if start else end - timedelta(hours=1)
+
+        counts = await DetectionStore.counts_per_minute(
+            device_id, start, end, request.args.get('class')
+        )
+        return jsonify(counts)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid date: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Error getting detection counts: {str(e)}")
+        return jsonify({'message': 'Error getting detection counts'}), 500
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus text exposition of every registered metric."""
+    return Response(registry.expose(), mimetype='text/plain; version=0.0.4')
+
 
 # Add this before app.run() or in your main block
 if __name__ == '__main__':
@@ -1,92 +1,218 @@
+import asyncio
 import cv2
-from ultralytics import YOLO
-from flask import Response, jsonify, stream_with_context
+from quart import Response, jsonify
 import logging
-from .models import User
-import json
+from .models import Device
+from .inference import draw_detections
+from .detection import DetectionScheduler
+from .frame_reader import FrameReader
+from .supervisor import FrameTimeout
+from .mjpeg import get_broadcaster
+from .events import DetectionStore
+from .clips import EventRecorders
 
 MAX_RETRIES = 10
 
+# Output size and JPEG quality per client profile; width None keeps the source size
+MJPEG_PROFILES = {
+    'high': {'width': None, 'quality': 85},
+    'medium': {'width': 960, 'quality': 70},
+    'low': {'width': 480, 'quality': 50}
+}
+
+# Output widths a client may ask for; each (width, quality) pair is one shared encoder
+MJPEG_WIDTHS = (320, 480, 640, 960, 1280, 1920)
+
+STREAM_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS'
+}
+
 
 class StreamManager:
-    def __init__(self, model_path='yolov8n.pt'):
-        self.model = YOLO(model_path)
-        self.camera = None
+    """Capture plus detection for one source, producing annotated BGR frames.
+
+    A device is read from its ``profile`` substream. With an explicit
+    ``source`` the device lookup is skipped and ``settings`` are used as
+    given; detection can be switched off with
+    ``settings['detection']['enabled'] = False``.
+    """
+    capture_factory = None
+
+    def __init__(self, device_id=None, settings=None, source=None, profile='high'):
+        self.device_id = device_id
+        self.settings = settings or {}
+        self.source = source
+        self.profile = profile
+        self.reader = None
+        self.scheduler = None
         self.logger = logging.getLogger(__name__)
         self.stream_active = False
 
+    @property
+    def name(self):
+        return 'local' if self.device_id is None else str(self.device_id)
+
+    async def _open(self):
+        source = self.source if self.source is not None else 0
+        if self.source is None and self.device_id is not None:
+            device = await Device.get_device(self.device_id)
+            if not device:
+                raise ValueError(f"No device found with id {self.device_id}")
+            source = Device.stream_url(device, self.profile)
+            self.settings = device.get('settings') or {}
+
+        self.reader = FrameReader(
+            source,
+            name=f"mjpeg-{self.name}",
+            # URLs go through FFmpeg so the open/read timeouts apply
+            api_preference=cv2.CAP_FFMPEG if isinstance(source, str) else cv2.CAP_ANY,
+            properties={cv2.CAP_PROP_BUFFERSIZE: 2},
+            capture_factory=self.capture_factory
+        )
+        await self.reader.start()
+        if not (self.settings.get('detection') or {}).get('enabled', True):
+            return
+        self.scheduler = DetectionScheduler(
+            self.settings.get('detection'),
+            name=self.name,
+            motion=self.settings.get('motion'),
+            on_detections=self._on_detections,
+            on_motion=self._on_motion
+        )
+
+    def _owns_events(self):
+        # Several profiles of one device may be streamed at once; one of them records its events
+        return self.device_id is not None and _event_owners.setdefault(self.device_id, self) is self
+
+    def _on_detections(self, detections):
+        # Only fresh model output is stored, not boxes carried between detections
+        if self._owns_events():
+            DetectionStore.record(self.device_id, detections)
+            EventRecorders.on_detections(self.device_id, detections)
+
+    def _on_motion(self):
+        if self._owns_events():
+            EventRecorders.on_motion(self.device_id)
+
     async def generate_frames(self):
+        """Async generator of annotated frames; capture runs in the reader thread."""
         self.stream_active = True
-        self.logger.info("Starting video stream")
-        
+        self.logger.info(f"Starting video stream for {self.name}")
+
         try:
-            if self.camera is None:
-                self.camera = cv2.VideoCapture(0)
-            
+            await self._open()
+            last_seq = 0
             while self.stream_active:
-                success, frame = self.camera.read()
-                if not success:
-                    break
-                    
-                results = self.model(frame)
-                annotated_frame = results[0].plot()
-                
-                ret, buffer = cv2.imencode('.jpg', annotated_frame)
-                if not ret:
+                try:
+                    last_seq, frame = await self.reader.read(last_seq)
+                except FrameTimeout:
+                    # Reconnecting: clients keep showing the last part they got
+                    continue
+
+                # Inference runs every Nth frame in the background, the last
+                # boxes are reused in between so the stream keeps its frame rate
+                if self.scheduler is None:
+                    yield frame
                     continue
-                    
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                       
+                detections = self.scheduler.update(frame)
+                yield draw_detections(frame, detections)
+
         except Exception as e:
-            self.logger.error(f"Stream error: {str(e)}")
+            self.logger.error(f"Stream error for {self.name}: {str(e)}")
         finally:
             self.stop_stream()
 
     def stop_stream(self):
         self.stream_active = False
-        if self.camera is not None:
-            self.camera.release()
-            self.camera = None
+        if _event_owners.get(self.device_id) is self:
+            del _event_owners[self.device_id]
+        if self.scheduler is not None:
+            self.scheduler.close()
+            self.scheduler = None
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
 
 
-stream_manager = StreamManager()
+_stream_managers = {}
+_event_owners = {}
 
 
-def get_stream_response(current_user):
-    """Rota de resposta para o stream de vídeo contínuo."""
-    logging.debug("Iniciando o fluxo de vídeo")
+def get_stream_manager(device_id=None, create=True, profile='high'):
+    # The local camera has no substreams
+    key = (device_id, profile if device_id is not None else None)
+    manager = _stream_managers.get(key)
+    if manager is None and create:
+        manager = StreamManager(device_id, profile=key[1] or 'high')
+        _stream_managers[key] = manager
+    return manager
+
+
+def encode_jpeg(frame, width=None, quality=80):
+    """Resize (down only) and encode one frame as a multipart JPEG part."""
+    if width and frame.shape[1] > width:
+        height = int(frame.shape[0] * width / frame.shape[1])
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ret:
+        return None
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+
+
+async def encode_frames(frames, width=None, quality=80):
+    """Encode an async iterator of frames in a worker thread, one part per frame."""
+    loop = asyncio.get_running_loop()
+    async for frame in frames:
+        chunk = await loop.run_in_executor(None, encode_jpeg, frame, width, quality)
+        if chunk:
+            yield chunk
 
-    def generate():
-        try:
-            for frame in stream_manager.generate_frames():
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        except Exception as e:
-            logging.error(f"Erro no generate: {str(e)}")
-            yield b''
 
-    response = Response(
-        generate(),
-        mimetype='multipart/x-mixed-replace; boundary=frame'
+def mjpeg_options(profile, width=None, quality=None):
+    """Output width and JPEG quality of a request, snapped to a small set of encoders."""
+    options = dict(MJPEG_PROFILES[profile])
+    if width:
+        # Largest allowed width within the request; frames are never scaled up anyway
+        options['width'] = max([w for w in MJPEG_WIDTHS if w <= width] or MJPEG_WIDTHS[:1])
+    if quality:
+        options['quality'] = min(100, max(5, round(quality / 5) * 5))
+    return options
+
+
+def get_stream_response(device_id=None, profile='high', width=None, quality=None):
+    """MJPEG response for ``device_id`` at the requested profile.
+
+    One capture of the profile's substream and one detection run are shared
+    per device and profile, and one JPEG encode per (width, quality); every
+    client reads the newest encoded part.
+    """
+    logging.debug(f"Iniciando o fluxo de vídeo para {device_id} ({profile})")
+    if profile not in MJPEG_PROFILES:
+        profile = 'high'
+    options = mjpeg_options(profile, width, quality)
+    manager = get_stream_manager(device_id, profile=profile)
+    frames = get_broadcaster(('frames', device_id, manager.profile), manager.generate_frames)
+    encoded = get_broadcaster(
+        ('mjpeg', device_id, manager.profile, options['width'], options['quality']),
+        lambda: encode_frames(frames.subscribe(), options['width'], options['quality'])
     )
-    
-    response.headers.update({
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        'Cache-Control': 'no-cache, no-store, must-revalidate',
-        'Pragma': 'no-cache',
-        'Expires': '0',
-        'Connection': 'close'
-    })
-    
-    return response
-
-
-def get_stop_stream_response(current_user):
+
+    return Response(
+        encoded.subscribe(),
+        mimetype='multipart/x-mixed-replace; boundary=frame',
+        headers=STREAM_HEADERS
+    )
+
+
+def get_stop_stream_response(device_id=None):
     """Rota para interromper o streaming de vídeo."""
-    logging.debug(f"User {current_user.username} acessando /stop_streaming")
-    stream_manager.stop_streaming()
+    logging.debug(f"Interrompendo o streaming de {device_id}")
+    for key, manager in list(_stream_managers.items()):
+        if key[0] == device_id:
+            manager.stop_stream()
     return jsonify({"message": "Streaming encerrado."}), 200
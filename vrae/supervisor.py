@@ -0,0 +1,115 @@
+import logging
+import random
+import time
+import weakref
+from .config import Config
+from .metrics import Metric, registry
+
+CONNECTING = 'connecting'
+LIVE = 'live'
+DEGRADED = 'degraded'
+DOWN = 'down'
+STATES = (CONNECTING, LIVE, DEGRADED, DOWN)
+
+_supervisors = weakref.WeakSet()
+
+
+class FrameTimeout(RuntimeError):
+    """Nothing new arrived within the read timeout; the source may still recover."""
+
+
+class Backoff:
+    """Exponential backoff with jitter: half the delay is fixed, half random."""
+
+    def __init__(self, base=Config.CAMERA_BACKOFF_BASE, cap=Config.CAMERA_BACKOFF_MAX, factor=2.0):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.attempt = 0
+
+    def next(self):
+        delay = min(self.cap, self.base * self.factor ** self.attempt)
+        self.attempt += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ConnectionSupervisor:
+    """Keeps one camera connection alive from its reader thread.
+
+    ``run(session)`` calls ``session()`` until the reader is stopped. A session
+    opens the source, calls ``live()`` once media flows and raises when the
+    connection breaks; the supervisor then sleeps a jittered, exponentially
+    growing delay and starts a new one. The state goes connecting -> live on
+    the first frame, live -> degraded on a failure and degraded (or
+    connecting) -> down once nothing has flowed for ``down_after`` seconds.
+    Retries never stop while the reader is running.
+    """
+
+    def __init__(self, name, stop_event, backoff=None, down_after=Config.CAMERA_DOWN_AFTER):
+        self.name = name
+        self.stop_event = stop_event
+        self.backoff = backoff or Backoff()
+        self.down_after = down_after
+        self.state = CONNECTING
+        self.error = None
+        self.failures = 0
+        self.reconnects = 0
+        self._since = time.monotonic()
+        _supervisors.add(self)
+
+    def _set(self, state):
+        if state != self.state:
+            logging.info(f"Camera {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    def live(self):
+        """Called by the session once media is flowing."""
+        if self.failures:
+            self.reconnects += 1
+        self.failures = 0
+        self.error = None
+        self.backoff.reset()
+        self._set(LIVE)
+
+    def failed(self, error):
+        now = time.monotonic()
+        if self.state == LIVE:
+            self._since = now
+        self.failures += 1
+        self.error = str(error)
+        if now - self._since >= self.down_after:
+            self._set(DOWN)
+        elif self.state == LIVE:
+            self._set(DEGRADED)
+
+    def run(self, session):
+        while not self.stop_event.is_set():
+            try:
+                session()
+                return
+            except Exception as e:
+                if self.stop_event.is_set():
+                    return
+                self.failed(e)
+                delay = self.backoff.next()
+                logging.warning(
+                    f"Camera {self.name} {self.state}: {self.error}; retrying in {delay:.1f}s"
+                )
+                if self.stop_event.wait(delay):
+                    return
+
+
+@registry.collector
+def _supervisor_metrics():
+    states = Metric('gauge', 'vrae_camera_state', 'Current connection state per camera reader', ('camera', 'state'))
+    reconnects = Metric('counter', 'vrae_camera_reconnects_total', 'Successful camera reconnections', ('camera',))
+    for supervisor in list(_supervisors):
+        if supervisor.stop_event.is_set():
+            continue
+        for state in STATES:
+            states.labels(supervisor.name, state).set(int(supervisor.state == state))
+        reconnects.labels(supervisor.name).value = supervisor.reconnects
+    return [states, reconnects]
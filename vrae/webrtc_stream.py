@@ -4,71 +4,131 @@ import cv2
 import fractions
 from aiortc import MediaStreamTrack
 from av import VideoFrame
-from ultralytics import YOLO
 import logging
 import platform
 from .camera_manager import CameraManager
+from .frame_reader import FrameReader
+from .enhance import EnhancementPipeline
+from .packet_reader import PacketReader
 from .models import Device
+from .metrics import registry
+from .supervisor import FrameTimeout, DOWN
+from .config import Config
 import subprocess
 import time
 from aiortc.mediastreams import AUDIO_PTIME, MediaStreamError
 from fractions import Fraction
 import numpy as np
 
+TRACK_FRAMES = registry.counter(
+    'vrae_track_frames_total', 'Frames delivered to WebRTC', ('device', 'profile'))
+TRACK_DROPPED = registry.counter(
+    'vrae_track_dropped_frames_total', 'Captured frames overwritten before recv read them', ('device', 'profile'))
+TRACK_RECONNECTS = registry.counter(
+    'vrae_track_reconnects_total', 'Camera reconnections made by a track', ('device', 'profile'))
+TRACK_STALLED = registry.counter(
+    'vrae_track_stalled_frames_total', 'Repeated or placeholder frames sent while a camera reconnects', ('device', 'profile'))
+CAPTURE_FPS = registry.gauge(
+    'vrae_capture_fps', 'Frames per second read from the camera', ('device', 'profile'))
+FRAME_STAGE = registry.histogram(
+    'vrae_frame_stage_seconds', 'Per-frame latency by pipeline stage', ('device', 'profile', 'stage'))
+
+FPS_WINDOW = 2.0
+PLACEHOLDER_TEXT = "Reconnecting camera..."
+
+
+def placeholder_frame(width, height, text=PLACEHOLDER_TEXT):
+    """Dark BGR frame with ``text`` centred, shown while a camera is down."""
+    frame = np.full((height, width, 3), 32, dtype=np.uint8)
+    scale = max(0.5, width / 960)
+    thickness = max(1, int(scale * 2))
+    (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    origin = ((width - text_w) // 2, (height + text_h) // 2)
+    cv2.putText(frame, text, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (200, 200, 200), thickness, cv2.LINE_AA)
+    return frame
+
+
 class VideoStreamTrack(MediaStreamTrack):
     kind = "video"
+    capture_factory = None
     
-    def __init__(self, device_id=None):
+    def __init__(self, device_id=None, profile='high'):
         super().__init__()
         self.device_id = device_id
-        self.cap = None
+        self.profile = profile
+        self.reader = None
+        self._last_seq = 0
         self._running = True
         self._frame_rate = 30
         self._width = 1920  # Full HD
         self._height = 1080
-        self._timestamp = 0
+        self._timestamp = -1
+        self._clock = None
+        self._placeholder = None
         self._time_base = fractions.Fraction(1, 90000)
+        self.pipeline = EnhancementPipeline(name=device_id)
+        # Metric children resolved once so recv only does adds and bisects
+        labels = (device_id, profile)
+        self._frames = TRACK_FRAMES.labels(*labels)
+        self._dropped = TRACK_DROPPED.labels(*labels)
+        self._reconnects = TRACK_RECONNECTS.labels(*labels)
+        self._stalled = TRACK_STALLED.labels(*labels)
+        self._fps = CAPTURE_FPS.labels(*labels)
+        self._stage = {
+            stage: FRAME_STAGE.labels(*labels, stage)
+            for stage in ('read', 'wait', 'enhance', 'convert')
+        }
+        self._fps_start = None
+        self._fps_seq = 0
         logging.info(f"Initializing HD VideoStreamTrack for device {device_id}")
 
-    async def connect_to_camera(self):
+    async def connect_to_camera(self, device=None):
         try:
-            from .models import Device
-            device = await Device.get_device(self.device_id)
+            if device is None:
+                device = await Device.get_device(self.device_id)
             if not device:
                 raise ValueError(f"No device found with id {self.device_id}")
 
-            rtsp_url = device.get('rtsp_url')
-            logging.info(f"Connecting to camera at: {rtsp_url}")
-
-            # Configure OpenCV with optimal settings
-            self.cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
-            
-            # Set camera properties with double values
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 2.0)
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, float(self._width))
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, float(self._height))
-            self.cap.set(cv2.CAP_PROP_FPS, float(self._frame_rate))
-            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0.0)  # Fixed: Use 0.0 instead of False
-            
-            # Configure H264 codec
-            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'H264'))
-
-            if not self.cap.isOpened():
-                raise RuntimeError(f"Could not open RTSP stream")
-
-            # Test frame reading
-            ret, frame = self.cap.read()
-            if not ret or frame is None:
-                raise RuntimeError("Could not read frame from camera")
+            rtsp_url = Device.stream_url(device, self.profile)
+            logging.info(f"Connecting to camera at: {rtsp_url} ({self.profile})")
+
+            settings = device.get('settings') or {}
+            enhancement = dict(settings.get('enhancement') or {})
+            if self.profile != 'high':
+                # Substreams are picked to save bandwidth, never upsample them
+                enhancement['resize'] = dict(enhancement.get('resize') or {}, enabled=False)
+            self.pipeline = EnhancementPipeline(enhancement, name=self.device_id)
+            self._width, self._height = self.pipeline.size
+
+            if self.reader:
+                self.reader.stop()
+
+            # Capture is opened and read in a dedicated thread, never on the event loop
+            self.reader = FrameReader(
+                rtsp_url,
+                name=self.device_id,
+                api_preference=cv2.CAP_FFMPEG,
+                properties={
+                    cv2.CAP_PROP_BUFFERSIZE: 2.0,
+                    cv2.CAP_PROP_FRAME_WIDTH: float(self._width),
+                    cv2.CAP_PROP_FRAME_HEIGHT: float(self._height),
+                    cv2.CAP_PROP_FPS: float(self._frame_rate),
+                    cv2.CAP_PROP_CONVERT_RGB: 0.0,
+                    cv2.CAP_PROP_FOURCC: cv2.VideoWriter_fourcc(*'H264')
+                },
+                read_latency=self._stage['read'],
+                capture_factory=self.capture_factory
+            )
+            await self.reader.start()
+            self._last_seq = 0
 
             logging.info(f"Successfully connected to camera {self.device_id}")
-            logging.debug(f"Frame shape: {frame.shape}")
             return True
 
         except Exception as e:
             logging.error(f"Error connecting to camera: {str(e)}")
-            if self.cap:
-                self.cap.release()
+            if self.reader:
+                self.reader.stop()
             raise
 
     async def recv(self):
@@ -76,48 +136,158 @@ class VideoStreamTrack(MediaStreamTrack):
             raise MediaStreamError("Track ended")
 
         try:
-            if not self.cap or not self.cap.isOpened():
+            if not self.reader or not self.reader.alive:
+                if self.reader:
+                    self._reconnects.inc()
                 await self.connect_to_camera()
 
-            ret, frame = self.cap.read()
-            if not ret:
-                raise RuntimeError("Could not read frame")
+            # Only waits for the reader thread; a camera that goes quiet is
+            # reconnected by the reader's supervisor while this track stalls
+            start = time.perf_counter()
+            last_seq = self._last_seq
+            try:
+                self._last_seq, frame = await self.reader.read(last_seq, Config.CAMERA_STALL_TIMEOUT)
+            except FrameTimeout:
+                video_frame = await asyncio.get_running_loop().run_in_executor(
+                    None, self._render_stalled
+                )
+                self._stalled.inc()
+                return self._stamp(video_frame)
 
-            # Enhance image quality
-            frame = cv2.resize(frame, (self._width, self._height), 
-                             interpolation=cv2.INTER_LANCZOS4)
+            now = time.perf_counter()
+            self._stage['wait'].observe(now - start)
+            if last_seq and self._last_seq - last_seq > 1:
+                self._dropped.inc(self._last_seq - last_seq - 1)
+            self._update_fps(now)
 
-            # Improve sharpness
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            frame = cv2.filter2D(frame, -1, kernel)
+            # Enhancement and ndarray -> VideoFrame copy run off the event loop
+            video_frame = await asyncio.get_running_loop().run_in_executor(
+                None, self._render, frame
+            )
+            self._frames.inc()
 
-            # Adjust contrast and brightness
-            frame = cv2.convertScaleAbs(frame, alpha=1.1, beta=5)
+            return self._stamp(video_frame)
 
-            # Convert BGR to RGB with high quality
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        except MediaStreamError:
+            raise
+        except Exception as e:
+            logging.error(f"Error in recv: {str(e)}")
+            if self.reader:
+                self.reader.stop()
+            # End the track cleanly so a shared relay notifies every viewer
+            self.stop()
+            raise MediaStreamError(str(e))
 
-            # Create VideoFrame with optimal settings
-            video_frame = VideoFrame.from_ndarray(frame, format="rgb24")
-            pts = self._timestamp
-            self._timestamp += int(90000 / self._frame_rate)
-            video_frame.pts = pts
-            video_frame.time_base = self._time_base
+    def _update_fps(self, now):
+        # Reader sequence numbers count every captured frame, delivered or not
+        if self._fps_start is None or self._last_seq < self._fps_seq:
+            self._fps_start, self._fps_seq = now, self._last_seq
+        elif now - self._fps_start >= FPS_WINDOW:
+            self._fps.set(round((self._last_seq - self._fps_seq) / (now - self._fps_start), 2))
+            self._fps_start, self._fps_seq = now, self._last_seq
 
-            return video_frame
+    def _stamp(self, video_frame):
+        # Wall-clock pts keep timing right across stalls and variable camera rates
+        now = time.perf_counter()
+        if self._clock is None:
+            self._clock = now
+        self._timestamp = max(int((now - self._clock) * 90000), self._timestamp + 1)
+        video_frame.pts = self._timestamp
+        video_frame.time_base = self._time_base
+        return video_frame
 
-        except Exception as e:
-            logging.error(f"Error in recv: {str(e)}")
-            if self.cap and self.cap.isOpened():
-                self.cap.release()
-            raise
+    def _render_stalled(self):
+        # Last good picture while degraded, a placeholder once the camera is down
+        _, frame = self.reader.latest()
+        if frame is not None and self.reader.state != DOWN:
+            return self._render(frame)
+        if self._placeholder is None or self._placeholder.shape[:2] != (self._height, self._width):
+            self._placeholder = placeholder_frame(self._width, self._height)
+        return VideoFrame.from_ndarray(self._placeholder, format="bgr24")
+
+    def _render(self, frame):
+        start = time.perf_counter()
+        frame = self.pipeline.process(frame)
+        converting = time.perf_counter()
+        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
+        self.pipeline.record('convert', converting)
+        self._stage['enhance'].observe(converting - start)
+        self._stage['convert'].observe(time.perf_counter() - converting)
+        return video_frame
 
     def stop(self):
         self._running = False
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
+        if self.reader:
+            self.reader.stop()
         super().stop()
         
     def __del__(self):
-        if hasattr(self, 'cap'):
-            self.cap.release()
\ No newline at end of file
+        if getattr(self, 'reader', None) is not None:
+            self.reader.stop()
+
+
+class PassthroughTrack(MediaStreamTrack):
+    """Forwards the camera's H.264 packets to aiortc without decoding them."""
+    kind = "video"
+
+    def __init__(self, device_id=None, profile='high'):
+        super().__init__()
+        self.device_id = device_id
+        self.profile = profile
+        self.reader = None
+        self._running = True
+        logging.info(f"Initializing passthrough VideoStreamTrack for device {device_id}")
+
+    async def connect_to_camera(self, device=None):
+        try:
+            if device is None:
+                device = await Device.get_device(self.device_id)
+            if not device:
+                raise ValueError(f"No device found with id {self.device_id}")
+
+            rtsp_url = Device.stream_url(device, self.profile)
+            logging.info(f"Connecting to camera at: {rtsp_url} ({self.profile}, passthrough)")
+
+            if self.reader:
+                self.reader.stop()
+
+            self.reader = PacketReader(rtsp_url, name=self.device_id)
+            await self.reader.start()
+            # Browsers only get H.264 without decoding; recorders take any codec from the reader
+            if self.reader.codec != 'h264':
+                raise RuntimeError(f"Stream for {self.device_id} is {self.reader.codec}, not h264")
+
+            logging.info(f"Successfully connected to camera {self.device_id}")
+            return True
+
+        except Exception as e:
+            logging.error(f"Error connecting to camera: {str(e)}")
+            if self.reader:
+                self.reader.stop()
+            raise
+
+    async def recv(self):
+        if not self._running:
+            raise MediaStreamError("Track ended")
+
+        try:
+            if not self.reader:
+                await self.connect_to_camera()
+            while True:
+                try:
+                    return await self.reader.read()
+                except FrameTimeout:
+                    # Camera reconnecting: the viewer sees a stall, the peer connection stays
+                    if not self._running:
+                        raise MediaStreamError("Track ended")
+
+        except Exception as e:
+            logging.error(f"Error in passthrough recv: {str(e)}")
+            self.stop()
+            raise MediaStreamError(str(e))
+
+    def stop(self):
+        self._running = False
+        if self.reader:
+            self.reader.stop()
+        super().stop()
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from .config import Config
+from .db import Database
+from .metrics import Metric, registry
+
+
+class WriteBehindQueue:
+    """Buffers fire-and-forget rows and writes them in batched transactions.
+
+    ``enqueue`` never touches the database: rows are grouped by statement and
+    flushed together, in one transaction, once ``batch_size`` rows are waiting
+    or every ``interval`` seconds. At most ``max_rows`` rows are held; beyond
+    that new rows are dropped and counted, so a database outage cannot grow
+    memory without bound.
+    """
+
+    def __init__(self, max_rows=Config.WRITE_BEHIND_MAX_ROWS,
+                 batch_size=Config.WRITE_BEHIND_BATCH,
+                 interval=Config.WRITE_BEHIND_INTERVAL):
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.interval = interval
+        self.stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+        self._pending = {}
+        self._size = 0
+        self._task = None
+        self._flush_lock = None
+        self._wakeup = None
+        self._stopping = False
+
+    @property
+    def size(self):
+        return self._size
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._flush_lock = self._flush_lock or asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, query, params):
+        """Queue one row for ``query``; returns False if it had to be dropped."""
+        if self._size >= self.max_rows:
+            self.stats['dropped'] += 1
+            if self.stats['dropped'] % 1000 == 1:
+                logging.warning(f"Write-behind queue full, dropped {self.stats['dropped']} row(s)")
+            return False
+
+        self._pending.setdefault(query, []).append(params)
+        self._size += 1
+        self.stats['enqueued'] += 1
+        try:
+            self.start()
+        except RuntimeError:
+            # No running loop (e.g. a script); rows are written on the next flush
+            pass
+        if self._size >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """Write every queued row now, in one transaction."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            count, self._size = self._size, 0
+            try:
+                async with Database.transaction() as cur:
+                    for query, rows in pending.items():
+                        await cur.executemany(query, rows)
+                self.stats['written'] += count
+            except Exception as e:
+                self.stats['failed'] += count
+                logging.error(f"Write-behind flush of {count} row(s) failed: {str(e)}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def metrics(self):
+        queued = Metric('gauge', 'vrae_write_behind_queued_rows', 'Rows waiting to be written')
+        queued.set(self._size)
+        rows = Metric('counter', 'vrae_write_behind_rows_total', 'Write-behind rows by outcome', ('outcome',))
+        for outcome, count in self.stats.items():
+            rows.labels(outcome).value = count
+        return [queued, rows]
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still queued."""
+        if self._task is not None:
+            # Let an in-flight flush finish rather than cancelling its transaction
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+
+
+write_queue = WriteBehindQueue()
+registry.collector(write_queue.metrics)